@@ -5,20 +5,21 @@ import os
 import time
 
 import Common
+import IncludeCache
 import Mif
 import Parser
+import Profile
 
 """
 Title: Assembler for RISC_721
 Author: Connor Goldberg
 """
 
-def main(args):
-
-	start = time.clock()
-
-	assemblyFile = args["assembly-file"]
-	output = args["output"]
+def GetOutputPaths(assemblyFile, output):
+	"""
+	Returns the paths of the program and data memory files for the assembly file
+	output - the path given for the program memory file, or None to put it next to the assembly file
+	"""
 	if output == None:
 		programOutput = os.path.join(os.path.split(os.path.abspath(assemblyFile))[0],os.path.splitext(os.path.basename(assemblyFile))[0]+".mif")
 		dataOutput = os.path.join(os.path.split(os.path.abspath(assemblyFile))[0],os.path.splitext(os.path.basename(assemblyFile))[0]+"_dm.mif")
@@ -33,8 +34,53 @@ def main(args):
 			dataOutput = dataOutput + split[1]
 		else:
 			dataOutput = dataOutput + ".mif"
+	return programOutput, dataOutput
+
+def GetFormatPath(outputPath, format_):
+	"""
+	Returns the path of a memory file in a format, the path with the extension of the format
+	"""
+	return os.path.splitext(outputPath)[0] + Mif.Extensions[format_]
+
+def ParseFormats(formats):
+	"""
+	Returns the list of formats in a comma separated string of formats, for the format option
+	"""
+	formats = [format_.strip() for format_ in formats.split(",") if format_.strip()]
+	for format_ in formats:
+		if format_ not in Mif.Formats:
+			raise argparse.ArgumentTypeError("invalid format: {} (choose from {})".format(format_, ", ".join(Mif.Formats)))
+	extensions = [Mif.Extensions[format_] for format_ in formats]
+	if not formats or len(set(extensions)) != len(extensions):
+		raise argparse.ArgumentTypeError("each format must write a different kind of file: {}".format(", ".join(formats)))
+	return formats
+
+def Assemble(assemblyFile, programOutput, dataOutput, args):
+	"""
+	Assemble a file and write its memory files
+	args - the command line options of the assembler
+	Returns a tuple of the parser, the include cache (or None) and the data memory Mif
+	"""
+	myParser = CreateParser(assemblyFile, args)
+	myParser.Parse()
+	return myParser, myParser.Cache, WriteMemoryFiles(myParser, assemblyFile, programOutput, dataOutput, args)
+
+def CreateParser(assemblyFile, args):
+	cache = None
+	if args["cache"] is not None:
+		cacheDir = args["cache"]
+		if not cacheDir:
+			cacheDir = os.path.join(os.path.split(os.path.abspath(assemblyFile))[0], ".asmcache")
+		cache = IncludeCache.IncludeCache(cacheDir)
 
-	stuffMem = 0
+	return Parser.Parser(assemblyFile, width=args["width"], addressWidth=args["address_width"], memoryWidth=args["memory_width"], canInclude=True, cache=cache, jobs=args["jobs"], optimize=args["optimize"], eliminate=args["eliminate"])
+
+def WriteMemoryFiles(myParser, assemblyFile, programOutput, dataOutput, args):
+	"""
+	Write the program and data memory files of a parsed file, and its symbol map if asked for
+	Returns the data memory Mif of the first format
+	"""
+	stuffMem = None
 	if args["stuff"] is not None:
 		try:
 			if args["stuff"].upper().startswith("0X"):
@@ -44,31 +90,140 @@ def main(args):
 		except Exception as e:
 			Common.Error("Cannot stuff with: {}".format(args["stuff"]))
 
-	programMif = Mif.Mif(format_=args["format"], output=programOutput, width=args["width"], addressWidth=args["address_width"], memoryWidth=args["memory_width"], headers=["Program memory for: %s" % assemblyFile], stuffWith=stuffMem)
-	dataMif = Mif.Mif(format_=args["format"], output=dataOutput, width=args["width"], addressWidth=args["address_width"], memoryWidth=args["memory_width"], headers=["Data memory for: %s" % assemblyFile], stuffWith=stuffMem)
+	# Every format is written from the same parse
+	programData = myParser.GetAssemblyData()
+	dataData = Parser.Parser.GetInterruptVectorTable() + myParser.GetConstantsData()
+	dataMifs = []
+	for format_ in args["format"]:
+		programMif = Mif.Mif(format_=format_, output=GetFormatPath(programOutput, format_), width=args["width"], addressWidth=args["address_width"], memoryWidth=args["memory_width"], headers=["Program memory for: %s" % assemblyFile], stuffWith=stuffMem)
+		dataMif = Mif.Mif(format_=format_, output=GetFormatPath(dataOutput, format_), width=args["width"], addressWidth=args["address_width"], memoryWidth=args["memory_width"], headers=["Data memory for: %s" % assemblyFile], stuffWith=stuffMem)
 
-	myParser = Parser.Parser(assemblyFile, width=args["width"], addressWidth=args["address_width"], memoryWidth=args["memory_width"], canInclude=True)	
-	myParser.Parse()
+		programMif.AddData(programData).Write()
+		dataMif.AddData(dataData).Write()
+		dataMifs.append(dataMif)
+	if args["symbols"]:
+		myParser.WriteSymbols(os.path.splitext(programOutput)[0] + ".sym")
+	return dataMifs[0]
+
+def GetModifiedTimes(paths):
+	times = {}
+	for path in paths:
+		try:
+			times[path] = os.stat(path).st_mtime
+		except OSError:
+			times[path] = None
+	return times
+
+def Watch(myParser, failed, assemblyFile, programOutput, dataOutput, args):
+	"""
+	Poll the assembly file and every file it includes, when any of them change only those files are parsed again
+	before the memory files are written. This runs until it is interrupted.
+	myParser - the parser of the last run
+	failed - if the last run failed, then every file is parsed again on the next change
+	"""
+	print "Watching {} for changes, press Ctrl+C to stop".format(assemblyFile)
+	paths = myParser.GetSourcePaths()
+	times = GetModifiedTimes(paths)
+	while True:
+		time.sleep(args["interval"])
+		newTimes = GetModifiedTimes(paths)
+		changed = set(path for path in paths if newTimes[path] != times[path])
+		if not changed:
+			continue
+		times = newTimes
+
+		start = time.time()
+		try:
+			if failed:
+				myParser = CreateParser(assemblyFile, args)
+				myParser.Parse()
+			else:
+				myParser.Reparse(changed)
+			WriteMemoryFiles(myParser, assemblyFile, programOutput, dataOutput, args)
+		except Common.AssemblyError:
+			# The error is already printed, the state may be half updated so the next change parses everything again
+			failed = True
+			# Keep watching the files found before the error, the mistake may be in an included file
+			paths = paths + [path for path in myParser.GetSourcePaths() if path not in paths]
+			times = GetModifiedTimes(paths)
+			print "Waiting for changes to {}".format(", ".join(os.path.basename(path) for path in sorted(changed)))
+			continue
 
-	programMif.AddData(myParser.GetAssemblyData()).Write()
-	dataMif.AddData(Parser.Parser.GetInterruptVectorTable()).AddData(myParser.GetConstantsData()).Write()
+		failed = False
+		paths = myParser.GetSourcePaths()
+		times = GetModifiedTimes(paths)
+		print "[{}] Re-assembled {} in {} ms".format(time.strftime("%I:%M:%S"), ", ".join(os.path.basename(path) for path in sorted(changed)), round((time.time()-start)*1000, 3))
+
+def AddOptions(parser):
+	"""
+	Add the options shared by the assembler and the batch assembler to an ArgumentParser
+	"""
+	parser.add_argument("-a", "--address_width", metavar="address-width", type=int, help="The width of the address bus", default=16)
+	parser.add_argument("-m", "--memory_width", metavar="memory-width", type=int, help="The width of a word in memory in bits (default = 8)", default=8)
+	parser.add_argument("-w", "--width", metavar="width", type=int, help="The width of instruction words in bits (default = 32)", default=32)
+	parser.add_argument("-f", "--format", metavar="format", type=ParseFormats, help="The output formats of the memory files separated by commas: altera, cadence, bin, ihex or readmemh (default = cadence)", default=["cadence"])
+	parser.add_argument("-c", "--cache", metavar="cache-dir", type=str, nargs="?", const="", help="Cache the decoded include files in a directory (default = .asmcache next to the assembly file)")
+	parser.add_argument("-y", "--symbols", action="store_true", help="Also write a symbol map of every label next to the program memory file (.sym)")
+	parser.add_argument("-O", "--optimize", action="store_true", help="Remove redundant instructions with the peephole pass")
+	parser.add_argument("-e", "--eliminate", action="store_true", help="Remove the instructions that cannot be reached from the first instruction or an ISR")
+	parser.add_argument("-s", "--stuff", metavar="stuff", type=str, help="Specify if uninitialized values should be exlicitly written")
+
+def main(args):
+
+	if args["profile"] is not None:
+		Profile.Start()
+	start = time.time()
+
+	assemblyFile = args["assembly-file"]
+	programOutput, dataOutput = GetOutputPaths(assemblyFile, args["output"])
+	# The parser is kept when it fails, so watch mode knows which files it had found
+	myParser = CreateParser(assemblyFile, args)
+	failed = False
+	try:
+		myParser.Parse()
+		dataMif = WriteMemoryFiles(myParser, assemblyFile, programOutput, dataOutput, args)
+	except Common.AssemblyError:
+		if not args["watch"]:
+			raise
+		failed = True # Watch for the fix
 	
-	end = time.clock()
+	end = time.time()
+	profile = Profile.Stop() if args["profile"] is not None else None
+	if profile is not None:
+		end -= profile.Overhead # the time spent counting objects is not part of the run
 	
-	print "Successfully assembled {} into {}{}".format(assemblyFile, programOutput, " and "+dataOutput if dataMif.Data else '')
-	print "Time elapsed: %s ms" % str(round(float(end-start)*1000,3))
-	print "Completed on %s at %s" % (time.strftime("%m/%d/%Y"), time.strftime("%I:%M:%S"))
+	if not failed:
+		outputs = [GetFormatPath(programOutput, format_) for format_ in args["format"]]
+		if dataMif.Data:
+			outputs += [GetFormatPath(dataOutput, format_) for format_ in args["format"]]
+		print "Successfully assembled {} into {}".format(assemblyFile, ", ".join(outputs))
+		if myParser.Cache and myParser.IncludeParsers:
+			print myParser.Cache
+		if args["optimize"]:
+			print myParser.GetPeephole()
+		if args["eliminate"]:
+			print myParser.Reachability
+		print "Time elapsed: %s ms" % str(round(float(end-start)*1000,3))
+		print "Completed on %s at %s" % (time.strftime("%m/%d/%Y"), time.strftime("%I:%M:%S"))
+		if profile is not None:
+			profile.Report(args["profile"])
+
+	if args["watch"]:
+		try:
+			Watch(myParser, failed, assemblyFile, programOutput, dataOutput, args)
+		except KeyboardInterrupt:
+			pass
 
 if __name__ == "__main__":
 	
 	parser = argparse.ArgumentParser(description="Assembler for RISC_721 by Connor Goldberg")
 	parser.add_argument("assembly-file", help="File to be assembled")
 	parser.add_argument("-o", "--output", metavar="out-file", type=str, help="The path of the MIF file")
-	parser.add_argument("-a", "--address_width", metavar="address-width", type=int, help="The width of the address bus", default=16)
-	parser.add_argument("-m", "--memory_width", metavar="memory-width", type=int, help="The width of a word in memory in bits (default = 8)", default=8)
-	parser.add_argument("-w", "--width", metavar="width", type=int, help="The width of instruction words in bits (default = 32)", default=32)
-	parser.add_argument("-f", "--format", metavar="format", type=str, help="The output format of the assembled mif file", choices=["altera","cadence"], default="cadence")
-	parser.add_argument("-s", "--stuff", metavar="stuff", type=str, help="Specify if uninitialized values should be exlicitly written")
+	parser.add_argument("-j", "--jobs", metavar="jobs", type=int, help="The number of processes to parse included files with (default = one for each cpu)")
+	parser.add_argument("--watch", action="store_true", help="Keep running and assemble again whenever the assembly file or a file it includes changes")
+	parser.add_argument("--profile", metavar="json-file", nargs="?", const="", help="Time each stage and print the times, or write them as JSON if a file is given")
+	parser.add_argument("--interval", metavar="interval", type=float, help="How often to check for changes in watch mode in seconds (default = 0.25)", default=0.25)
+	AddOptions(parser)
 
 	args = vars(parser.parse_args())
 	main(args)
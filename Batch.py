@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+
+import argparse
+import glob
+import multiprocessing
+import os
+import StringIO
+import sys
+import time
+import traceback
+
+import Assembler
+import Common
+import Mif
+
+"""
+Title: Batch assembler for RISC_721
+Author: Connor Goldberg
+"""
+
+Status = Common.Enum("Passed", "Assembled", "Mismatched", "Failed")
+StatusNames = ["PASS", "OK", "DIFF", "ERROR"]
+
+def FindPrograms(paths, goldenDir, extension=".mif"):
+	"""
+	Returns a list of (assembly file, golden program memory file or None) to assemble
+	paths - directories (searched for .asm files), glob patterns or manifests
+	A manifest lists one assembly file per line relative to the manifest, optionally followed by its golden file
+	extension - the extension of the golden files in the golden directory
+	"""
+	programs = []
+	for path in paths:
+		if os.path.isdir(path):
+			for root, dirs, files in os.walk(path):
+				dirs.sort() # Walk the directories in order
+				programs += [(os.path.join(root, name), None) for name in sorted(files) if name.endswith(".asm")]
+		elif os.path.isfile(path) and not path.endswith(".asm"):
+			directory = os.path.dirname(path)
+			for line in Common.FileToList(path):
+				split = line.split()
+				if not split or split[0].startswith('#') or split[0].startswith("//"):
+					continue
+				programs.append((os.path.join(directory, split[0]), os.path.join(directory, split[1]) if len(split) > 1 else None))
+		else:
+			matches = sorted(glob.glob(path))
+			if not matches:
+				Common.Error("No programs found for: {}".format(path))
+			programs += [(match, None) for match in matches]
+
+	if goldenDir is not None:
+		programs = [(program, golden or os.path.join(goldenDir, os.path.splitext(os.path.basename(program))[0]+extension)) for program, golden in programs]
+	return programs
+
+def ReadImage(filePath):
+	# Only the memory contents are compared, the headers and comment lines hold the paths of the files
+	return [line.rstrip() for line in Common.FileToList(filePath) if line and not any(line.startswith(comment) for comment in Mif.MifLine.Comment.values())]
+
+def CompareImages(outputPath, goldenPath):
+	"""
+	Returns None if the memory files match or a message describing the first difference
+	"""
+	if not outputPath.endswith(".mif"):
+		# The compact formats have nothing but the memory contents, so they have to match exactly
+		with open(outputPath, "rb") as output, open(goldenPath, "rb") as golden:
+			return None if output.read() == golden.read() else "{} differs from {}".format(outputPath, goldenPath)
+	output = ReadImage(outputPath)
+	golden = ReadImage(goldenPath)
+	for i, (outputLine, goldenLine) in enumerate(zip(output, golden)):
+		if outputLine != goldenLine:
+			return "{} differs from {} at line {} of the contents:\n\texpected: {}\n\tgot:      {}".format(outputPath, goldenPath, i+1, goldenLine, outputLine)
+	if len(output) != len(golden):
+		return "{} has {} lines of contents but {} has {}".format(outputPath, len(output), goldenPath, len(golden))
+	return None
+
+def AssembleProgram(task):
+	"""
+	Assemble a single program, this is run by the worker processes
+	task - a tuple of (assembly file, golden file or None, command line options)
+	Returns a tuple of (assembly file, status, seconds elapsed, message)
+	"""
+	assemblyFile, golden, args = task
+	if args["output_dir"] is not None:
+		programOutput, dataOutput = Assembler.GetOutputPaths(assemblyFile, os.path.join(args["output_dir"], os.path.splitext(os.path.basename(assemblyFile))[0]+".mif"))
+	else:
+		programOutput, dataOutput = Assembler.GetOutputPaths(assemblyFile, None)
+
+	# Anything printed while assembling belongs in the report, not in the middle of another file's results
+	stdout = sys.stdout
+	sys.stdout = StringIO.StringIO()
+	start = time.time()
+	try:
+		myParser, cache, dataMif = Assembler.Assemble(assemblyFile, programOutput, dataOutput, args)
+	except Common.AssemblyError as e:
+		return (assemblyFile, Status.Failed, time.time()-start, e.Message)
+	except Exception as e:
+		return (assemblyFile, Status.Failed, time.time()-start, traceback.format_exc())
+	finally:
+		sys.stdout = stdout
+	elapsed = time.time()-start
+
+	if golden is None:
+		return (assemblyFile, Status.Assembled, elapsed, None)
+	if not os.path.isfile(golden):
+		return (assemblyFile, Status.Mismatched, elapsed, "Cannot find golden file: {}".format(golden))
+	# The golden files are in the first format
+	message = CompareImages(Assembler.GetFormatPath(programOutput, args["format"][0]), golden)
+
+	goldenData = "{}_dm{}".format(*os.path.splitext(golden))
+	if message is None and os.path.isfile(goldenData) != bool(dataMif.Data):
+		message = "Expected {}data memory file".format("a " if os.path.isfile(goldenData) else "no ")
+	elif message is None and dataMif.Data:
+		message = CompareImages(Assembler.GetFormatPath(dataOutput, args["format"][0]), goldenData)
+	return (assemblyFile, Status.Passed if message is None else Status.Mismatched, elapsed, message)
+
+def main(args):
+
+	start = time.time()
+
+	programs = FindPrograms(args["programs"], args["golden_dir"], Mif.Extensions[args["format"][0]])
+	if args["output_dir"] is not None and not os.path.isdir(args["output_dir"]):
+		os.makedirs(args["output_dir"])
+
+	# Each worker handles one program at a time, so the include files are parsed in the worker itself
+	args["jobs"] = 1
+	tasks = [(program, golden, args) for program, golden in programs]
+
+	jobs = args["batch_jobs"] if args["batch_jobs"] is not None else multiprocessing.cpu_count()
+	pool = None
+	if jobs > 1 and len(tasks) > 1:
+		# The workers are forked after the instruction tables are built, so every program uses warm tables
+		pool = multiprocessing.Pool(min(jobs, len(tasks)))
+		results = pool.imap(AssembleProgram, tasks)
+	else:
+		results = (AssembleProgram(task) for task in tasks)
+
+	counts = [0] * len(StatusNames)
+	totalElapsed = 0
+	for assemblyFile, status, elapsed, message in results:
+		counts[status] += 1
+		totalElapsed += elapsed
+		print "{:5} {:>10} ms  {}".format(StatusNames[status], round(elapsed*1000, 1), assemblyFile)
+		if message:
+			print "\t" + message.strip().replace("\n", "\n\t")
+	if pool is not None:
+		pool.close()
+		pool.join()
+
+	print "{} programs: {} passed, {} assembled, {} did not match, {} failed".format(len(tasks), *counts)
+	print "Time elapsed: {} ms ({} ms assembling)".format(round((time.time()-start)*1000, 3), round(totalElapsed*1000, 3))
+	return 1 if counts[Status.Mismatched] or counts[Status.Failed] else 0
+
+if __name__ == "__main__":
+
+	parser = argparse.ArgumentParser(description="Batch assembler for RISC_721 by Connor Goldberg")
+	parser.add_argument("programs", nargs='+', help="Directories, glob patterns or manifests of the files to be assembled")
+	parser.add_argument("-o", "--output_dir", metavar="out-dir", type=str, help="The directory to write the MIF files to (default = next to each assembly file)")
+	parser.add_argument("-g", "--golden_dir", metavar="golden-dir", type=str, help="A directory of golden memory files in the first format, named after each assembly file, to compare the output with")
+	parser.add_argument("-j", "--jobs", dest="batch_jobs", metavar="jobs", type=int, help="The number of processes to assemble with (default = one for each cpu)")
+	Assembler.AddOptions(parser)
+
+	args = vars(parser.parse_args())
+	sys.exit(main(args))
@@ -0,0 +1,451 @@
+#!/usr/bin/env python
+
+import argparse
+from array import array
+from collections import OrderedDict
+import json
+import multiprocessing
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+import Assembler
+import Common
+import ControlFlow
+import Expression
+import Instructions
+import InstructionTable
+import Mif
+import Parser
+import Profile
+import Simulator
+
+"""
+Title: Benchmarks for the RISC_721 assembler
+Author: Connor Goldberg
+"""
+
+# Every template is a valid line of code once its fields are filled in, and every mnemonic is covered
+CodeTemplates = [	"LD R{r}, M[R{r} + 0x{c:X}]",
+					"LD R{r}, M[0x{c:X}]",
+					"LD R{r}, M[PC + 0x{c:X}]",
+					"ST M[R{r}], R{r}",
+					"ST M[R{r} + 0x{c:X}], R{r}",
+					"CPY R{r}, R{r}",
+					"CPYC R{r}, 0x{c:X}",
+					"PUSH R{r}",
+					"PUSHC 0x{c:X}",
+					"POP R{r}",
+					"CALL {label}",
+					"RET",
+					"RETI",
+					"CMP R{r}, R{r}",
+					"CMPC R{r}, 0x{c:X}",
+					"NOT R{r}, R{r}",
+					"NOTC R{r}, 0x{c:X}",
+					"FTI R{r}, R{r}",
+					"ITF R{r}, R{r}",
+					"INC R{r}",
+					"DEC R{r}",
+					"CLR R{r}",
+					"CLRC",
+					"SETC",
+					"NOP" ] + \
+				[ "%s {label}" % jump for jump in ["JU", "JMP", "JC", "JNC", "JN", "JNN", "JV", "JNV", "JZ", "JEQ", "JNZ", "JNE", "JGE", "JL"] ] + \
+				[ "%s R{r}, R{r}, R{r}" % alu for alu in ["ADD", "SUB", "AND", "BIC", "OR", "BIS", "XOR", "FA", "FS", "FM", "FD", "MUL", "DIV"] ] + \
+				[ "%s R{r}, R{r}, 0x{c:X}" % alu for alu in ["ADDC", "SUBC", "ANDC", "BICC", "ORC", "BISC", "XORC"] ] + \
+				[ "%s R{r}, R{r}, R{r}" % shift for shift in ["SRL", "SLL", "SRA", "RTR", "RTL", "RRC", "RLC"] ] + \
+				[ "%s R{r}, R{r}, {s}" % shift for shift in ["SRLC", "SLLC", "SRAC", "RTRC", "RTLC", "RRCC", "RLCC"] ]
+
+def GenerateCodeLines(count, seed=0, templates=CodeTemplates, names={}):
+	"""
+	templates - the templates to pick each line from, a template can be in the list more than once to pick it more often
+	names - the names to pick from for each other field of the templates, such as the directives of a file
+	"""
+	rand = random.Random(seed)
+	labelCount = max(count / 8, 1)
+	lines = []
+	for i in range(0, count):
+		template = templates[rand.randint(0, len(templates)-1)]
+		string = re.sub(r"\{r\}", lambda match: str(rand.randint(1, 31)), template)
+		fields = dict((field, rand.choice(choices)) for field, choices in names.iteritems())
+		string = string.format(c=rand.randint(0, 0xFFFF), s=rand.randint(0, 31), label="label_%i" % rand.randint(0, labelCount-1), **fields)
+		if i % 8 == 0:
+			string = "label_%i: %s" % (i / 8, string)
+		lines.append(string)
+	return lines
+
+# Every template is a valid constant once its fields are filled in
+ConstantTemplates = [	"0x{a:X} = 0x{v:X}",
+						"{a} = {v}",
+						"0x{a:X} = 0x{v:X} + {s}*4",
+						"0x{a:X} = (0x{v:X} << 2) | 1",
+						"0x100 + {a} - 0x100 = ({v} & 0xFF00) >> 8",
+						"0x{a:X} = .float({v}/8.0)",
+						"0x{a:X} = .float(-{s}.5)",
+						"0x{a:X} = 0x10 * 0x10 + 1",
+						"{a} = 2**{s} - 1" ]
+
+def GenerateConstantLines(count, seed=0, start=0, step=1):
+	"""
+	start - the address of the first constant
+	step - the number of addresses each constant takes, the constants are in consecutive cells
+	"""
+	rand = random.Random(seed)
+	lines = []
+	for i in range(0, count):
+		template = ConstantTemplates[rand.randint(0, len(ConstantTemplates)-1)]
+		lines.append(template.format(a=start+i*step, v=rand.randint(0, 0xFFFF), s=rand.randint(0, 31)))
+	return lines
+
+# How much more often than the others each mnemonic is picked in a generated program, loosely the mix a compiler
+# emits: mostly moves, loads, stores, integer arithmetic and branches, with little floating point, multiply or divide
+MnemonicWeights = {	"LD" : 8, "ST" : 6, "CPY" : 6, "CPYC" : 6, "ADD" : 4, "ADDC" : 4, "SUB" : 3, "SUBC" : 3, "CMP" : 3, "CMPC" : 3,
+					"AND" : 2, "ANDC" : 2, "OR" : 2, "ORC" : 2, "INC" : 3, "DEC" : 3, "PUSH" : 2, "POP" : 2, "CALL" : 3, "RET" : 2,
+					"JMP" : 3, "JEQ" : 3, "JNE" : 3, "JZ" : 2, "JNZ" : 2, "JL" : 2, "JGE" : 2 }
+
+# The addresses a constant takes in a generated program, which is assembled with 32 bit words in 8 bit memory
+ProgramStep = 32 / 8
+
+# The templates that use the directives and the named constants of the file they are in
+ProgramTemplates = [	"CPYC R{r}, {number}",
+						"ADDC R{r}, {register}, {number}",
+						"CPY {register}, R{r}",
+						"CMPC {register}, {number}",
+						"LD R{r}, M[{constant}]",
+						"ST M[{constant}], {register}" ]
+
+def GetProgramTemplates():
+	"""
+	Returns the templates of a generated program, each one as many times as the weight of its mnemonic
+	"""
+	templates = []
+	for template in CodeTemplates + ProgramTemplates:
+		templates += [template] * MnemonicWeights.get(template.split()[0], 1)
+	return templates
+
+def GenerateFile(filePath, count, seed, start, includes=[]):
+	"""
+	Write a file of a generated program with its own directives and constants
+	count - the number of lines of code
+	start - the address of the first constant with an address
+	includes - (label, file name) of each file it includes, the first lines of code call each of them
+	Returns the number of lines written
+	"""
+	rand = random.Random(seed)
+	directiveCount = max(count / 16, 1)
+	numbers = ["k_%i" % i for i in range(0, directiveCount)]
+	registers = ["r_%i" % i for i in range(0, directiveCount)]
+	constants = ["c_%i" % i for i in range(0, max(count / 16, 1))]
+	lines = []
+	if includes:
+		lines += [".includes"] + ["\t%s = %s" % include for include in includes] + [".endincludes"]
+	lines += [".directives"]
+	lines += ["\t%s = 0x%X + %i" % (number, rand.randint(0, 0x7FFF), i) for i, number in enumerate(numbers)]
+	lines += ["\t%s = R%i" % (register, rand.randint(1, 31)) for register in registers]
+	lines += [".enddirectives", ".constants"]
+	lines += ["\t" + line for line in GenerateConstantLines(max(count / 8, 1), seed, start, ProgramStep)]
+	# Some of the named constants have the same value, so they share a cell
+	lines += ["\t%s = %i" % (constant, rand.randint(0, len(constants))) for constant in constants]
+	lines += [".endconstants", ".code"]
+	code = GenerateCodeLines(count - len(includes), seed, GetProgramTemplates(), {"number" : numbers, "register" : registers, "constant" : constants})
+	lines += ["\tCALL %s" % label for label, fileName in includes] + code
+	lines += [".endcode"]
+	with open(filePath, "w") as _file:
+		_file.write("\n".join(lines) + "\n")
+	return len(lines)
+
+def GenerateProgram(directory, count, includeCount=4, seed=0):
+	"""
+	Write a generated program of a top level file that includes other files, each with an equal share of the lines of code
+	Returns the path of the top level file and the number of lines written
+	"""
+	share = count / (includeCount + 1)
+	includes = [("lib_%i" % i, "lib_%i.asm" % i) for i in range(0, includeCount)]
+	filePath = os.path.join(directory, "program.asm")
+	total = GenerateFile(filePath, count - share*includeCount, seed, 0, includes)
+	# The constants with an address of each file come after those of the file before it
+	start = max((count - share*includeCount) / 8, 1) * ProgramStep
+	for i, (label, fileName) in enumerate(includes):
+		total += GenerateFile(os.path.join(directory, fileName), share, seed+i+1, start)
+		start += max(share / 8, 1) * ProgramStep
+	return filePath, total
+
+def GenerateLines(count):
+	return [Parser.Line("benchmark.asm", number+1, string) for number, string in enumerate(GenerateCodeLines(count))]
+
+def TimeBest(function, repeat):
+	best = None
+	for i in range(0, repeat):
+		start = time.time()
+		function()
+		elapsed = time.time() - start
+		best = elapsed if best is None else min(best, elapsed)
+	return best
+
+def BenchmarkDecode(count, repeat):
+	lines = GenerateLines(count)
+	return TimeBest(lambda: [Instructions.DecodeLine(line) for line in lines], repeat)
+
+def BenchmarkAssemble(count, repeat):
+	instructions = [Instructions.DecodeLine(line) for line in GenerateLines(count)]
+	for instruction in instructions:
+		if instruction.NeedsLabelAddress:
+			instruction.Address = 0 # Labels are not resolved here
+	return TimeBest(lambda: [instruction.Assemble() for instruction in instructions], repeat)
+
+def BenchmarkConstants(count, repeat):
+	lines = [Parser.Line("benchmark.asm", number+1, string) for number, string in enumerate(GenerateConstantLines(count))]
+	def DecodeConstants():
+		Expression.ExpressionCache.clear() # Each run starts without any cached expressions
+		assembly = Parser.Assembly(16)
+		assembly.ConstantsLines = lines
+		assembly.DecodeConstants()
+	return TimeBest(DecodeConstants, repeat)
+
+def GenerateWords(count, seed=0):
+	"""
+	Returns an array of random machine code words with a valid opcode, the flow control instructions jump to one of
+	the words when each word takes up one address
+	"""
+	rand = random.Random(seed)
+	opCodes = sorted(Instructions.OpCodeRegistry.keys())
+	conditions = sorted(Instructions.FlowControl.JumpConditionsMnemonic.keys())
+	words = array('I')
+	for i in range(0, count):
+		opCode = rand.choice(opCodes)
+		if Instructions.OpCodeRegistry[opCode].Class is Instructions.FlowControl:
+			words.append((opCode << 27) | (rand.choice(conditions) << 18) | (1 << 16) | rand.randint(0, min(count, 2**16)-1))
+		else:
+			words.append((opCode << 27) | rand.randint(0, 2**27-1))
+	return words
+
+def BenchmarkEncode(count, repeat):
+	words = GenerateWords(count)
+	addresses = array('l', xrange(0, count))
+	lines = [Parser.Line("benchmark.mif", number+1, "") for number in range(0, count)]
+	return TimeBest(lambda: InstructionTable.InstructionTable(lines=lines).AppendMachineCode(addresses, words), repeat)
+
+def BenchmarkControlFlow(count, repeat):
+	words = GenerateWords(count)
+	lines = [Parser.Line("benchmark.mif", number+1, "") for number in range(0, count)]
+	instructions = InstructionTable.InstructionTable(lines=lines).AppendMachineCode(array('l', xrange(0, count)), words)
+	return TimeBest(lambda: ControlFlow.ControlFlowGraph(instructions, step=1), repeat)
+
+def BenchmarkMif(format_, count, repeat):
+	rand = random.Random(0)
+	words = [(rand.randint(0, 2**32-1), rand.choice(["", "ld r1, m[r2 + 0x10]"])) for i in range(0, count)]
+	handle, filePath = tempfile.mkstemp(suffix=".mif")
+	os.close(handle)
+	def Write():
+		# The image is as deep as it needs to be to hold every word of 4 bytes
+		mif = Mif.Mif(format_=format_, output=filePath, width=32, addressWidth=max(count*4-1, 1).bit_length(), memoryWidth=8)
+		mif.AddData([Mif.MifLine(data=data, comment=comment) for data, comment in words]).Write()
+	try:
+		return TimeBest(Write, repeat)
+	finally:
+		os.remove(filePath)
+
+# A loop over the kinds of instruction the simulator runs, it never stops by itself
+SimulatorProgram = """
+.code
+init:	CPYC R1, 0
+	CPYC R9, 0x40
+	ITF R9, R9
+loop:	ADDC R1, R1, 1
+	ADD R2, R2, R1
+	XOR R3, R2, R1
+	SLLC R4, R3, 3
+	RRCC R5, R4, 7
+	PUSH R5
+	POP R6
+	ST M[R1 + 0x100], R6
+	LD R7, M[R1 + 0x100]
+	FM R10, R9, R9
+	CALL func
+	CMPC R1, 0xFFFF
+	JNE loop
+	JU init
+func:	SUBC R8, R7, 1
+	RET
+.endcode
+"""
+
+def BenchmarkSimulator(count, repeat):
+	handle, filePath = tempfile.mkstemp(suffix=".asm")
+	with os.fdopen(handle, "w") as _file:
+		_file.write(SimulatorProgram)
+	try:
+		instructions, data = Simulator.LoadAssembly(filePath, {"width" : 32, "address_width" : 16, "memory_width" : 8, "jobs" : 1, "optimize" : False})
+	finally:
+		os.remove(filePath)
+	return TimeBest(lambda: Simulator.Simulator(instructions, data).Run(count), repeat)
+
+# Maps the name of each benchmark to its function and a description of what it measures
+Benchmarks = OrderedDict([	("decode", (BenchmarkDecode, "Decoded {} lines")),
+							("assemble", (BenchmarkAssemble, "Assembled {} instructions")),
+							("constants", (BenchmarkConstants, "Decoded {} constants")),
+							("encode", (BenchmarkEncode, "Encoded {} machine code words")),
+							("cfg", (BenchmarkControlFlow, "Built the control flow graph of {} words")),
+							("simulate", (BenchmarkSimulator, "Simulated {} instructions")),
+							("cadence", (lambda count, repeat: BenchmarkMif("cadence", count, repeat), "Wrote a {} word cadence image")),
+							("altera", (lambda count, repeat: BenchmarkMif("altera", count, repeat), "Wrote a {} word altera image")) ])
+
+def ProfileBest(function, repeat):
+	"""
+	Returns the Profile of the fastest of the runs of a function
+	"""
+	best = None
+	for i in range(0, repeat):
+		Profile.Start()
+		try:
+			function()
+		finally:
+			profile = Profile.Stop()
+		if best is None or profile.Elapsed < best.Elapsed:
+			best = profile
+	return best
+
+def GetSummary(profile, count):
+	"""
+	Returns the time, lines each second, peak memory and the time of each stage of a run
+	count - the number of lines the run went through
+	"""
+	return {	"ms" : round(profile.Elapsed*1000, 3),
+				"lines_per_s" : int(count/profile.Elapsed),
+				"peak_memory_mb" : Profile.GetPeakMemory(),
+				"stages" : dict(("/".join(path), round(seconds*1000, 3)) for path, (calls, seconds, objects, peak, depth) in profile.Stages.iteritems()) }
+
+def RunAssembler(task):
+	"""
+	Generate a program and time assembling it, this is run in a process of its own so the peak memory is that of the one program
+	task - (directory, lines of code, included files, repeat, address width)
+	"""
+	directory, count, includeCount, repeat, addressWidth = task
+	assemblyFile, total = GenerateProgram(directory, count, includeCount)
+	programOutput, dataOutput = Assembler.GetOutputPaths(assemblyFile, None)
+	# The included files are parsed in this process and are never cached, so each run does the same work
+	args = {"width" : 32, "address_width" : addressWidth, "memory_width" : 8, "format" : ["cadence"], "cache" : None,
+			"jobs" : 1, "optimize" : False, "eliminate" : False, "symbols" : False, "stuff" : None}
+	try:
+		profile = ProfileBest(lambda: Assembler.Assemble(assemblyFile, programOutput, dataOutput, args), repeat)
+	except Common.AssemblyError as e:
+		sys.stdout.flush()
+		return e.Message # The error is already printed, and the exception cannot be sent back to the parent
+	return total, GetSummary(profile, total)
+
+def RunDisassembler(task):
+	"""
+	Time disassembling the program memory file of a generated program
+	task - (directory, lines of code, included files, repeat, address width)
+	"""
+	directory, count, includeCount, repeat, addressWidth = task
+	mifFile = os.path.join(directory, "program.mif")
+	def Disassemble():
+		myParser = Parser.DisassemblyParser(mifFilePath=mifFile, mifFormat="cadence", width=32, memoryWidth=8, debug=False)
+		myParser.Parse()
+		myParser.Disassembly.Write(os.path.join(directory, "disassembled.asm"))
+	return GetSummary(ProfileBest(Disassemble, repeat), count)
+
+def RunInProcess(function, task):
+	pool = multiprocessing.Pool(1)
+	try:
+		return pool.apply(function, (task,))
+	finally:
+		pool.close()
+		pool.join()
+
+def GetSizes(sizes, addressWidth):
+	"""
+	Returns the number of lines of code of each size in a comma separated string, where full is as many
+	instructions as fit in the address space
+	"""
+	full = 2**addressWidth / 4
+	return [full if size.strip() == "full" else int(size) for size in sizes.split(",") if size.strip()]
+
+def RunSuite(args):
+	"""
+	Generate a program of each size, then time assembling it and disassembling its program memory
+	Returns the results as a dict
+	"""
+	results = {"address_width" : args["address_width"], "includes" : args["includes"], "repeat" : args["repeat"], "sizes" : OrderedDict()}
+	for count in GetSizes(args["sizes"], args["address_width"]):
+		directory = tempfile.mkdtemp(prefix="benchmark_")
+		try:
+			task = (directory, count, args["includes"], args["repeat"], args["address_width"])
+			result = RunInProcess(RunAssembler, task)
+			if not isinstance(result, tuple):
+				raise Common.AssemblyError(result)
+			total, assembler = result
+			disassembler = RunInProcess(RunDisassembler, task)
+		finally:
+			shutil.rmtree(directory)
+		results["sizes"][str(count)] = {"source_lines" : total, "assembler" : assembler, "disassembler" : disassembler}
+		for description, summary in (("Assembled {} lines of code ({} lines in all)".format(count, total), assembler), ("Disassembled {} words".format(count), disassembler)):
+			print "{} in {} ms ({} lines/s, peak memory {} MB)".format(description, summary["ms"], summary["lines_per_s"],
+																	  "-" if summary["peak_memory_mb"] is None else round(summary["peak_memory_mb"], 1))
+	return results
+
+def Compare(results, baseline, threshold):
+	"""
+	Print the change in time of each run against the same run in the baseline
+	threshold - the percentage that a run can be slower by before it is a regression
+	Returns the number of regressions
+	"""
+	regressions = 0
+	print "{:>8} {:22} {:>10} {:>10} {:>8}".format("Lines", "Run", "Base (ms)", "Now (ms)", "Change")
+	for size, result in results["sizes"].iteritems():
+		if size not in baseline["sizes"]:
+			continue
+		for tool in ("assembler", "disassembler"):
+			old, new = baseline["sizes"][size][tool], result[tool]
+			change = 100.0 * (new["ms"] - old["ms"]) / old["ms"]
+			regressed = change > threshold
+			regressions += regressed
+			print "{:>8} {:22} {:>10.3f} {:>10.3f} {:>+7.1f}%{}".format(size, tool, old["ms"], new["ms"], change, "  regression" if regressed else "")
+			# The stages only say where a regression came from, they are too short to be compared on their own
+			if regressed:
+				for stage, ms in sorted(new["stages"].iteritems()):
+					if old["stages"].get(stage):
+						print "{:>8} {:22} {:>10.3f} {:>10.3f} {:>+7.1f}%".format("", "  " + stage, old["stages"][stage], ms, 100.0 * (ms - old["stages"][stage]) / old["stages"][stage])
+	print "{} regression{} over {}%".format(regressions, "" if regressions == 1 else "s", threshold)
+	return regressions
+
+def main(args):
+	if args["sizes"] is None:
+		for name in args["benchmark"] or Benchmarks.keys():
+			function, description = Benchmarks[name]
+			elapsed = function(args["lines"], args["repeat"])
+			print "{} in {} ms ({}/s)".format(description.format(args["lines"]), round(elapsed*1000, 3), int(args["lines"]/elapsed))
+		return 0
+
+	results = RunSuite(args)
+	if args["json"]:
+		with open(args["json"], "w") as _file:
+			json.dump(results, _file, indent=1, separators=(",", ": "), sort_keys=True)
+			_file.write("\n")
+	if args["baseline"]:
+		with open(args["baseline"]) as _file:
+			baseline = json.load(_file)
+		return 1 if Compare(results, baseline, args["threshold"]) else 0
+	return 0
+
+if __name__ == "__main__":
+
+	parser = argparse.ArgumentParser(description="Benchmarks for the RISC_721 assembler by Connor Goldberg")
+	parser.add_argument("-b", "--benchmark", metavar="benchmark", type=str, action="append", help="A benchmark to run, can be given more than once (default = all)", choices=Benchmarks.keys())
+	parser.add_argument("-n", "--lines", metavar="lines", type=int, help="The number of lines of code to generate (default = 200000)", default=200000)
+	parser.add_argument("-r", "--repeat", metavar="repeat", type=int, help="The number of times to repeat each benchmark (default = 3)", default=3)
+	parser.add_argument("-s", "--sizes", metavar="sizes", type=str, help="Instead of the benchmarks, time the assembler and the disassembler on generated programs of these numbers of lines of code separated by commas, full for the whole address space (e.g. 1000,4000,full)")
+	parser.add_argument("-i", "--includes", metavar="includes", type=int, help="The number of files each generated program includes (default = 4)", default=4)
+	parser.add_argument("-a", "--address_width", metavar="address-width", type=int, help="The width of the address bus of the generated programs (default = 16)", default=16)
+	parser.add_argument("-o", "--json", metavar="json-file", type=str, help="Write the results of the generated programs as JSON")
+	parser.add_argument("-c", "--baseline", metavar="json-file", type=str, help="Compare the results of the generated programs with the results saved by an earlier run")
+	parser.add_argument("-t", "--threshold", metavar="percent", type=float, help="How much slower than the baseline a run can be before it is a regression (default = 10)", default=10.0)
+
+	args = vars(parser.parse_args())
+	sys.exit(main(args))
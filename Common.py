@@ -1,43 +1,39 @@
 from ast import literal_eval
 import os
 import struct
-import sys
+
+import Expression
 
 def Enum(*sequential, **named):
     enums = dict(zip(sequential, range(len(sequential))), **named)
     return type('Enum', (), enums)
 
+class AssemblyError(SystemExit):
+	"""
+	Raised by Error once the message is printed, as a SystemExit so a single run still exits with a status of 1
+	"""
+	def __init__(self, message):
+		SystemExit.__init__(self, 1)
+		self.Message = message
+
 def Error(line, errorMsg = ""):
 	if type(line) is str:
-		print line
+		message = line
 	elif line == None:
-		print errorMsg
+		message = errorMsg
 	else:
-		print "Error in %s on line %s:\n\t%s\n%s" % (line.FileName, line.Number, line.String, errorMsg)
-	sys.exit(1)
+		message = "Error in %s on line %s:\n\t%s\n%s" % (line.FileName, line.Number, line.String, errorMsg)
+	print message
+	raise AssemblyError(message)
 
-LegalChars = "0123456789xXaAbBcCdDeEfF() *^+-/.%<>&|~\t"
 def Evaluate(expr, line=None, canReturnFloat=False):
 	try:
-		expr = expr.replace('^',"**")
-		for char in expr:
-			if char not in LegalChars:
-				return expr
-		res = eval(expr)
-		if type(res) is float:
-			if canReturnFloat:
-				return res
-			else:
-				return int(res)
-		elif type(res) is not int and type(res) is not long:
-			newRes = int(round(res))
-			warnMsg = "Converted %s %s to %s" % (type(res), res, newRes)
-			Warn(line, warnMsg)
-			return newRes
-		else:
-			return res
-	except Exception as e:
-		Error(line, "Invalid expression: %s" % expr)
+		res = Expression.Evaluate(expr)
+	except Expression.ExpressionError as e:
+		Error(line, "Invalid expression: %s (%s)" % (expr, e))
+	if type(res) is float and not canReturnFloat:
+		return int(res)
+	return res
 
 def ExprToHexString(expr, line=None, padding=0):
 	expr = expr.strip()
@@ -58,7 +54,7 @@ def SliceBits(num, msb, lsb=None):
 	ex. SliceBits(0x7800, 14, 11) = 0xF
 	"""
 	width = (msb-lsb+1) if lsb is not None else 1
-	return (((2**(width))-1 << msb-width+1) & num) >> msb-width+1
+	return (num >> msb-width+1) & ((1 << width)-1)
 
 def FileToList(filePath):
 	if os.path.isfile(filePath):
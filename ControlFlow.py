@@ -0,0 +1,183 @@
+import bisect
+import json
+
+import InstructionBase
+import Profile
+
+"""
+Splits a table of instructions into basic blocks and recovers the control flow graph between them.
+A block starts at the first instruction, at the destination of every jump and call, after every flow control
+instruction and wherever the addresses are not contiguous. Each block ends with an edge to every block that
+can run after it:
+	fallthrough - to the next instruction, after a block that does not end in a jump
+	jump - to the destination of an unconditional jump
+	branch - to the destination of a conditional jump, which also falls through
+	call - to the destination of a call, which also falls through to where it returns to
+RET and RETI end a block with no edges.
+"""
+
+JumpOpCode = InstructionBase.InstructionList["JMP"]
+CallOpCode = InstructionBase.InstructionList["CALL"]
+ReturnOpCode = InstructionBase.InstructionList["RET"]
+
+class BasicBlock(object):
+
+	def __init__(self, index, start, end, address):
+		"""
+		start, end - the first row and the row after the last row of the block
+		address - the address of the first instruction
+		"""
+		self.Index = index
+		self.Start = start
+		self.End = end
+		self.Address = address
+		self.Successors = [] # (kind, block index or None if the destination is outside of the image, destination address)
+		self.Predecessors = []
+		self.Reachable = False
+
+	def __len__(self):
+		return self.End - self.Start
+
+
+class ControlFlowGraph(object):
+
+	def __init__(self, instructions, step):
+		"""
+		instructions - an InstructionTable with the machine code address of every row
+		step - the number of addresses each instruction takes up
+		"""
+		self.Instructions = instructions
+		self.Step = step
+		self.Blocks = []
+		self.Starts = [] # the first row of each block
+		self.BackEdges = [] # (block index, loop head block index) of each edge that closes a loop
+		self.Build()
+
+	@Profile.Stage("ControlFlowGraph")
+	def Build(self):
+		instructions = self.Instructions
+		addresses = instructions.MachineCodeAddress
+		rowCount = len(instructions)
+
+		# Find the first row of every block
+		leaders = set([0]) if rowCount else set()
+		for row in xrange(0, rowCount):
+			opCode = instructions.OpCode[row]
+			if opCode in (JumpOpCode, CallOpCode, ReturnOpCode):
+				leaders.add(row+1)
+				if opCode != ReturnOpCode:
+					destination = instructions.GetRow(instructions.Immediate[row])
+					if destination is not None:
+						leaders.add(destination)
+			elif row+1 < rowCount and addresses[row+1] != addresses[row] + self.Step:
+				leaders.add(row+1)
+				following = instructions.GetRow(addresses[row] + self.Step)
+				if following is not None:
+					leaders.add(following)
+		leaders.discard(rowCount)
+		self.Starts = sorted(leaders)
+
+		ends = self.Starts[1:] + [rowCount]
+		self.Blocks = [BasicBlock(index, start, end, addresses[start]) for index, (start, end) in enumerate(zip(self.Starts, ends))]
+
+		# Connect each block to the blocks that can follow it
+		for block in self.Blocks:
+			last = block.End - 1
+			opCode = instructions.OpCode[last]
+			if opCode == ReturnOpCode:
+				continue
+			if opCode == JumpOpCode or opCode == CallOpCode:
+				if opCode == CallOpCode:
+					kind = "call"
+				else:
+					kind = "branch" if instructions.Condition[last] else "jump"
+				self.AddEdge(block, kind, instructions.Immediate[last])
+				if kind == "jump":
+					continue
+			self.AddEdge(block, "fallthrough", addresses[last] + self.Step)
+
+		self.FindReachable()
+
+	def AddEdge(self, block, kind, address):
+		row = self.Instructions.GetRow(address)
+		successor = self.GetBlockOfRow(row) if row is not None else None
+		block.Successors.append((kind, successor.Index if successor else None, address))
+		if successor is not None:
+			successor.Predecessors.append(block.Index)
+
+	def GetBlockOfRow(self, row):
+		return self.Blocks[bisect.bisect_right(self.Starts, row) - 1]
+
+	def FindReachable(self):
+		"""
+		Mark every block that can be reached from the first block, and find the edges that close a loop with a depth
+		first search. The search is iterative so a long chain of blocks cannot overflow the stack.
+		"""
+		self.BackEdges = []
+		if not self.Blocks:
+			return
+		onStack = [False] * len(self.Blocks)
+		self.Blocks[0].Reachable = True
+		onStack[0] = True
+		stack = [(0, 0)]
+		while stack:
+			index, edge = stack[-1]
+			successors = self.Blocks[index].Successors
+			if edge == len(successors):
+				onStack[index] = False
+				stack.pop()
+				continue
+			stack[-1] = (index, edge+1)
+			successor = successors[edge][1]
+			if successor is None:
+				continue
+			if onStack[successor]:
+				self.BackEdges.append((index, successor))
+			elif not self.Blocks[successor].Reachable:
+				self.Blocks[successor].Reachable = True
+				onStack[successor] = True
+				stack.append((successor, 0))
+
+	def GetBlockName(self, block):
+		return self.Instructions.Labels.get(block.Start) or "block_{}".format(block.Index)
+
+	def ToDict(self):
+		return {	"step" : self.Step,
+					"blocks" : [{	"index" : block.Index,
+									"name" : self.GetBlockName(block),
+									"address" : block.Address,
+									"instructions" : len(block),
+									"reachable" : block.Reachable,
+									"successors" : [{"kind" : kind, "block" : successor, "address" : address} for kind, successor, address in block.Successors],
+									"predecessors" : block.Predecessors } for block in self.Blocks],
+					"loops" : [{"block" : index, "head" : head} for index, head in self.BackEdges] }
+
+	@Profile.Stage("ControlFlowGraph.Write")
+	def WriteJson(self, filePath):
+		with open(filePath, "w") as _file:
+			json.dump(self.ToDict(), _file, indent=1, separators=(",", ": "), sort_keys=True)
+			_file.write("\n")
+
+	@Profile.Stage("ControlFlowGraph.Write")
+	def WriteDot(self, filePath, name="cfg"):
+		"""
+		Write the graph for Graphviz, each block shows its address range and the instruction it ends with
+		Blocks that cannot be reached are dashed and the edges that close a loop are red
+		"""
+		backEdges = set(self.BackEdges)
+		with open(filePath, "w") as _file:
+			_file.write("digraph \"{}\" {{\n".format(name))
+			_file.write("\tnode [shape=box, fontname=\"monospace\"];\n")
+			for block in self.Blocks:
+				instruction = self.Instructions[block.End-1].Disassemble()
+				if instruction.NeedsLabelOperand:
+					instruction.FixupLabel(self.Instructions.LabelOperands.get(block.End-1, "0x{:X}".format(instruction.Address)))
+				label = "{}\\n@{:04X}..{:04X} ({})\\n{}".format(self.GetBlockName(block), block.Address, self.Instructions.MachineCodeAddress[block.End-1],
+															   len(block), instruction.DisassembledString.lower())
+				_file.write("\tb{} [label=\"{}\"{}];\n".format(block.Index, label, "" if block.Reachable else ", style=dashed"))
+			for block in self.Blocks:
+				for kind, successor, address in block.Successors:
+					if successor is None:
+						continue
+					_file.write("\tb{} -> b{} [label=\"{}\"{}];\n".format(block.Index, successor, kind, ", color=red" if (block.Index, successor) in backEdges else ""))
+			_file.write("}\n")
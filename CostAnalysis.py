@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import sys
+
+import ControlFlow
+import Latency
+import Parser
+
+"""
+Title: Static cycle and size cost analyzer for RISC_721
+Author: Connor Goldberg
+
+Estimates the cost of a program without running it. Every instruction takes the cycles given for its mnemonic in
+the latency table: load/store by addressing mode and jumps by whether they are taken. The words and cycles are
+summed for each file, each label and each basic block, given as the least and the most cycles as every conditional
+jump is not taken or taken. A loop costs the most expensive path from its head back to itself, and the cycles of
+the subroutines it calls are not included.
+"""
+
+class CostAnalysis(object):
+
+	def __init__(self, instructions, modules, step, latencies=Latency.DefaultLatencies):
+		"""
+		instructions - an InstructionTable of the program with the machine code address of every row
+		modules - (file name, first row, end row) of each file of the program
+		step - the number of addresses each instruction takes up
+		"""
+		self.Instructions = instructions
+		self.Modules = modules
+		self.Step = step
+		self.Latencies = latencies
+		self.NotTaken = [] # the cycles of each row when it runs on to the next row
+		self.Taken = [] # the cycles of each row when it jumps
+		self.GetCycles()
+		self.Graph = ControlFlow.ControlFlowGraph(instructions, step)
+
+	def GetCycles(self):
+		instructions = self.Instructions
+		for row in xrange(0, len(instructions)):
+			notTaken, taken = Latency.GetCycles(self.Latencies, instructions.OpCode[row], instructions.Rj[row], instructions.Control[row], instructions.Condition[row])
+			self.NotTaken.append(notTaken)
+			self.Taken.append(taken)
+
+	def GetSpanCost(self, start, end):
+		"""
+		Returns (words, least cycles, most cycles) of the rows from start up to end
+		"""
+		least = most = 0
+		for row in xrange(start, end):
+			least += min(self.NotTaken[row], self.Taken[row])
+			most += max(self.NotTaken[row], self.Taken[row])
+		return end - start, least, most
+
+	def GetExitCost(self, block, kind):
+		"""
+		The cycles of a block when it leaves by an edge of the kind
+		"""
+		last = block.End - 1
+		cycles = sum(self.NotTaken[block.Start:last])
+		return cycles + (self.NotTaken[last] if kind == "fallthrough" else self.Taken[last])
+
+	def GetModuleName(self, row):
+		for name, start, end in self.Modules:
+			if start <= row < end:
+				return name
+		return None
+
+	def GetLabels(self):
+		"""
+		Returns (label, first row, end row) of each label, a label runs up to the next label or the end of its file
+		"""
+		spans = []
+		for name, start, end in self.Modules:
+			rows = sorted(row for row in self.Instructions.Labels if start <= row < end)
+			for first, next_ in zip(rows, rows[1:] + [end]):
+				spans.append((self.Instructions.Labels[first], first, next_))
+		return spans
+
+	def GetLoops(self):
+		"""
+		Returns a dict for each loop, the block of its head, its blocks and the cycles of the most expensive path from
+		its head back to the head
+		"""
+		blocks = self.Graph.Blocks
+		backEdges = set(self.Graph.BackEdges)
+		latches = {}
+		for index, head in self.Graph.BackEdges:
+			latches.setdefault(head, []).append(index)
+
+		# The blocks each block can go on to without closing a loop, with the cycles of the block on the way
+		forward = [[(successor, self.GetExitCost(block, kind)) for kind, successor, address in block.Successors
+					if successor is not None and (block.Index, successor) not in backEdges] for block in blocks]
+
+		loops = []
+		for head, latchList in sorted(latches.iteritems()):
+			# The blocks that can reach a latch without going through the head
+			body = set([head])
+			stack = [latch for latch in latchList if latch != head]
+			while stack:
+				index = stack.pop()
+				if index not in body and blocks[index].Reachable:
+					body.add(index)
+					stack += blocks[index].Predecessors
+
+			# The most cycles from the head to each block of the loop, in topological order without the back edges. Only the
+			# blocks that can be reached from the first block are in the loop, so the back edges break every cycle
+			incoming = dict((index, 0) for index in body)
+			for index in body:
+				for successor, cost in forward[index]:
+					if successor in body and successor != head:
+						incoming[successor] += 1
+			most = {head : 0}
+			ready = [index for index in body if incoming[index] == 0]
+			while ready:
+				index = ready.pop()
+				for successor, cost in forward[index]:
+					if successor not in body or successor == head:
+						continue
+					if index in most and most.get(successor, -1) < most[index] + cost:
+						most[successor] = most[index] + cost
+					incoming[successor] -= 1
+					if incoming[successor] == 0:
+						ready.append(successor)
+
+			cycles = 0
+			for latch in latchList:
+				for kind, successor, address in blocks[latch].Successors:
+					if successor == head and latch in most:
+						cycles = max(cycles, most[latch] + self.GetExitCost(blocks[latch], kind))
+			calls = sorted(set(self.Graph.GetBlockName(blocks[successor]) for index in body for kind, successor, address in blocks[index].Successors
+							   if kind == "call" and successor is not None))
+			loops.append({	"name" : self.Graph.GetBlockName(blocks[head]),
+							"address" : blocks[head].Address,
+							"module" : self.GetModuleName(blocks[head].Start),
+							"blocks" : len(body),
+							"words" : sum(len(blocks[index]) for index in body),
+							"cycles" : cycles,
+							"calls" : calls })
+		loops.sort(key=lambda loop: (-loop["cycles"], loop["address"]))
+		return loops
+
+	def ToDict(self):
+		instructions = self.Instructions
+		addresses = instructions.MachineCodeAddress
+		def Span(name, start, end, **extra):
+			words, least, most = self.GetSpanCost(start, end)
+			span = {"name" : name, "address" : addresses[start] if start < end else None, "words" : words, "cycles_min" : least, "cycles_max" : most}
+			span.update(extra)
+			return span
+
+		words, least, most = self.GetSpanCost(0, len(instructions))
+		return {	"step" : self.Step,
+					"latencies" : self.Latencies,
+					"total" : {"words" : words, "cycles_min" : least, "cycles_max" : most},
+					"modules" : [Span(name, start, end) for name, start, end in self.Modules],
+					"labels" : [Span(name, start, end, module=self.GetModuleName(start)) for name, start, end in self.GetLabels()],
+					"blocks" : [Span(self.Graph.GetBlockName(block), block.Start, block.End, index=block.Index, reachable=block.Reachable) for block in self.Graph.Blocks],
+					"loops" : self.GetLoops() }
+
+	def WriteJson(self, filePath, report=None):
+		with open(filePath, "w") as _file:
+			json.dump(report or self.ToDict(), _file, indent=1, separators=(",", ": "), sort_keys=True)
+			_file.write("\n")
+
+	def Print(self, report=None, top=5, out=sys.stdout):
+		report = report or self.ToDict()
+		def Row(span):
+			cycles = span["cycles_min"] if span["cycles_min"] == span["cycles_max"] else "{}..{}".format(span["cycles_min"], span["cycles_max"])
+			address = "" if span.get("address") is None else "{:04X}".format(span["address"])
+			return "{:32} {:>6} {:>8} {:>14}\n".format(span["name"], address, span["words"], cycles)
+
+		out.write("{:32} {:>6} {:>8} {:>14}\n".format("File", "Addr", "Words", "Cycles"))
+		for span in report["modules"]:
+			out.write(Row(span))
+		out.write(Row(dict(report["total"], name="Total")))
+		out.write("\n{:32} {:>6} {:>8} {:>14}\n".format("Label", "Addr", "Words", "Cycles"))
+		for span in report["labels"]:
+			out.write(Row(span))
+		out.write("\n{} basic blocks, {} loops\n".format(len(report["blocks"]), len(report["loops"])))
+		if report["loops"]:
+			out.write("Most expensive loops:\n")
+			for loop in report["loops"][:top]:
+				out.write("\t{} @{:04X} ({}): {} cycles per iteration, {} words in {} blocks{}\n".format(loop["name"], loop["address"], loop["module"], loop["cycles"], loop["words"], loop["blocks"],
+																									   self.GetCallsString(loop["calls"])))
+
+	@staticmethod
+	def GetCallsString(calls, count=5):
+		if not calls:
+			return ""
+		return ", calls " + ", ".join(calls[:count]) + (" and {} more".format(len(calls)-count) if len(calls) > count else "")
+
+def main(args):
+
+	latencies = Latency.LoadLatencies(args["latencies"]) if args["latencies"] else Latency.DefaultLatencies
+
+	myParser = Parser.Parser(args["assembly-file"], width=args["width"], addressWidth=args["address_width"], memoryWidth=args["memory_width"], canInclude=True, jobs=args["jobs"], optimize=args["optimize"])
+	myParser.Parse()
+	instructions, modules = myParser.GetProgram()
+
+	analysis = CostAnalysis(instructions, modules, args["width"]/args["memory_width"], latencies)
+	report = analysis.ToDict()
+	analysis.Print(report, top=args["top"])
+	if args["json"]:
+		analysis.WriteJson(args["json"], report)
+
+if __name__ == "__main__":
+
+	parser = argparse.ArgumentParser(description="Static cycle and size cost analyzer for RISC_721 by Connor Goldberg")
+	parser.add_argument("assembly-file", help="File to be analyzed")
+	parser.add_argument("-l", "--latencies", metavar="latency-file", type=str, help="A JSON file of the cycles of each mnemonic, replacing those of the default table")
+	parser.add_argument("-o", "--json", metavar="json-file", type=str, help="Also write the report as JSON")
+	parser.add_argument("-t", "--top", metavar="top", type=int, help="The number of the most expensive loops to list (default = 5)", default=5)
+	parser.add_argument("-O", "--optimize", action="store_true", help="Run the peephole pass first")
+	parser.add_argument("-a", "--address_width", metavar="address-width", type=int, help="The width of the address bus", default=16)
+	parser.add_argument("-m", "--memory_width", metavar="memory-width", type=int, help="The width of a word in memory in bits (default = 8)", default=8)
+	parser.add_argument("-w", "--width", metavar="width", type=int, help="The width of instruction words in bits (default = 32)", default=32)
+	parser.add_argument("-j", "--jobs", metavar="jobs", type=int, help="The number of processes to parse included files with (default = one for each cpu)")
+
+	args = vars(parser.parse_args())
+	main(args)
@@ -0,0 +1,116 @@
+import bisect
+
+import Common
+
+"""
+The cells of data memory taken by the constants of a program. A constant is a word, which takes step addresses of
+memory, so a cell is the step addresses from the address of the constant. The addresses in use are kept as a sorted
+list of disjoint ranges, with ranges that touch joined together, so finding whether an address is used or the next
+free address is a binary search however many constants there are.
+"""
+
+class DataMemory(object):
+
+	def __init__(self, start, end, step=1):
+		"""
+		start, end - the first address and the address after the last one that constants can be allocated in
+		step - the number of addresses a word of data takes
+		"""
+		self.End = end
+		self.Step = step
+		self.Next = start # constants are allocated in order, so no cell before this one is free
+		self.Starts = [] # the first address of each range of used cells
+		self.Ends = [] # the address after the last cell of each range
+		self.Values = {} # the value of each used cell, by its first address
+		self.Allocated = {} # the index in Cells of each allocated value
+		self.Cells = [] # (address, value, line, names) of each used cell in the order they were added
+
+	def GetRange(self, address):
+		"""
+		Returns the index of the range the address is in, or of the range before it if the cell is free, or -1
+		"""
+		return bisect.bisect_right(self.Starts, address) - 1
+
+	def IsUsed(self, address):
+		index = self.GetRange(address)
+		return index >= 0 and address < self.Ends[index]
+
+	def GetFree(self, address):
+		"""
+		Returns the first free cell at or after the address
+		"""
+		index = self.GetRange(address)
+		# The cell after a range is always free, since touching ranges are joined
+		return self.Ends[index] if index >= 0 and address < self.Ends[index] else address
+
+	def GetOverlap(self, address):
+		"""
+		Returns the first address of the cell that shares an address with a cell at the address, or None
+		"""
+		if address in self.Values:
+			return address
+		for other in xrange(address - self.Step + 1, address + self.Step):
+			if other in self.Values:
+				return other
+		return None
+
+	def Use(self, start, end):
+		"""
+		Mark the free addresses from start up to end as used
+		"""
+		index = self.GetRange(start)
+		joinsBefore = index >= 0 and self.Ends[index] == start
+		joinsAfter = index+1 < len(self.Starts) and self.Starts[index+1] == end
+		if joinsBefore and joinsAfter:
+			self.Ends[index] = self.Ends[index+1]
+			del self.Starts[index+1]
+			del self.Ends[index+1]
+		elif joinsBefore:
+			self.Ends[index] = end
+		elif joinsAfter:
+			self.Starts[index+1] = start
+		else:
+			self.Starts.insert(index+1, start)
+			self.Ends.insert(index+1, end)
+
+	def Add(self, address, value, line):
+		"""
+		Add a constant at an address, it is an error if the address already holds another value
+		value - the value as a hex string
+		"""
+		other = self.GetOverlap(address)
+		if other == address:
+			if self.Values[address] != value:
+				Common.Error(line, "Duplicate constant found at address: 0x%s. Address already assigned to: 0x%s" % (Common.NumToHexString(address), self.Values[address]))
+			return
+		elif other is not None:
+			Common.Error(line, "The constant at address 0x%s overlaps the constant at address 0x%s, each constant takes %d addresses" % (Common.NumToHexString(address), Common.NumToHexString(other), self.Step))
+		self.Use(address, address + self.Step)
+		self.Values[address] = value
+		self.Cells.append((address, value, line, []))
+
+	def Allocate(self, name, value, line):
+		"""
+		Returns the address of a free cell for a constant, constants with the same value share a cell
+		The cell is aligned to the step, so the words of data memory never straddle each other
+		"""
+		if value not in self.Allocated:
+			address = self.Next
+			while True:
+				address = self.GetFree(address)
+				address += -address % self.Step
+				# The range holding the last address of the cell is the only one that can overlap it
+				index = self.GetRange(address + self.Step - 1)
+				if index < 0 or self.Ends[index] <= address:
+					break
+				address = self.Ends[index]
+			if address + self.Step > self.End:
+				Common.Error(line, "There is no free data memory left for constant: %s" % name)
+			self.Use(address, address + self.Step)
+			self.Next = address + self.Step
+			self.Values[address] = value
+			self.Allocated[value] = len(self.Cells)
+			self.Cells.append((address, value, line, []))
+		cell = self.Cells[self.Allocated[value]]
+		cell[3].append(name)
+		return cell[0]
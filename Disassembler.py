@@ -6,17 +6,42 @@ import sys
 import time
 
 import Common
+import ControlFlow
 import Mif
 import Parser
+import Profile
 
 """
 Title: Disassembler for RISC_721
 Author: Connor Goldberg
 """
 
+def GetGraphFormat(cfgOutput):
+	extension = os.path.splitext(cfgOutput)[1].lower()
+	if extension not in (".json", ".dot", ".gv"):
+		Common.Error("Cannot tell the format of the control flow graph from: {} (use .json or .dot)".format(cfgOutput))
+	return "json" if extension == ".json" else "dot"
+
+def WriteControlFlowGraph(disassembly, cfgOutputs, args):
+	"""
+	Build the control flow graph of the disassembled image and write it as JSON or DOT by the extension of each file
+	"""
+	start = time.time()
+	cfg = ControlFlow.ControlFlowGraph(disassembly.Instructions, step=args["width"]/args["memory_width"])
+	elapsed = time.time() - start
+	print "Built the control flow graph of {} blocks ({} reachable, {} loops) in {} ms".format(len(cfg.Blocks), sum(1 for block in cfg.Blocks if block.Reachable),
+																						  len(cfg.BackEdges), round(elapsed*1000, 3))
+	for cfgOutput in cfgOutputs:
+		if GetGraphFormat(cfgOutput) == "json":
+			cfg.WriteJson(cfgOutput)
+		else:
+			cfg.WriteDot(cfgOutput, name=os.path.basename(args["mif-file"]))
+
 def main(args):
 
-	start = time.clock()
+	if args["profile"] is not None:
+		Profile.Start()
+	start = time.time()
 
 	mifFile = args["mif-file"]
 	output = args["output"]
@@ -28,16 +53,29 @@ def main(args):
 		programOutput = output
 		split = os.path.splitext(output)
 
+	for cfgOutput in args["cfg"] or []:
+		GetGraphFormat(cfgOutput) # Check the formats before disassembling
+
 	myParser = Parser.DisassemblyParser(mifFilePath=mifFile, mifFormat=args["format"], width=args["width"], memoryWidth=args["memory_width"], debug=args["debug"])
 	myParser.Parse()
 
-	myParser.Disassembly.Write(programOutput, [" ".join(sys.argv)])
+	headers = [" ".join(sys.argv)]
+	headers += ["Not disassembled: [{:X}..{:X}] : {:X}".format(first, last, value) for first, last, value, lineNumber, offset in myParser.Disassembly.Image.Ranges]
+	myParser.Disassembly.Write(programOutput, headers)
+
+	if args["cfg"]:
+		WriteControlFlowGraph(myParser.Disassembly, args["cfg"], args)
 	
-	end = time.clock()
+	end = time.time()
+	profile = Profile.Stop() if args["profile"] is not None else None
+	if profile is not None:
+		end -= profile.Overhead # the time spent counting objects is not part of the run
 	
 	print "Successfully disassembled {} into {}".format(mifFile, programOutput)
 	print "Time elapsed: %s ms" % str(round(float(end-start)*1000,3))
 	print "Completed on %s at %s" % (time.strftime("%m/%d/%Y"), time.strftime("%I:%M:%S"))
+	if profile is not None:
+		profile.Report(args["profile"])
 
 if __name__ == "__main__":
 	
@@ -47,6 +85,8 @@ if __name__ == "__main__":
 	parser.add_argument("-m", "--memory_width", metavar="memory_width", type=int, help="The width of a word in memory in bits (default = 8)", default=8)
 	parser.add_argument("-w", "--width", metavar="width", type=int, help="The width of instruction words in bits (default = 32)", default=32)
 	parser.add_argument("-f", "--format", metavar="format", type=str, help="The input format of the assembled mif file", choices=["altera","cadence"], default="cadence")
+	parser.add_argument("-g", "--cfg", metavar="cfg-file", type=str, action="append", help="Also write the control flow graph of the basic blocks, as JSON (.json) or Graphviz (.dot), can be given more than once")
+	parser.add_argument("--profile", metavar="json-file", nargs="?", const="", help="Time each stage and print the times, or write them as JSON if a file is given")
 	parser.add_argument("-d", "--debug", action="store_true", help="Output debug information")
 
 	args = vars(parser.parse_args())
@@ -0,0 +1,153 @@
+import operator
+import re
+
+"""
+Parses and evaluates the expressions used by constants and directives without handing them to eval.
+
+The operators and their precedence (from lowest to highest) follow Python:
+	|
+	^
+	&
+	<< >>
+	+ -
+	* / // %
+	unary - + ~
+	**
+Values can be decimal, hexadecimal (0x), binary (0b), octal (leading 0) or floating point.
+Directives are replaced before an expression is evaluated, so an expression never has any variables and
+every expression folds down to a single value. The value of each expression is cached by its text with the
+surrounding whitespace removed, so repeated expressions are only parsed once.
+"""
+
+class ExpressionError(ValueError):
+	pass
+
+# A float, an int, an operator, or any other character which is an error
+_TokenRegex = re.compile(r"\s*(?:((?:\d+\.\d*|\.\d+)(?:[eE][+-]?\d+)?|\d+[eE][+-]?\d+)|(0[xX][0-9a-fA-F]+|0[bB][01]+|\d+)|(\*\*|//|<<|>>|[-+*/%&|^~()])|(\S))")
+
+_NumberRegex = re.compile(r"(?:0[xX][0-9a-fA-F]+|0[bB][01]+|\d+)$")
+
+def LeftShift(value, count):
+	if count > MaxBits:
+		raise ExpressionError("Shift is too large: %s" % count)
+	return value << count
+
+def Power(base, exponent):
+	if abs(exponent) > MaxBits and abs(base) > 1:
+		raise ExpressionError("Exponent is too large: %s" % exponent)
+	return base ** exponent
+
+# The precedence and function of each binary operator
+BinaryOperators = {	"|"		: (1, operator.or_),
+					"^"		: (2, operator.xor),
+					"&"		: (3, operator.and_),
+					"<<"	: (4, LeftShift),
+					">>"	: (4, operator.rshift),
+					"+"		: (5, operator.add),
+					"-"		: (5, operator.sub),
+					"*"		: (6, operator.mul),
+					"/"		: (6, operator.div),
+					"//"	: (6, operator.floordiv),
+					"%"		: (6, operator.mod),
+					}
+
+UnaryOperators = {	"-" : operator.neg,
+					"+" : operator.pos,
+					"~" : operator.invert,
+					}
+
+# The largest exponent or left shift allowed, so an expression cannot build a huge number
+MaxBits = 4096
+
+ExpressionCache = {}
+
+def Tokenize(expr):
+	"""
+	Split an expression into a list of numbers and operator strings
+	"""
+	tokens = []
+	for floatNumber, intNumber, symbol, other in _TokenRegex.findall(expr):
+		if other:
+			raise ExpressionError("Unexpected character in expression: %s" % expr[expr.index(other):].strip())
+		elif symbol:
+			tokens.append(symbol)
+		elif intNumber:
+			tokens.append(int(intNumber, 0))
+		else:
+			tokens.append(float(floatNumber))
+	return tokens
+
+
+class ExpressionParser(object):
+
+	def __init__(self, tokens):
+		# None marks the end of the expression
+		self.Tokens = tokens + [None]
+		self.Position = 0
+
+	def Parse(self):
+		value = self.ParseBinary(0)
+		if self.Tokens[self.Position] is not None:
+			raise ExpressionError("Unexpected %s in expression" % self.Tokens[self.Position])
+		return value
+
+	def ParseBinary(self, minPrecedence):
+		left = self.ParseUnary()
+		while True:
+			operator_ = BinaryOperators.get(self.Tokens[self.Position])
+			if operator_ is None or operator_[0] < minPrecedence:
+				return left
+			self.Position += 1
+			left = operator_[1](left, self.ParseBinary(operator_[0]+1))
+
+	def ParseUnary(self):
+		function = UnaryOperators.get(self.Tokens[self.Position])
+		if function is not None:
+			self.Position += 1
+			return function(self.ParseUnary())
+		return self.ParsePower()
+
+	def ParsePower(self):
+		base = self.ParseAtom()
+		if self.Tokens[self.Position] == "**":
+			self.Position += 1
+			# The exponent binds to the right and can have its own sign, e.g. 2**-1 and 2**3**2
+			return Power(base, self.ParseUnary())
+		return base
+
+	def ParseAtom(self):
+		token = self.Tokens[self.Position]
+		if token is None:
+			raise ExpressionError("Unexpected end of expression")
+		self.Position += 1
+		if token == "(":
+			value = self.ParseBinary(0)
+			if self.Tokens[self.Position] != ")":
+				raise ExpressionError("Missing closing parenthesis")
+			self.Position += 1
+			return value
+		elif type(token) is str:
+			raise ExpressionError("Unexpected %s in expression" % token)
+		return token
+
+
+def Evaluate(expr):
+	"""
+	Returns the value of the expression, an int or a float
+	Raises an ExpressionError if the expression is not valid
+	"""
+	key = expr.strip()
+	value = ExpressionCache.get(key)
+	if value is None:
+		try:
+			if _NumberRegex.match(key):
+				# Most expressions are a single number
+				value = int(key, 0)
+			else:
+				value = ExpressionParser(Tokenize(key)).Parse()
+		except ExpressionError:
+			raise
+		except (ArithmeticError, TypeError, ValueError) as e:
+			raise ExpressionError(str(e))
+		ExpressionCache[key] = value
+	return value
@@ -0,0 +1,72 @@
+import cPickle
+import hashlib
+import os
+import tempfile
+
+"""
+An on-disk cache of decoded include files. An entry holds the decoded instruction table
+with the labels of the file (as rows, so they can be relocated anywhere).
+Entries are keyed by a hash of the file path and contents, the directives of the file and the
+width settings, so changing any of them builds the file again. The path is part of the key as the
+lines of an entry name the file they came from. Entries are never removed, an entry that is no
+longer used stays until the directory is deleted.
+"""
+
+class IncludeCache(object):
+
+	# Bump this whenever the decoded form of an instruction changes so old entries are not used
+	Version = 4
+
+	def __init__(self, directory):
+		self.Directory = directory
+		self.Hits = 0
+		self.Misses = 0
+
+	def __str__(self):
+		return "Include cache: {} hit{}, {} miss{} ({})".format(self.Hits, '' if self.Hits == 1 else 's',
+																 self.Misses, '' if self.Misses == 1 else "es",
+																 self.Directory)
+
+	@staticmethod
+	def GetKey(filePath, contents, directives, width, addressWidth, memoryWidth):
+		"""
+		filePath - the path of the include file
+		contents - the raw contents of the include file
+		directives - the decoded directives of the include file
+		"""
+		key = hashlib.sha1()
+		key.update(os.path.abspath(filePath) + "\0")
+		key.update(contents)
+		key.update(repr((IncludeCache.Version, sorted(directives.iteritems()), width, addressWidth, memoryWidth)))
+		return key.hexdigest()
+
+	def GetPath(self, key):
+		return os.path.join(self.Directory, key + ".cache")
+
+	def Get(self, key):
+		"""
+		Returns the entry stored under the key, or None if there is no usable entry
+		"""
+		try:
+			with open(self.GetPath(key), "rb") as _file:
+				entry = cPickle.load(_file)
+		except Exception:
+			# A missing, old or partially written entry is just a miss
+			self.Misses += 1
+			return None
+		self.Hits += 1
+		return entry
+
+	def Put(self, key, entry):
+		if not os.path.isdir(self.Directory):
+			os.makedirs(self.Directory)
+		# Write to a temporary file first so a reader never sees a partial entry
+		handle, tempPath = tempfile.mkstemp(dir=self.Directory)
+		with os.fdopen(handle, "wb") as _file:
+			cPickle.dump(entry, _file, cPickle.HIGHEST_PROTOCOL)
+		try:
+			os.rename(tempPath, self.GetPath(key))
+		except OSError:
+			# Windows will not rename over an existing file
+			os.remove(self.GetPath(key))
+			os.rename(tempPath, self.GetPath(key))
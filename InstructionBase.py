@@ -1,12 +1,19 @@
-import re
 import Common
+import Lexer
 
 class InstructionBase_(object):
 
 	RegisterWidth = 32
 	RegisterField = Common.Enum("Ri", "Rj", "Rk")
 
-	def __init__(self, line, mnemonic, opCode):
+	# The names of the fields that hold the immediate value and the condition code, if any
+	ImmediateField = "Constant"
+	ConditionField = None
+
+	# The layouts a machine code word is unpacked with, indexed by its lowest bit (the control bit of the ALU layouts)
+	EncodeLayouts = None
+
+	def __init__(self, line, mnemonic, opCode, tokens=None):
 		self.Line = line
 		self.Mnemonic = mnemonic
 		self.OpCode = opCode
@@ -14,27 +21,79 @@ class InstructionBase_(object):
 		self.DisassembledString = ""
 		self.IsDestination = False
 		self.Label = None
-		self.MachineCode = ""
 		self.MachineCodeAddress = None
 		self.MachineCodeValue = None
 		self.NeedsLabelAddress = False
 		self.NeedsLabelOperand = False
-		self.SplitLine = [piece for piece in re.split(" |,|\t", self.Line.String) if piece != '']
-		if self.SplitLine[0].endswith(':'):
-			self.Label = self.SplitLine[0][0:len(self.SplitLine[0])-1]
-			self.SplitLine = self.SplitLine[1:]
+		self.Operands = []
+		if tokens:
+			if tokens[0].Type == Lexer.TokenType.Label:
+				self.Label = tokens[0].Value
+				tokens = tokens[1:]
+			self.Operands = tokens[1:]
 
 	def Assemble(self):
 		Common.Error(self.Line, "This instruction did not implement the method: Assemble")
 
-	def Decode(self):
-		Common.Error(self.Line, "This instruction did not implement the method: Decode")
+	def Decode(self, shape, fields):
+		"""
+		shape - a getter for each operand that decodes it into this instruction
+		fields - the sub-fields that are fixed for this mnemonic
+		"""
+		if len(self.Operands) != len(shape):
+			Common.Error(self.Line, "Wrong number of operands")
+		self.__dict__.update(fields)
+		for getter, operand in zip(shape, self.Operands):
+			getter(self, operand)
+		return self
 
 	def Disassemble(self):
 		Common.Error(self.Line, "This instruction did not implement the method: Disassemble")
 
 	def Encode(self):
-		Common.Error(self.Line, "This instruction did not implement the method: Encode")
+		if self.EncodeLayouts is None:
+			Common.Error(self.Line, "This instruction did not implement the method: Encode")
+		self.Unpack(self.EncodeLayouts[self.MachineCodeValue & 1])
+		return self
+
+	@classmethod
+	def HasLabelOperand(cls, opCode):
+		"""
+		Returns if an instruction with the opcode is disassembled with a label as its operand
+		"""
+		return False
+
+	@property
+	def MachineCode(self):
+		# The machine code as a binary string, only meant as a debug view
+		return Common.NumToBinaryString(self.MachineCodeValue, self.RegisterWidth)
+
+	def Pack(self, layout):
+		"""
+		Pack the fields of this instruction into a machine code word
+		layout - a tuple of (field, lsb, width) for each field to pack, unset (None) fields are packed as 0
+		"""
+		word = 0
+		for field, lsb, width in layout:
+			value = getattr(self, field)
+			if value is None:
+				continue
+			if value < 0 or value >> width:
+				Common.Error(self.Line, "Value %s does not fit in the %i-bit %s field" % (value, width, field))
+			word |= value << lsb
+		return word
+
+	def Unpack(self, layout):
+		"""
+		Unpack the fields of this instruction from its machine code word
+		layout - a tuple of (field, lsb, width) for each field to unpack
+		"""
+		for field, lsb, width in layout:
+			setattr(self, field, (self.MachineCodeValue >> lsb) & ((1 << width) - 1))
+
+	@classmethod
+	def GetFormat(cls, mnemonic):
+		return cls.Formats[mnemonic]
 
 	@staticmethod
 	def BuildDisassembledString(mnemonic, operands):
@@ -91,74 +150,47 @@ class InstructionBase_(object):
 			self.DisassembledString = self.BuildDisassembledString(self.Mnemonic, operands)
 			self.NeedsLabelOperand = False
 
-	def GetAddressOperand(self, arg):
-		# strip M[], figure out what the control is, do stuff based off of the control.
-		operand = arg.upper().replace("M[",'').replace(']','')
-		if '+' in operand:
-			self.Control = 0
-			operand = operand.split('+')
-			if operand[0].upper() == "PC":
-				# PC Relative
-				self.Rj = 0
-				self.Address = int(operand[1],0)
-			elif operand[1].upper() == "PC":
-				# PC Relative
-				self.Rj = 0
-				self.Address = int(operand[0],0)
-			elif operand[0].upper().startswith("0X"):
-				# Indexed
-				self.Address = int(operand[0],0)
-				self.GetRegisterOperand(operand[1],self.RegisterField.Rj)
-			elif operand[1].upper().startswith("0X"):
-				# Indexed
-				self.Address = int(operand[1],0)
-				self.GetRegisterOperand(operand[0],self.RegisterField.Rj)
-			else:
-				Common.Error(self.Line, "Invalid operand for address: %s" % arg)
+	def GetAddressOperand(self, operand):
+		# figure out the addressing mode from the terms inside of M[], then set the control
+		if operand.Type == Lexer.TokenType.Memory:
+			terms = operand.Value
 		else:
-			if operand.upper().startswith("R"):
+			terms = (operand,)
+		types = [term.Type for term in terms]
+
+		if len(terms) == 1:
+			if types[0] == Lexer.TokenType.Register:
 				# Register direct
 				self.Control = 1
-				self.GetRegisterOperand(operand, self.RegisterField.Rj)
-			elif operand.upper() == "PC":
+				self.Rj = terms[0].Value
+			elif types[0] == Lexer.TokenType.PcRelative:
 				# PC Relative with no offset
 				self.Control = 0
 				self.Rj = 0
 				self.Address = 0
-			else:
+			elif types[0] == Lexer.TokenType.Immediate:
 				# Absolute addressing mode
 				self.Control = 1
 				self.Rj = 0
-				try:
-					self.Address = int(operand,0)
-				except Exception:
-					Common.Error(self.Line, "Invalid address operand: %s" % operand)
-
-	def GetConstantOperand(self, operand):
-		try:
-			self.Constant = int(operand,0)
-		except ValueError:
-			Common.Error(self.Line, "Constant must be a number: %s" % operand)
-		
-		self.Control = 1
-
-	def GetEitherOperand(self, operand, registerField):
-		if operand[0].upper() == 'R':
-			self.GetRegisterOperand(operand, registerField)
-		else:
-			self.GetConstantOperand(operand)
-
-	def GetRegisterOperand(self, operand, registerField):
-		if operand[0].upper() != 'R' or not operand[1:].isdigit():
-			Common.Error(self.Line, "Invalid operand for register: %s" % operand)
-		elif registerField == self.RegisterField.Ri:
-			self.Ri = int(operand[1:])
-		elif registerField == self.RegisterField.Rj:
-			self.Rj = int(operand[1:])
-		elif registerField == self.RegisterField.Rk:
-			self.Rk = int(operand[1:])
+				self.Address = terms[0].Value
+			else:
+				Common.Error(self.Line, "Invalid address operand: %s" % operand.Text)
+		elif len(terms) == 2 and Lexer.TokenType.Immediate in types:
+			self.Control = 0
+			offset = terms[types.index(Lexer.TokenType.Immediate)]
+			base = terms[1] if offset is terms[0] else terms[0]
+			if base.Type == Lexer.TokenType.PcRelative:
+				# PC Relative
+				self.Rj = 0
+				self.Address = offset.Value
+			elif base.Type == Lexer.TokenType.Register:
+				# Indexed
+				self.Rj = base.Value
+				self.Address = offset.Value
+			else:
+				Common.Error(self.Line, "Invalid operand for address: %s" % operand.Text)
 		else:
-			Common.Error(self.Line, "We should never get here")
+			Common.Error(self.Line, "Invalid operand for address: %s" % operand.Text)
 
 # This encodes the instruction mnemonic to the opcode
 InstructionList = {	"LD" 	: 0x00, 
@@ -0,0 +1,288 @@
+from array import array
+
+try:
+	import numpy
+except ImportError:
+	numpy = None # The whole image decode falls back to a loop over the words
+
+import Common
+import InstructionBase
+import Instructions
+
+"""
+Stores decoded instructions as parallel arrays, one column per field, instead of keeping
+an object for every instruction alive. Instruction objects are only created on demand as
+views of a row, changes to a view are not stored unless the view is written back.
+"""
+
+class InstructionTable(object):
+
+	# The register sized fields, stored as bytes
+	ByteFields = ("OpCode", "Ri", "Rj", "Rk", "Control")
+	NoneByte = 0xFF
+	NoneLong = -(2**31) # only used for addresses, which are never negative
+
+	# Every mnemonic known to either the assembler or the disassembler
+	MnemonicNames = sorted(set(InstructionBase.InstructionList.keys() + InstructionBase.MnemonicList.values()))
+	MnemonicIds = dict((mnemonic, i) for i, mnemonic in enumerate(MnemonicNames))
+
+	# Every array column, in the order they are saved
+	Columns = ("Mnemonic", "OpCode", "Ri", "Rj", "Rk", "Control", "Condition", "Immediate", "HasImmediate", "LineIndex", "MachineCodeAddress", "MachineCode")
+
+	# How to unpack a machine code word into a row by its opcode and lowest bit, see GetDecodePlan
+	DecodePlans = {}
+
+	def __init__(self, lines=None):
+		"""
+		lines - the list of source lines that rows index into, if None the table keeps its own list
+		"""
+		self.Lines = lines if lines is not None else []
+		self.OwnsLines = lines is None
+
+		self.Mnemonic = array('B')
+		self.OpCode = array('B')
+		self.Ri = array('B')
+		self.Rj = array('B')
+		self.Rk = array('B')
+		self.Control = array('B')
+		self.Condition = array('B') # CNVZ for flow control, the shift condition for rotate/shift
+		self.Immediate = array('l') # Address for load/store and flow control, the constant otherwise
+		self.HasImmediate = array('B') # 1 if the row has an immediate, any value of Immediate is a valid one
+		self.LineIndex = array('l')
+		self.MachineCodeAddress = array('l')
+		self.MachineCode = array('I')
+
+		# Sparse columns, keyed by row
+		self.Labels = {}
+		self.LabelOperands = {}
+
+		self.AddressIndex = None
+
+	def __len__(self):
+		return len(self.Mnemonic)
+
+	def __iter__(self):
+		for row in xrange(0, len(self)):
+			yield self[row]
+
+	def __getitem__(self, row):
+		mnemonic = self.MnemonicNames[self.Mnemonic[row]]
+		opCode = self.OpCode[row]
+		instructionClass = self.GetClass(mnemonic, opCode)
+
+		instruction = instructionClass(self.GetLine(row), mnemonic, opCode)
+		instruction.__dict__.update(instructionClass.Defaults)
+		for field in self.ByteFields[1:]:
+			value = getattr(self, field)[row]
+			if value != self.NoneByte:
+				setattr(instruction, field, value)
+		if instructionClass.ConditionField is not None:
+			instruction.__dict__[instructionClass.ConditionField] = self.Condition[row]
+		if self.HasImmediate[row]:
+			instruction.__dict__[instructionClass.ImmediateField] = self.Immediate[row]
+
+		if row in self.Labels:
+			instruction.Label = self.Labels[row]
+		if row in self.LabelOperands:
+			instruction.LabelOperand = self.LabelOperands[row]
+			instruction.NeedsLabelAddress = True
+		if self.MachineCodeAddress[row] != self.NoneLong:
+			instruction.MachineCodeAddress = self.MachineCodeAddress[row]
+		instruction.MachineCodeValue = self.MachineCode[row]
+		return instruction
+
+	def __getstate__(self):
+		# Save the columns as raw bytes, pickling an array saves it as a list of ints
+		state = dict(self.__dict__)
+		for column in self.Columns:
+			state[column] = (state[column].typecode, state[column].tostring())
+		state["AddressIndex"] = None
+		return state
+
+	def __setstate__(self, state):
+		for column in self.Columns:
+			typecode, data = state[column]
+			state[column] = array(typecode)
+			state[column].fromstring(data)
+		self.__dict__.update(state)
+
+	def __setitem__(self, row, instruction):
+		self.Store(row, instruction)
+
+	@staticmethod
+	def GetClass(mnemonic, opCode):
+		if mnemonic in Instructions.Registry:
+			return Instructions.Registry[mnemonic].Class
+		return Instructions.OpCodeRegistry[opCode].Class
+
+	def Append(self, instruction, lineIndex=None):
+		if lineIndex is None:
+			if not self.OwnsLines:
+				Common.Error(instruction.Line, "A line index is needed for a table that shares its lines")
+			lineIndex = len(self.Lines)
+			self.Lines.append(instruction.Line)
+
+		self.Mnemonic.append(0)
+		for field in self.ByteFields:
+			getattr(self, field).append(0)
+		self.Condition.append(0)
+		self.Immediate.append(0)
+		self.HasImmediate.append(0)
+		self.LineIndex.append(lineIndex)
+		self.MachineCodeAddress.append(0)
+		self.MachineCode.append(0)
+		self.Store(len(self) - 1, instruction)
+		return self
+
+	def Select(self, rows):
+		"""
+		Returns a new table of the given rows in that order, which shares the lines of this table
+		rows - the row of each row of the new table
+		"""
+		table = InstructionTable(lines=self.Lines)
+		table.OwnsLines = self.OwnsLines
+		for column in self.Columns:
+			getattr(table, column).extend(getattr(self, column)[row] for row in rows)
+		newRows = dict((row, i) for i, row in enumerate(rows))
+		table.Labels = dict((newRows[row], label) for row, label in self.Labels.iteritems() if row in newRows)
+		table.LabelOperands = dict((newRows[row], label) for row, label in self.LabelOperands.iteritems() if row in newRows)
+		return table
+
+	def Store(self, row, instruction):
+		self.Mnemonic[row] = self.MnemonicIds[instruction.Mnemonic]
+		try:
+			for field in self.ByteFields:
+				value = getattr(instruction, field, None)
+				getattr(self, field)[row] = self.NoneByte if value is None else value
+			condition = getattr(instruction, instruction.ConditionField) if instruction.ConditionField else None
+			self.Condition[row] = condition or 0
+			immediate = getattr(instruction, instruction.ImmediateField, None)
+			self.Immediate[row] = 0 if immediate is None else immediate
+			self.HasImmediate[row] = immediate is not None
+		except OverflowError:
+			Common.Error(instruction.Line, "Operand value is out of range")
+
+		self.MachineCodeAddress[row] = self.NoneLong if instruction.MachineCodeAddress is None else instruction.MachineCodeAddress
+		self.MachineCode[row] = instruction.MachineCodeValue or 0
+
+		if instruction.Label is not None:
+			self.Labels[row] = instruction.Label
+		else:
+			self.Labels.pop(row, None)
+		if instruction.NeedsLabelAddress:
+			self.LabelOperands[row] = instruction.LabelOperand
+		else:
+			self.LabelOperands.pop(row, None)
+		self.AddressIndex = None
+
+	@classmethod
+	def GetDecodePlan(cls, opCode, control):
+		"""
+		Returns how to unpack a machine code word with the opcode and lowest bit into a row, or None if the opcode is unknown
+		The plan is a tuple of (the value of each column of the row before unpacking, (column, lsb, mask) of each unpacked field)
+		"""
+		key = (opCode, control)
+		if key not in cls.DecodePlans:
+			spec = Instructions.OpCodeRegistry.get(opCode)
+			if spec is None or spec.Class.EncodeLayouts is None:
+				cls.DecodePlans[key] = None
+				return None
+			instructionClass = spec.Class
+			columns = dict((field, field) for field in cls.ByteFields)
+			columns[instructionClass.ImmediateField] = "Immediate"
+			if instructionClass.ConditionField is not None:
+				columns[instructionClass.ConditionField] = "Condition"
+
+			# The same values Store would take from an instruction built by Instructions.Encode
+			defaults = dict((field, cls.NoneByte) for field in cls.ByteFields)
+			defaults.update(Mnemonic=cls.MnemonicIds[spec.Mnemonic], Condition=0, Immediate=0, HasImmediate=0)
+			for field, value in instructionClass.Defaults.iteritems():
+				if field in columns and value is not None:
+					defaults[columns[field]] = value
+			fields = tuple((columns[field], lsb, (1 << width)-1) for field, lsb, width in instructionClass.EncodeLayouts[control] if field in columns)
+			if instructionClass.Defaults.get(instructionClass.ImmediateField) is not None or any(column == "Immediate" for column, lsb, mask in fields):
+				defaults["HasImmediate"] = 1
+			cls.DecodePlans[key] = (defaults, fields)
+		return cls.DecodePlans[key]
+
+	def AppendMachineCode(self, addresses, words):
+		"""
+		Decode a whole image of machine code words into rows without building an instruction for each word
+		The rows index the lines of the table in order, so the table is expected to share the lines of the image
+		addresses - an array of the address of each word
+		words - an array of the machine code words
+		"""
+		start = len(self)
+		if numpy is not None and words.itemsize == 4 and len(words):
+			columns = self.DecodeWithNumpy(words)
+		else:
+			columns = self.DecodeWords(words, start)
+		for column, values in columns.iteritems():
+			getattr(self, column).extend(values)
+		self.LineIndex.extend(xrange(start, start+len(words)))
+		self.MachineCodeAddress.extend(addresses)
+		self.MachineCode.extend(words)
+		self.AddressIndex = None
+		return self
+
+	def DecodeWords(self, words, start):
+		"""
+		Returns the decoded fields of the words as an array for each column, one word at a time
+		"""
+		names = ("Mnemonic",) + self.ByteFields + ("Condition", "Immediate", "HasImmediate")
+		index = dict((name, i) for i, name in enumerate(names))
+		plans = {}
+		rows = []
+		for row, word in enumerate(words):
+			key = (word >> 27, word & 1)
+			plan = plans.get(key)
+			if plan is None:
+				plan = self.GetDecodePlan(*key)
+				if plan is None:
+					Common.Error(self.Lines[start+row], "Unknown opcode: %s" % key[0])
+				defaults, fields = plan
+				plans[key] = plan = ([defaults[name] for name in names], tuple((index[column], lsb, mask) for column, lsb, mask in fields))
+			values = list(plan[0])
+			for column, lsb, mask in plan[1]:
+				values[column] = (word >> lsb) & mask
+			rows.append(values)
+		return dict((name, array(getattr(self, name).typecode, (values[i] for values in rows))) for i, name in enumerate(names))
+
+	def DecodeWithNumpy(self, words):
+		"""
+		Returns the decoded fields of the words as an array for each column, every word with the same plan at once
+		"""
+		image = numpy.frombuffer(words, dtype=numpy.uint32)
+		keys = ((image >> 27) << 1) | (image & 1)
+		names = ("Mnemonic",) + self.ByteFields + ("Condition", "Immediate", "HasImmediate")
+		columns = dict((name, numpy.empty(len(image), dtype=numpy.dtype(getattr(self, name).typecode))) for name in names)
+		for key in numpy.unique(keys):
+			selected = keys == key
+			plan = self.GetDecodePlan(int(key) >> 1, int(key) & 1)
+			if plan is None:
+				Common.Error(self.Lines[len(self) + int(numpy.argmax(selected))], "Unknown opcode: %s" % (int(key) >> 1))
+			defaults, fields = plan
+			for name in names:
+				columns[name][selected] = defaults[name]
+			selectedWords = image[selected]
+			for column, lsb, mask in fields:
+				columns[column][selected] = (selectedWords >> lsb) & mask
+		return dict((name, array(getattr(self, name).typecode, values.tostring())) for name, values in columns.iteritems())
+
+	def Assemble(self):
+		for row in xrange(0, len(self)):
+			self.MachineCode[row] = self[row].Assemble().MachineCodeValue
+
+	def GetLine(self, row):
+		return self.Lines[self.LineIndex[row]]
+
+	def GetMnemonic(self, row):
+		return self.MnemonicNames[self.Mnemonic[row]]
+
+	def GetRow(self, address):
+		"""
+		Find the row of the instruction at the machine code address, or None if there is no instruction there
+		"""
+		if self.AddressIndex is None:
+			self.AddressIndex = dict((address, row) for row, address in enumerate(self.MachineCodeAddress))
+		return self.AddressIndex.get(address)
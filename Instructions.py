@@ -1,63 +1,97 @@
+from collections import namedtuple
+
 import Common
 import InstructionBase
+import Lexer
+
+# Operand shapes: each operand of an instruction is decoded by a getter that sets its fields
+def RegisterOperand(*fields):
+	def Get(instruction, operand):
+		if operand.Type != Lexer.TokenType.Register:
+			Common.Error(instruction.Line, "Invalid operand for register: %s" % operand.Text)
+		for field in fields:
+			setattr(instruction, field, operand.Value)
+	return Get
+
+def ConstantOperand(instruction, operand):
+	if operand.Type != Lexer.TokenType.Immediate:
+		Common.Error(instruction.Line, "Constant must be a number: %s" % operand.Text)
+	instruction.Constant = operand.Value
+	instruction.Control = 1
+
+def EitherOperand(field):
+	def Get(instruction, operand):
+		if operand.Type == Lexer.TokenType.Register:
+			setattr(instruction, field, operand.Value)
+		else:
+			ConstantOperand(instruction, operand)
+	return Get
+
+def LabelOperand(instruction, operand):
+	instruction.LabelOperand = operand.Text
+	instruction.NeedsLabelAddress = True
+
+AddressOperand = InstructionBase.InstructionBase_.GetAddressOperand
+
+InstructionSpec = namedtuple("InstructionSpec", ["Mnemonic", "Class", "OpCode", "Shape", "Fields"])
 
 def DecodeLine(line):
-	instruction = None
-	label = None
-	if line.String.split()[0].endswith(':'):
-		mnemonic = line.String.split()[1].upper()
-	else:
-		mnemonic = line.String.split()[0].upper()
-
-	if mnemonic not in InstructionBase.InstructionList.keys():
-		Common.Error(line, "Unknown instruction: %s" % mnemonic)
+	tokens = Lexer.Tokenize(line)
+	mnemonic = tokens[1].Value if tokens[0].Type == Lexer.TokenType.Label else tokens[0].Value
 
-	opCode = InstructionBase.InstructionList[mnemonic]
-	instruction = GetInstructionClass(line, mnemonic, opCode)
+	spec = Registry.get(mnemonic)
+	if spec is None:
+		Common.Error(line, "Unknown instruction: %s" % mnemonic)
 
-	instruction.Decode()
-	return instruction
+	_, instructionClass, opCode, shape, fields = spec
+	return instructionClass(line, mnemonic, opCode, tokens).Decode(shape, fields)
 
 def Encode(word):
-	instruction = None
 	opCode = Common.SliceBits(word.Data, 31, 27)
 
-	if opCode not in InstructionBase.MnemonicList.keys():
+	spec = OpCodeRegistry.get(opCode)
+	if spec is None:
 		Common.Error(word.Line, "Unknown opcode: %s" % opCode)
 
-	mnemonic = InstructionBase.MnemonicList[opCode]
-	
-	instruction = GetInstructionClass(word.Line, mnemonic, opCode)
+	instruction = spec.Class(word.Line, spec.Mnemonic, opCode)
+	instruction.__dict__.update(spec.Fields)
 	instruction.MachineCodeAddress = word.Address
 	instruction.MachineCodeValue = word.Data
 	instruction.Encode()
 
 	return instruction
 
-def GetInstructionClass(line, mnemonic, opCode):
-	if (opCode == 0x0 or opCode == 0x1):
-		return LoadStore(line, mnemonic, opCode)
-	elif (opCode == 0x2 or opCode == 0x3 or opCode == 0x4):
-		return DataTransfer(line, mnemonic, opCode)
-	elif (opCode == 0x5 or opCode == 0x6 or opCode == 0x7):
-		return FlowControl(line, mnemonic, opCode)
-	elif (0x8 <= opCode and opCode <= 0xF) or (0x11 <= opCode and opCode <= 0x16) or (0x1A <= opCode and opCode <= 0x1B):
-		return LogicUnit(line, mnemonic, opCode)
-	elif (opCode == 0x10):
-		return RotateShift(line, mnemonic, opCode)
-	elif (opCode == 0xFF):
-		return Emulated(line, mnemonic, opCode)
-	else:
-		Common.Error(line, "Unknown opCode %i for instruction: %s" % (opCode, mnemonic))
-
 class LoadStore(InstructionBase.InstructionBase_):
 
-	def __init__(self, line, mnemonic, opCode):
-		super(LoadStore, self).__init__(line, mnemonic, opCode)
-		self.Ri = None
-		self.Rj = None
-		self.Control = None
-		self.Address = 0
+	OpCodes = (0x00, 0x01)
+	ImmediateField = "Address"
+
+	Layout = (	("OpCode", 27, 5),
+				("Ri", 22, 5),
+				("Rj", 17, 5),
+				("Control", 16, 1),
+				("Address", 0, 16) )
+	EncodeLayouts = (Layout, Layout)
+
+	Formats = {	"LD"	: ((RegisterOperand("Ri"), AddressOperand), {}),
+				"ST"	: ((AddressOperand, RegisterOperand("Ri")), {})
+			}
+
+	Defaults = {	"Ri"	: None,
+				"Rj"	: None,
+				"Control"	: None,
+				"Address"	: 0
+			}
+
+	# The addressing mode of an address operand by whether it has a register (Rj) and its control bit
+	AddressingModes = {	(True, 1)	: "register",
+						(True, 0)	: "indexed",
+						(False, 0)	: "relative",
+						(False, 1)	: "absolute" }
+
+	@classmethod
+	def GetAddressingMode(cls, rj, control):
+		return cls.AddressingModes[(rj != 0, control)]
 
 	def __str__(self):
 		s = "Instruction = {}\n".format(self.Mnemonic)
@@ -67,48 +101,8 @@ class LoadStore(InstructionBase.InstructionBase_):
 		s += "\tAddress = 0x{:04X}".format(self.Address)
 		return s
 
-	def Decode(self):
-		if len(self.SplitLine) == 4 or len(self.SplitLine) == 5:
-			if self.Mnemonic == "LD":
-				newSplitLine = self.SplitLine[0:2]
-				newSplitLine.append(self.SplitLine[2] + '+' + self.SplitLine[len(self.SplitLine)-1])
-				self.SplitLine = newSplitLine
-			elif self.Mnemonic == "ST":
-				newSplitLine = self.SplitLine[0:1]
-				newSplitLine.append(self.SplitLine[1] + '+' + self.SplitLine[len(self.SplitLine)-2])
-				newSplitLine.append(self.SplitLine[len(self.SplitLine)-1])
-				self.SplitLine = newSplitLine
-
-		try:
-			if len(self.SplitLine) != 3:
-				Common.Error(self.Line, "Wrong number of operands")
-			elif self.Mnemonic == "LD":
-				self.GetRegisterOperand(self.SplitLine[1], self.RegisterField.Ri)
-				self.GetAddressOperand(self.SplitLine[2])
-			elif self.Mnemonic == "ST":
-				self.GetAddressOperand(self.SplitLine[1])
-				self.GetRegisterOperand(self.SplitLine[2], self.RegisterField.Ri)
-			else:
-				Common.Error(self.Line, "Error in Decode")
-
-		except Exception:
-			Common.Error(self.Line, "Could not decode addressing mode")
-
-		return self
-
-	def Encode(self):
-		self.Ri = Common.SliceBits(self.MachineCodeValue, 26, 22)
-		self.Rj = Common.SliceBits(self.MachineCodeValue, 21, 17)
-		self.Control = Common.SliceBits(self.MachineCodeValue, 16)
-		self.Address = Common.SliceBits(self.MachineCodeValue, 15, 0)
-		return self
-
 	def Assemble(self):
-		self.MachineCode += Common.NumToBinaryString(self.OpCode, 5)
-		self.MachineCode += Common.NumToBinaryString(self.Ri, 5)
-		self.MachineCode += Common.NumToBinaryString(self.Rj, 5)
-		self.MachineCode += Common.NumToBinaryString(self.Control, 1)
-		self.MachineCode += Common.NumToBinaryString(self.Address, 16)
+		self.MachineCodeValue = self.Pack(self.Layout)
 		return self
 
 	def Disassemble(self):
@@ -125,12 +119,27 @@ class LoadStore(InstructionBase.InstructionBase_):
 
 class DataTransfer(InstructionBase.InstructionBase_):
 
-	def __init__(self, line, mnemonic, opCode):
-		super(DataTransfer, self).__init__(line, mnemonic, opCode)
-		self.Ri = 0
-		self.Rj = 0
-		self.Control = 0
-		self.Constant = 0
+	OpCodes = (0x02, 0x03, 0x04)
+
+	Layout = (	("OpCode", 27, 5),
+				("Ri", 22, 5),
+				("Rj", 17, 5),
+				("Control", 16, 1),
+				("Constant", 0, 16) )
+	EncodeLayouts = (Layout, Layout)
+
+	Formats = {	"CPY"	: ((RegisterOperand("Ri"), EitherOperand("Rj")), {}),
+				"CPYC"	: ((RegisterOperand("Ri"), ConstantOperand), {}),
+				"PUSH"	: ((EitherOperand("Rj"),), {}),
+				"PUSHC"	: ((ConstantOperand,), {}),
+				"POP"	: ((RegisterOperand("Ri"),), {})
+			}
+
+	Defaults = {	"Ri"	: 0,
+				"Rj"	: 0,
+				"Control"	: 0,
+				"Constant"	: 0
+			}
 
 	def __str__(self):
 		s = "Instruction = {}\n".format(self.Mnemonic)
@@ -140,46 +149,8 @@ class DataTransfer(InstructionBase.InstructionBase_):
 		s += "\tConstant = 0x{:04X}".format(self.Constant)
 		return s
 
-	def Decode(self):
-		if self.Mnemonic == "CPY":
-			if len(self.SplitLine) != 3:
-				Common.Error(self.Line, "Wrong number of operands")
-			self.GetRegisterOperand(self.SplitLine[1],self.RegisterField.Ri)
-			self.GetEitherOperand(self.SplitLine[2],self.RegisterField.Rj)
-		elif self.Mnemonic == "CPYC":
-			if len(self.SplitLine) != 3:
-				Common.Error(self.Line, "Wrong number of operands")
-			self.GetRegisterOperand(self.SplitLine[1],self.RegisterField.Ri)
-			self.GetConstantOperand(self.SplitLine[2])
-		elif self.Mnemonic == "PUSH":
-			if len(self.SplitLine) != 2:
-				Common.Error(self.Line, "Wrong number of operands")
-			self.GetEitherOperand(self.SplitLine[1],self.RegisterField.Rj)
-		elif self.Mnemonic == "PUSHC":
-			if len(self.SplitLine) != 2:
-				Common.Error(self.Line, "Wrong number of operands")
-			self.GetConstantOperand(self.SplitLine[1])
-		elif self.Mnemonic == "POP":
-			if len(self.SplitLine) != 2:
-				Common.Error(self.Line, "Wrong number of operands")
-			self.GetRegisterOperand(self.SplitLine[1],self.RegisterField.Ri)
-		else:
-			Common.Error(self.Line, "Error in Decode")
-		return self
-
-	def Encode(self):
-		self.Ri = Common.SliceBits(self.MachineCodeValue, 26, 22)
-		self.Rj = Common.SliceBits(self.MachineCodeValue, 21, 17)
-		self.Control = Common.SliceBits(self.MachineCodeValue, 16)
-		self.Constant = Common.SliceBits(self.MachineCodeValue, 15, 0)
-		return self
-
 	def Assemble(self):
-		self.MachineCode += Common.NumToBinaryString(self.OpCode, 5)
-		self.MachineCode += Common.NumToBinaryString(self.Ri, 5)
-		self.MachineCode += Common.NumToBinaryString(self.Rj, 5)
-		self.MachineCode += Common.NumToBinaryString(self.Control, 1)
-		self.MachineCode += Common.NumToBinaryString(self.Constant, 16)
+		self.MachineCodeValue = self.Pack(self.Layout)
 		return self
 
 	def Disassemble(self):
@@ -196,6 +167,23 @@ class DataTransfer(InstructionBase.InstructionBase_):
 
 class FlowControl(InstructionBase.InstructionBase_):
 
+	OpCodes = (0x05, 0x06, 0x07)
+	ImmediateField = "Address"
+	ConditionField = "CNVZ"
+
+	# Bit 17 is unused
+	Layout = (	("OpCode", 27, 5),
+				("Ri", 22, 5),
+				("CNVZ", 18, 4),
+				("Control", 16, 1),
+				("Address", 0, 16) )
+	EncodeLayouts = (Layout, Layout)
+
+	Formats = {	"CALL"	: ((LabelOperand,), {"Control": 1}),
+				"RET"	: ((), {"Address": 0}),
+				"RETI"	: ((), {"Address": 0, "Control": 1})
+			}
+
 	JumpConditions = { 	"JU"	: 0x0,
 						"JMP"	: 0x0,
 						"JC"	: 0x8,
@@ -224,14 +212,18 @@ class FlowControl(InstructionBase.InstructionBase_):
 						0x6	:	"JGE",
 						0x9	:	"JL" }
 
-	def __init__(self, line, mnemonic, opCode):
-		super(FlowControl, self).__init__(line, mnemonic, opCode)
-		self.Ri = 0
-		self.CNVZ = 0
-		self.Control = 0
-		self.Address = None
+	@classmethod
+	def GetFormat(cls, mnemonic):
+		if mnemonic in cls.JumpConditions:
+			return ((LabelOperand,), {"Control": 1, "CNVZ": cls.JumpConditions[mnemonic]})
+		return cls.Formats[mnemonic]
 
-		self.LabelOperand = None
+	Defaults = {	"Ri"	: 0,
+				"CNVZ"	: 0,
+				"Control"	: 0,
+				"Address"	: None,
+				"LabelOperand"	: None
+			}
 
 	def __str__(self):
 		s = "Instruction = {}\n".format(self.JumpConditionsMnemonic[self.CNVZ])
@@ -241,47 +233,19 @@ class FlowControl(InstructionBase.InstructionBase_):
 		s += "\tAddress = 0x{:04X}".format(self.Address)
 		return s
 		
-	def Decode(self):
-		if self.Mnemonic == "RET" or self.Mnemonic == "RETI" :
-			if len(self.SplitLine) != 1:
-				Common.Error(self.Line, "Wrong number of operands")
-			self.Address = 0
-			if self.Mnemonic == "RETI":
-				self.Control = 1
-		else:
-			if len(self.SplitLine) != 2:
-				Common.Error(self.Line, "Wrong number of operands")
-			self.NeedsLabelAddress = True
-			self.Control = 1
-			self.LabelOperand = self.SplitLine[1]
-			if self.Mnemonic in self.JumpConditions.keys():
-				self.CNVZ = self.JumpConditions[self.Mnemonic]
-			# else: it is a CALL instruction
-		return self
-
-	def Encode(self):
-		self.Ri = Common.SliceBits(self.MachineCodeValue, 26, 22)
-		self.CNVZ = Common.SliceBits(self.MachineCodeValue, 21, 18)
-		self.Control = Common.SliceBits(self.MachineCodeValue, 16)
-		self.Address = Common.SliceBits(self.MachineCodeValue, 15, 0)
-		return self
-
 	def Assemble(self):
-		self.MachineCode += Common.NumToBinaryString(self.OpCode, 5)
-		self.MachineCode += Common.NumToBinaryString(self.Ri, 5)
-		self.MachineCode += Common.NumToBinaryString(self.CNVZ, 4)
-		self.MachineCode += Common.NumToBinaryString(0, 1)
-		self.MachineCode += Common.NumToBinaryString(self.Control, 1)
-		self.MachineCode += Common.NumToBinaryString(self.Address, 16)
+		self.MachineCodeValue = self.Pack(self.Layout)
 		return self
 
+	@classmethod
+	def HasLabelOperand(cls, opCode):
+		return InstructionBase.MnemonicList[opCode] != "RET"
+
 	def Disassemble(self):
 		operands = []
-		if InstructionBase.MnemonicList[self.OpCode] == "CALL":
-			self.NeedsLabelOperand = True
-		elif InstructionBase.MnemonicList[self.OpCode] != "RET":
+		self.NeedsLabelOperand = self.HasLabelOperand(self.OpCode)
+		if self.NeedsLabelOperand and InstructionBase.MnemonicList[self.OpCode] != "CALL":
 			self.Mnemonic = self.JumpConditionsMnemonic[self.CNVZ]
-			self.NeedsLabelOperand = True
 
 		if not self.NeedsLabelOperand:
 			self.DisassembledString = self.BuildDisassembledString(self.Mnemonic, operands)
@@ -290,13 +254,44 @@ class FlowControl(InstructionBase.InstructionBase_):
 
 class LogicUnit(InstructionBase.InstructionBase_):
 
-	def __init__(self, line, mnemonic, opCode):
-		super(LogicUnit, self).__init__(line, mnemonic, opCode)
-		self.Ri = None
-		self.Rj = 0
-		self.Rk = None
-		self.Control = None
-		self.Constant = None
+	OpCodes = tuple(range(0x08, 0x10) + range(0x11, 0x17) + [0x1A, 0x1B])
+
+	# The control bit (bit 0) selects between the register and constant layouts
+	Layout = (	("OpCode", 27, 5),
+				("Ri", 22, 5),
+				("Rj", 17, 5) )
+	RegisterLayout = Layout + (("Rk", 12, 5),)
+	ConstantLayout = Layout + (("Constant", 1, 16), ("Control", 0, 1))
+	EncodeLayouts = (RegisterLayout + (("Control", 0, 1),), ConstantLayout)
+
+	Formats = {	"CMP"	: ((RegisterOperand("Rj"), EitherOperand("Rk")), {}),
+				"CMPC"	: ((RegisterOperand("Rj"), ConstantOperand), {}),
+				"NOT"	: ((RegisterOperand("Ri"), EitherOperand("Rj")), {}),
+				"NOTC"	: ((RegisterOperand("Ri"), ConstantOperand), {}),
+				"FTI"	: ((RegisterOperand("Ri"), EitherOperand("Rj")), {}),
+				"ITF"	: ((RegisterOperand("Ri"), EitherOperand("Rj")), {}),
+				"ADDC"	: ((RegisterOperand("Ri"), RegisterOperand("Rj"), ConstantOperand), {}),
+				"SUBC"	: ((RegisterOperand("Ri"), RegisterOperand("Rj"), ConstantOperand), {}),
+				"ANDC"	: ((RegisterOperand("Ri"), RegisterOperand("Rj"), ConstantOperand), {}),
+				"BICC"	: ((RegisterOperand("Ri"), RegisterOperand("Rj"), ConstantOperand), {}),
+				"ORC"	: ((RegisterOperand("Ri"), RegisterOperand("Rj"), ConstantOperand), {}),
+				"BISC"	: ((RegisterOperand("Ri"), RegisterOperand("Rj"), ConstantOperand), {}),
+				"XORC"	: ((RegisterOperand("Ri"), RegisterOperand("Rj"), ConstantOperand), {})
+			}
+
+	# Every other ALU instruction takes two registers and either a register or a constant
+	DefaultFormat = ((RegisterOperand("Ri"), RegisterOperand("Rj"), EitherOperand("Rk")), {})
+
+	@classmethod
+	def GetFormat(cls, mnemonic):
+		return cls.Formats.get(mnemonic, cls.DefaultFormat)
+
+	Defaults = {	"Ri"	: None,
+				"Rj"	: 0,
+				"Rk"	: None,
+				"Control"	: None,
+				"Constant"	: None
+			}
 
 	def __str__(self):
 		s = "Instruction = {}\n".format(self.Mnemonic)
@@ -308,66 +303,13 @@ class LogicUnit(InstructionBase.InstructionBase_):
 			s += "\n\tConstant = 0x{:04X}".format(self.Constant)
 		return s
 
-	def Decode(self):
-		if self.Mnemonic == "CMP":
-			if len(self.SplitLine) != 3:
-				Common.Error(self.Line, "Wrong number of operands")
-			self.GetRegisterOperand(self.SplitLine[1], self.RegisterField.Rj)
-			self.GetEitherOperand(self.SplitLine[2], self.RegisterField.Rk)
-		elif self.Mnemonic == "CMPC":
-			if len(self.SplitLine) != 3:
-				Common.Error(self.Line, "Wrong number of operands")
-			self.GetRegisterOperand(self.SplitLine[1], self.RegisterField.Rj)
-			self.GetConstantOperand(self.SplitLine[2])
-		elif self.Mnemonic == "NOT" or self.Mnemonic == "FTI" or self.Mnemonic == "ITF":
-			if len(self.SplitLine) != 3:
-				Common.Error(self.Line, "Wrong number of operands")
-			self.GetRegisterOperand(self.SplitLine[1], self.RegisterField.Ri)
-			self.GetEitherOperand(self.SplitLine[2], self.RegisterField.Rj)
-		elif self.Mnemonic == "NOTC":
-			if len(self.SplitLine) != 3:
-				Common.Error(self.Line, "Wrong number of operands")
-			self.GetRegisterOperand(self.SplitLine[1], self.RegisterField.Ri)
-			self.GetConstantOperand(self.SplitLine[2])
-		elif self.Mnemonic == "ADDC" or self.Mnemonic == "SUBC" or self.Mnemonic == "ANDC" or self.Mnemonic == "BICC" or self.Mnemonic == "ORC" or self.Mnemonic == "BISC" or self.Mnemonic == "XORC":
-			if len(self.SplitLine) != 4:
-				Common.Error(self.Line, "Wrong number of operands")
-			self.GetRegisterOperand(self.SplitLine[1], self.RegisterField.Ri)
-			self.GetRegisterOperand(self.SplitLine[2], self.RegisterField.Rj)
-			self.GetConstantOperand(self.SplitLine[3])
-		else:
-			if len(self.SplitLine) != 4:
-				Common.Error(self.Line, "Wrong number of operands")
-			self.GetRegisterOperand(self.SplitLine[1], self.RegisterField.Ri)
-			self.GetRegisterOperand(self.SplitLine[2], self.RegisterField.Rj)
-			self.GetEitherOperand(self.SplitLine[3], self.RegisterField.Rk)
-		return self
-
-	def Encode(self):
-		self.Ri = Common.SliceBits(self.MachineCodeValue, 26, 22)
-		self.Rj = Common.SliceBits(self.MachineCodeValue, 21, 17)
-		self.Control = Common.SliceBits(self.MachineCodeValue, 0)
-		if self.Control:
-			self.Constant = Common.SliceBits(self.MachineCodeValue, 16, 1)
-		else:
-			self.Rk = Common.SliceBits(self.MachineCodeValue, 16, 12)
-		return self
-
 	def Assemble(self):
-		self.MachineCode += Common.NumToBinaryString(self.OpCode, 5)
-		if (self.Ri != None):
-			self.MachineCode += Common.NumToBinaryString(self.Ri, 5)
-		else:
-			self.MachineCode += Common.NumToBinaryString(0, 5)
-		self.MachineCode += Common.NumToBinaryString(self.Rj, 5)
 		if (self.Rk != None):
-			self.MachineCode += Common.NumToBinaryString(self.Rk, 5)
-			self.MachineCode += Common.NumToBinaryString(0, 12)
+			self.MachineCodeValue = self.Pack(self.RegisterLayout)
 		elif (self.Constant != None and self.Control != None):
-			self.MachineCode += Common.NumToBinaryString(self.Constant, 16)
-			self.MachineCode += Common.NumToBinaryString(self.Control, 1)
+			self.MachineCodeValue = self.Pack(self.ConstantLayout)
 		else:
-			self.MachineCode += Common.NumToBinaryString(0, 17)
+			self.MachineCodeValue = self.Pack(self.Layout)
 		return self
 
 	def Disassemble(self):
@@ -387,6 +329,23 @@ class LogicUnit(InstructionBase.InstructionBase_):
 
 class RotateShift(InstructionBase.InstructionBase_):
 
+	OpCodes = (0x10,)
+	ConditionField = "Condition"
+
+	# The control bit (bit 0) selects between the register and constant layouts
+	RegisterLayout = (	("OpCode", 27, 5),
+						("Ri", 22, 5),
+						("Rj", 17, 5),
+						("Rk", 12, 5),
+						("Condition", 1, 3) )
+	ConstantLayout = (	("OpCode", 27, 5),
+						("Ri", 22, 5),
+						("Rj", 17, 5),
+						("Constant", 11, 6),
+						("Condition", 1, 3),
+						("Control", 0, 1) )
+	EncodeLayouts = (RegisterLayout + (("Control", 0, 1),), ConstantLayout)
+
 	Conditions = {  "SRL"	: 0x0,
 					"SRLC"	: 0x0,
 					"SLL"	: 0x1,
@@ -413,13 +372,16 @@ class RotateShift(InstructionBase.InstructionBase_):
 					0x7	:	"RLC",
 	}
 
-	def __init__(self, line, mnemonic, opCode):
-		super(RotateShift, self).__init__(line, mnemonic, opCode)
-		self.Ri = 0
-		self.Rj = 0
-		self.Rk = None
-		self.Constant = None
-		self.Condition = 0	
+	@classmethod
+	def GetFormat(cls, mnemonic):
+		return ((RegisterOperand("Ri"), RegisterOperand("Rj"), EitherOperand("Rk")), {"Condition": cls.Conditions[mnemonic]})
+
+	Defaults = {	"Ri"	: 0,
+				"Rj"	: 0,
+				"Rk"	: None,
+				"Constant"	: None,
+				"Condition"	: 0
+			}
 
 	def __str__(self):
 		s = "Instruction = {}\n".format(self.ConditionsMnemonic[self.Condition])
@@ -430,44 +392,11 @@ class RotateShift(InstructionBase.InstructionBase_):
 		s += "\tCondition = {}".format(self.Condition)
 		return s
 
-	def Decode(self):
-		if len(self.SplitLine) != 4:
-				Common.Error(self.Line, "Wrong number of operands")
-		elif self.Mnemonic in self.Conditions:
-			self.Condition = self.Conditions[self.Mnemonic]
-			self.GetRegisterOperand(self.SplitLine[1], self.RegisterField.Ri)
-			self.GetRegisterOperand(self.SplitLine[2], self.RegisterField.Rj)
-			self.GetEitherOperand(self.SplitLine[3], self.RegisterField.Rk)
-		else:
-			Common.Error(self.Line, "Error in Decode")
-		return self
-
-	def Encode(self):
-		self.Ri = Common.SliceBits(self.MachineCodeValue, 26, 22)
-		self.Rj = Common.SliceBits(self.MachineCodeValue, 21, 17)
-		self.Control = Common.SliceBits(self.MachineCodeValue, 0)
-		if self.Control:
-			self.Constant = Common.SliceBits(self.MachineCodeValue, 16, 11)
-		else:
-			self.Rk = Common.SliceBits(self.MachineCodeValue, 16, 12)
-		self.Condition = Common.SliceBits(self.MachineCodeValue, 3, 1)
-		return self
-
 	def Assemble(self):
-		self.MachineCode += Common.NumToBinaryString(self.OpCode, 5)
-		self.MachineCode += Common.NumToBinaryString(self.Ri, 5)
-		self.MachineCode += Common.NumToBinaryString(self.Rj, 5)
 		if self.Rk != None:
-			self.MachineCode += Common.NumToBinaryString(self.Rk, 5)
-			self.MachineCode += Common.NumToBinaryString(0, 8)
+			self.MachineCodeValue = self.Pack(self.RegisterLayout)
 		else:
-			self.MachineCode += Common.NumToBinaryString(self.Constant, 6)
-			self.MachineCode += Common.NumToBinaryString(0, 7)
-		self.MachineCode += Common.NumToBinaryString(self.Condition, 3)
-		if self.Rk != None:
-			self.MachineCode += Common.NumToBinaryString(0, 1)
-		else:
-			self.MachineCode += Common.NumToBinaryString(1, 1)
+			self.MachineCodeValue = self.Pack(self.ConstantLayout)
 		return self
 
 	def Disassemble(self):
@@ -482,70 +411,59 @@ class RotateShift(InstructionBase.InstructionBase_):
 
 class Emulated(InstructionBase.InstructionBase_):
 
-	def __init__(self, line, mnemonic, opCode):
-		super(Emulated, self).__init__(line, mnemonic, opCode)
-		self.Ri = 0
-		self.Rj = 0
-		self.Rk = None
-		self.Control = 0
-		self.Constant = None
-
-	def Decode(self):
-		if self.Mnemonic == "INC":
-			if len(self.SplitLine) != 2:
-				Common.Error(self.Line, "Wrong number of operands")
-			self.OpCode = InstructionBase.InstructionList["ADD"]
-			self.GetRegisterOperand(self.SplitLine[1], self.RegisterField.Ri)
-			self.Rj = self.Ri
-			self.Control = 1
-			self.Constant = 1
-		elif self.Mnemonic == "DEC":
-			if len(self.SplitLine) != 2:
-				Common.Error(self.Line, "Wrong number of operands")
-			self.OpCode = InstructionBase.InstructionList["SUB"]
-			self.GetRegisterOperand(self.SplitLine[1], self.RegisterField.Ri)
-			self.Rj = self.Ri
-			self.Control = 1
-			self.Constant = 1
-		elif self.Mnemonic == "CLR":
-			if len(self.SplitLine) != 2:
-				Common.Error(self.Line, "Wrong number of operands")
-			self.OpCode = InstructionBase.InstructionList["SUB"]
-			self.GetRegisterOperand(self.SplitLine[1], self.RegisterField.Ri)
-			self.Rj = self.Ri
-			self.Rk = self.Rj
-		elif self.Mnemonic == "CLRC":
-			self.OpCode = InstructionBase.InstructionList["BIC"]
-			# Ri and Rj are 0, the status register
-			self.Ri = 0
-			self.Rj = 0
-			self.Control = 1
-			self.Constant = 1
-		elif self.Mnemonic == "SETC":
-			self.OpCode = InstructionBase.InstructionList["OR"]
-			# Ri and Rj are 0, the status register
-			self.Ri = 0
-			self.Rj = 0
-			self.Control = 1
-			self.Constant = 1
-		elif self.Mnemonic == "NOP":
-			self.OpCode = InstructionBase.InstructionList["CPY"]
-			self.Ri = 0
-			self.Rj = 0
-		else:
-			Common.Error(self.Line, "Error in Decode")
-		return self
+	OpCodes = (0xFF,)
+
+	# Emulated instructions are assembled as the ALU instruction they stand for
+	Layout = LogicUnit.Layout
+	RegisterLayout = LogicUnit.RegisterLayout
+	ConstantLayout = LogicUnit.ConstantLayout
+
+	# Ri and Rj are 0 for CLRC and SETC, the status register
+	Formats = {	"INC"	: ((RegisterOperand("Ri", "Rj"),), {"OpCode": InstructionBase.InstructionList["ADD"], "Control": 1, "Constant": 1}),
+				"DEC"	: ((RegisterOperand("Ri", "Rj"),), {"OpCode": InstructionBase.InstructionList["SUB"], "Control": 1, "Constant": 1}),
+				"CLR"	: ((RegisterOperand("Ri", "Rj", "Rk"),), {"OpCode": InstructionBase.InstructionList["SUB"]}),
+				"CLRC"	: ((), {"OpCode": InstructionBase.InstructionList["BIC"], "Ri": 0, "Rj": 0, "Control": 1, "Constant": 1}),
+				"SETC"	: ((), {"OpCode": InstructionBase.InstructionList["OR"], "Ri": 0, "Rj": 0, "Control": 1, "Constant": 1}),
+				"NOP"	: ((), {"OpCode": InstructionBase.InstructionList["CPY"], "Ri": 0, "Rj": 0})
+			}
+
+	Defaults = {	"Ri"	: 0,
+				"Rj"	: 0,
+				"Rk"	: None,
+				"Control"	: 0,
+				"Constant"	: None
+			}
 
 	def Assemble(self):
-		self.MachineCode += Common.NumToBinaryString(self.OpCode, 5)
-		self.MachineCode += Common.NumToBinaryString(self.Ri, 5)
-		self.MachineCode += Common.NumToBinaryString(self.Rj, 5)
 		if (self.Rk != None):
-			self.MachineCode += Common.NumToBinaryString(self.Rk, 5)
-			self.MachineCode += Common.NumToBinaryString(0, 12)
+			self.MachineCodeValue = self.Pack(self.RegisterLayout)
 		elif (self.Constant != None):
-			self.MachineCode += Common.NumToBinaryString(self.Constant, 16)
-			self.MachineCode += Common.NumToBinaryString(self.Control, 1)
+			self.MachineCodeValue = self.Pack(self.ConstantLayout)
 		else:
-			self.MachineCode += Common.NumToBinaryString(0, 17)
+			self.MachineCodeValue = self.Pack(self.Layout)
 		return self
+
+
+InstructionClasses = (LoadStore, DataTransfer, FlowControl, LogicUnit, RotateShift, Emulated)
+
+def BuildRegistry():
+	classes = {}
+	for instructionClass in InstructionClasses:
+		for opCode in instructionClass.OpCodes:
+			classes[opCode] = instructionClass
+
+	registry = {}
+	for mnemonic, opCode in InstructionBase.InstructionList.iteritems():
+		shape, fields = classes[opCode].GetFormat(mnemonic)
+		fields = dict(classes[opCode].Defaults, **fields)
+		registry[mnemonic] = InstructionSpec(mnemonic, classes[opCode], opCode, shape, fields)
+
+	opCodeRegistry = {}
+	for opCode, mnemonic in InstructionBase.MnemonicList.iteritems():
+		if opCode in classes:
+			opCodeRegistry[opCode] = InstructionSpec(mnemonic, classes[opCode], opCode, (), classes[opCode].Defaults)
+
+	return registry, opCodeRegistry
+
+# Maps a mnemonic to its decoding spec, and an opcode to its encoding spec
+Registry, OpCodeRegistry = BuildRegistry()
@@ -0,0 +1,83 @@
+import copy
+import json
+
+import Common
+import InstructionBase
+import Instructions
+
+"""
+The cycles each instruction takes, shared by the cost analyzer and the peephole pass. A latency table is a dict of
+the cycles of each mnemonic, load/store by addressing mode and jumps by whether they are taken.
+"""
+
+# The cycles of each instruction, by mnemonic. Any mnemonic that is not listed takes the default
+DefaultLatencies = {	"default"	: 1,
+						"LD"	: {"register" : 2, "absolute" : 2, "indexed" : 3, "relative" : 3},
+						"ST"	: {"register" : 2, "absolute" : 2, "indexed" : 3, "relative" : 3},
+						"JMP"	: {"taken" : 3, "not_taken" : 1},
+						"CALL"	: 3,
+						"RET"	: 3,
+						"RETI"	: 3,
+						"PUSH"	: 2,
+						"POP"	: 2,
+						"MUL"	: 4,
+						"DIV"	: 34,
+						"FA"	: 4,
+						"FS"	: 4,
+						"FM"	: 5,
+						"FD"	: 20,
+						"FTI"	: 2,
+						"ITF"	: 2 }
+
+JumpOpCode = InstructionBase.InstructionList["JMP"]
+
+def LoadLatencies(filePath):
+	"""
+	Returns the default latency table updated with the table in a JSON file
+	"""
+	latencies = copy.deepcopy(DefaultLatencies)
+	try:
+		with open(filePath) as _file:
+			table = json.load(_file)
+	except (IOError, ValueError) as e:
+		Common.Error("Cannot read the latency table {}: {}".format(filePath, e))
+	if not isinstance(table, dict):
+		Common.Error("The latency table {} must be an object of the cycles of each mnemonic".format(filePath))
+
+	mnemonics = set(InstructionBase.MnemonicList.values() + ["RETI", "default"])
+	for mnemonic, cycles in table.iteritems():
+		mnemonic = str(mnemonic).upper() if mnemonic != "default" else mnemonic
+		if mnemonic not in mnemonics:
+			Common.Error("Unknown mnemonic in the latency table {}: {}".format(filePath, mnemonic))
+		if isinstance(latencies.get(mnemonic), dict):
+			if not isinstance(cycles, dict) or not set(cycles).issubset(latencies[mnemonic]):
+				Common.Error("The cycles of {} in the latency table {} must be an object of: {}".format(mnemonic, filePath, ", ".join(sorted(latencies[mnemonic]))))
+			latencies[mnemonic].update(cycles)
+		else:
+			latencies[mnemonic] = cycles
+	for mnemonic, cycles in latencies.iteritems():
+		for value in (cycles.values() if isinstance(cycles, dict) else [cycles]):
+			if type(value) is not int or value < 0:
+				Common.Error("The cycles of {} in the latency table {} must be a whole number: {}".format(mnemonic, filePath, value))
+	return latencies
+
+def GetLatency(latencies, mnemonic, mode=None):
+	cycles = latencies.get(mnemonic, latencies["default"])
+	return cycles[mode] if isinstance(cycles, dict) else cycles
+
+def GetCycles(latencies, opCode, rj, control, condition):
+	"""
+	Returns the cycles of an instruction when it runs on to the next instruction and when it jumps
+	"""
+	mnemonic = InstructionBase.MnemonicList.get(opCode)
+	if mnemonic in ("LD", "ST"):
+		cycles = GetLatency(latencies, mnemonic, Instructions.LoadStore.GetAddressingMode(rj, control))
+	elif opCode == JumpOpCode:
+		taken = GetLatency(latencies, "JMP", "taken")
+		# An unconditional jump is always taken
+		return (GetLatency(latencies, "JMP", "not_taken") if condition else taken), taken
+	elif mnemonic == "RET" and control:
+		cycles = GetLatency(latencies, "RETI")
+	else:
+		cycles = GetLatency(latencies, mnemonic)
+	return cycles, cycles
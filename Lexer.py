@@ -0,0 +1,96 @@
+from collections import namedtuple
+import re
+
+import Common
+
+"""
+Splits a line of assembly into typed tokens in a single pass.
+
+A tokenized line is a list of the form:
+	[Label] Mnemonic Operand*
+where each operand is a Register, Immediate, PcRelative, Memory or Identifier token.
+Memory tokens hold a tuple of their terms (Register, Immediate, PcRelative or Identifier
+tokens) as their value, e.g. M[R1 + 0x100] -> (Register(1), Immediate(0x100))
+"""
+
+TokenType = Common.Enum("Label", "Mnemonic", "Register", "Immediate", "Memory", "PcRelative", "Identifier")
+
+Token = namedtuple("Token", ["Type", "Value", "Text"])
+
+_PieceRegex = re.compile(r"[Mm]\[[^\]]*\]|[^\s,+\[\]]+(?:\s*\+\s*[^\s,+\[\]]+)+|[^\s,]+")
+
+_RegisterRegex = re.compile(r"[Rr](\d+)$")
+
+_IdentifierRegex = re.compile(r"(?<![\w.])[A-Za-z_]\w*")
+
+_HeadRegex = re.compile(r"\s*(?:[^\s,:]+:)?\s*[^\s,]*")
+
+_MnemonicCache = {}
+_OperandCache = {}
+
+def Operand(text):
+	"""
+	Classify a single operand such as R1, PC, 0x10, someLabel or M[R1 + 0x10]
+	"""
+	token = _OperandCache.get(text)
+	if token is None:
+		match = _RegisterRegex.match(text)
+		if match:
+			token = Token(TokenType.Register, int(match.group(1)), text)
+		elif text.upper() == "PC":
+			token = Token(TokenType.PcRelative, 0, text)
+		elif text[:2] in ("M[", "m[") or '+' in text:
+			terms = text[2:-1] if text.endswith(']') else text
+			token = Token(TokenType.Memory, tuple(Operand(term.strip()) for term in terms.split('+')), text)
+		else:
+			try:
+				token = Token(TokenType.Immediate, int(text, 0), text)
+			except ValueError:
+				token = Token(TokenType.Identifier, text, text)
+		_OperandCache[text] = token
+	return token
+
+def Mnemonic(text):
+	token = _MnemonicCache.get(text)
+	if token is None:
+		token = _MnemonicCache[text] = Token(TokenType.Mnemonic, text.upper(), text)
+	return token
+
+def Tokenize(line):
+	string = line.String
+	if '[' in string or '+' in string:
+		pieces = _PieceRegex.findall(string)
+	else:
+		pieces = string.replace(',', ' ').split()
+
+	if pieces and pieces[0][-1] == ':':
+		if len(pieces) == 1:
+			Common.Error(line, "Label must be on the same line as an instruction")
+		tokens = [Token(TokenType.Label, pieces[0][:-1], pieces[0]), _MnemonicCache.get(pieces[1]) or Mnemonic(pieces[1])]
+		del pieces[:2]
+	elif pieces:
+		tokens = [_MnemonicCache.get(pieces[0]) or Mnemonic(pieces[0])]
+		del pieces[0]
+	else:
+		Common.Error(line, "Could not tokenize line")
+
+	for piece in pieces:
+		tokens.append(_OperandCache.get(piece) or Operand(piece))
+	return tokens
+
+def Substitute(string, table):
+	"""
+	Replace every whole identifier in the string that is a key of the table with its value
+	"""
+	if not table:
+		return string
+	return _IdentifierRegex.sub(lambda match: table.get(match.group(0), match.group(0)), string)
+
+def SubstituteOperands(string, table):
+	"""
+	Substitute only the operands of a line of code, leaving its label and mnemonic untouched
+	"""
+	if not table:
+		return string
+	head = _HeadRegex.match(string).end()
+	return string[:head] + Substitute(string[head:], table)
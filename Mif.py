@@ -1,4 +1,26 @@
+import binascii
+import mmap
+import struct
+
 import Common
+import Profile
+
+# The output formats, altera and cadence are MIF files and the rest are compact images of the memory
+Formats = ["altera", "cadence", "bin", "ihex", "readmemh"]
+
+Extensions = {	"altera"	: ".mif",
+				"cadence"	: ".mif",
+				"bin"		: ".bin",
+				"ihex"		: ".hex",
+				"readmemh"	: ".mem",
+				}
+
+# Packs a little-endian word of each number of bytes
+PackFormats = {	1 : struct.Struct("<B"),
+				2 : struct.Struct("<H"),
+				4 : struct.Struct("<I"),
+				8 : struct.Struct("<Q"),
+				}
 
 class MifLine(object):
 
@@ -23,6 +45,11 @@ class MifLine(object):
 			print e
 			raise e
 
+	def GetDataAsInt(self):
+		if type(self.Data) is str:
+			return int(self.Data, 16)
+		return self.Data
+
 	def Altera(self, wordWidth, memWidth):
 		string = ""
 		if self.Address is not None:
@@ -31,7 +58,7 @@ class MifLine(object):
 			else:
 				string += Common.NumToHexString(self.Address, 4)
 		if self.Data is not None:
-			string += " : %s;" % self.Data.zfill(8)
+			string += " : {:0{pad}X};".format(self.GetDataAsInt(), pad=wordWidth/4)
 		if self.Comment:
 			string += " %% %s %%" % self.Comment
 
@@ -40,9 +67,10 @@ class MifLine(object):
 	def Cadence(self, wordWidth, memWidth):
 		strings = []
 		piecesToSplit = wordWidth / memWidth
+		data = self.GetDataAsInt()
 		for i in range(0, piecesToSplit):
 			if self.Data is not None:
-				dataToWrite = (self.Data >> i*memWidth) & ((2**memWidth)-1)
+				dataToWrite = (data >> i*memWidth) & ((2**memWidth)-1)
 			strings.append("{}    {} {}".format("@{:04X}".format(self.Address+i) if self.Address is not None else "",
 								   "{:0{pad}X}".format(dataToWrite, pad=memWidth/4) if self.Data is not None else "",
 								   "// {}".format(self.Comment) if self.Comment and i==0 else ""))
@@ -55,11 +83,20 @@ class MifLine(object):
 		elif format_ == "cadence":
 			return self.Cadence(wordWidth, memWidth)
 		else:
-			Common.Error(errorMsg="Invalid format")
+			Common.Error("Invalid format")
 
 
 class Mif(object):
 
+	# The most values written to the file at once when stuffing
+	StuffChunk = 2**16
+
+	# The most lines joined together before they are written to the file
+	WriteChunk = 2**12
+
+	# The hex string of every value by the width of the value, see GetHexTable
+	HexTables = {}
+
 	def __init__(self, format_, output, width, addressWidth, memoryWidth, headers = [], stuffWith=None):
 		self.Format = format_
 		self.OutputFile = output
@@ -72,6 +109,7 @@ class Mif(object):
 		self.Data = []
 		self.StuffWith = stuffWith
 		self.AddressesWritten = set()
+		self.WrittenRanges = [] # the [start, end) addresses covered by each line written
 
 	def AddData(self, data):
 		if data:
@@ -80,48 +118,318 @@ class Mif(object):
 
 	def AddAddress(self, address):
 		if address in self.AddressesWritten:
-			Common.Error(errorMsg="Address already written to: {}".format(address))
+			Common.Error("Address already written to: {}".format(address))
 		else:
 			self.AddressesWritten.add(address)
+			# Each line holds a whole word, which takes up Width/MemoryWidth addresses
+			self.WrittenRanges.append((address, address + self.Width/self.MemoryWidth))
+
+	def GetUnwrittenRanges(self):
+		"""
+		Returns the [start, end) ranges of the addresses that have not been written, in order
+		"""
+		ranges = []
+		nextAddress = 0
+		for start, end in sorted(self.WrittenRanges):
+			if start > nextAddress:
+				ranges.append((nextAddress, min(start, self.Depth)))
+			nextAddress = max(nextAddress, end)
+		if nextAddress < self.Depth:
+			ranges.append((nextAddress, self.Depth))
+		return [(start, end) for start, end in ranges if start < end]
+
+	@staticmethod
+	def GetHexTable(width):
+		"""
+		Returns a list of the hex string of every value of the width, or None if the width is too large for a table
+		"""
+		if width > 16:
+			return None
+		if width not in Mif.HexTables:
+			Mif.HexTables[width] = ["{:0{pad}X}".format(value, pad=width/4) for value in xrange(0, 2**width)]
+		return Mif.HexTables[width]
+
+	def Serialize(self):
+		"""
+		Yields the text of each line of data, the same as MifLine.ToString but a whole word at a time with one
+		string format and a lookup table for the hex of each memory word
+		"""
+		pieces = self.Width / self.MemoryWidth
+		if self.Format == "cadence":
+			hexTable = self.GetHexTable(self.MemoryWidth)
+			mask = (2**self.MemoryWidth)-1
+			rest = [(i*self.MemoryWidth, i) for i in range(1, pieces)]
+			template = "@%04X    %s %s\n" + "@%04X    %s \n"*len(rest)
+			commentFormat = "// %s"
+		else:
+			hexTable = self.GetHexTable(self.Width)
+			mask = (2**self.Width)-1
+			rest = []
+			template = "%04X : %s;%s\n"
+			commentFormat = " %% %s %%"
+		wordFormat = "%%0%iX" % (self.MemoryWidth/4 if self.Format == "cadence" else self.Width/4)
+
+		addressCounter = 0
+		for mifLine in self.Data:
+			if mifLine.Data is None and mifLine.Address is None:
+				# This is just a comment
+				yield mifLine.ToString(self.Format, wordWidth=self.Width, memWidth=self.MemoryWidth).strip()+'\n'
+				continue
+			if mifLine.Address is None:
+				mifLine.Address = addressCounter
+				addressCounter += pieces
+
+			if mifLine.Data is None or type(mifLine.Address) is str or pieces < 1:
+				# Only lines that hold a word with a numeric address have a fast path
+				yield mifLine.ToString(self.Format, wordWidth=self.Width, memWidth=self.MemoryWidth)+'\n'
+			else:
+				address = mifLine.Address
+				data = mifLine.Data if type(mifLine.Data) is not str else int(mifLine.Data, 16)
+				comment = commentFormat % mifLine.Comment if mifLine.Comment else ""
+				if hexTable is not None:
+					values = [address, hexTable[data & mask], comment]
+					for shift, offset in rest:
+						values += (address+offset, hexTable[(data >> shift) & mask])
+				else:
+					values = [address, wordFormat % (data & mask), comment]
+					for shift, offset in rest:
+						values += (address+offset, wordFormat % ((data >> shift) & mask))
+				yield template % tuple(values)
+			self.AddAddress(mifLine.GetAddressAsInt())
+
+	def WriteStuffing(self, _file):
+		"""
+		Write the stuff value to every address that has not been written, a range at a time
+		"""
+		if self.Format == "altera":
+			value = "{:0{pad}X}".format(self.StuffWith & ((2**self.Width)-1), pad=self.Width/4)
+			for start, end in self.GetUnwrittenRanges():
+				if end - start == 1:
+					_file.write("{:04X} : {};\n".format(start, value))
+				else:
+					_file.write("[{:04X}..{:04X}] : {};\n".format(start, end-1, value))
+		else:
+			# An address line is followed by the value for each address in the range, as $readmemh allows
+			value = "{:0{pad}X}\n".format(self.StuffWith & ((2**self.MemoryWidth)-1), pad=self.MemoryWidth/4)
+			for start, end in self.GetUnwrittenRanges():
+				_file.write("@{:04X}\n".format(start))
+				for chunk in range(start, end, self.StuffChunk):
+					_file.write(value * (min(end, chunk+self.StuffChunk) - chunk))
+
+	def GetWords(self):
+		"""
+		Returns a list of (address, data) of each line of data as ints, with the same addresses as Serialize
+		"""
+		pieces = self.Width / self.MemoryWidth
+		words = []
+		addressCounter = 0
+		for mifLine in self.Data:
+			if mifLine.Data is None and mifLine.Address is None:
+				continue
+			if mifLine.Address is None:
+				mifLine.Address = addressCounter
+				addressCounter += pieces
+			if mifLine.Data is not None:
+				words.append((mifLine.GetAddressAsInt(), mifLine.GetDataAsInt()))
+			self.AddAddress(mifLine.GetAddressAsInt())
+		return words
+
+	def GetByteCount(self):
+		"""
+		Returns the number of bytes in each memory word, it is an error if memory words are not whole bytes
+		"""
+		if self.MemoryWidth % 8 or self.Width % 8:
+			Common.Error("The {} format needs the width and memory width to be a multiple of 8".format(self.Format))
+		return self.MemoryWidth / 8
+
+	def GetImageSize(self):
+		"""
+		Returns the number of memory words in the image: the whole memory when stuffing, otherwise up to the last address written
+		"""
+		if self.StuffWith is not None:
+			return self.Depth
+		return max(end for start, end in self.WrittenRanges) if self.WrittenRanges else 0
+
+	def GetStuffBytes(self, byteCount):
+		value = self.StuffWith & ((2**self.MemoryWidth)-1)
+		return bytearray((value >> i*8) & 0xFF for i in range(0, byteCount))
+
+	def FillImage(self, image, words, byteCount):
+		"""
+		Write each word into a buffer of the memory image, little-endian
+		image - a bytearray or mmap as big as the image
+		"""
+		if self.StuffWith is not None:
+			stuff = bytes(self.GetStuffBytes(byteCount))
+			chunk = stuff * self.StuffChunk
+			for start in range(0, len(image), len(chunk)):
+				end = min(len(image), start+len(chunk))
+				image[start:end] = chunk[:end-start]
 
+		wordBytes = self.Width / 8
+		packFormat = PackFormats.get(wordBytes)
+		for address, data in words:
+			offset = address * byteCount
+			data &= (2**self.Width)-1
+			if packFormat is not None:
+				packFormat.pack_into(image, offset, data)
+			else:
+				image[offset:offset+wordBytes] = bytes(bytearray((data >> i*8) & 0xFF for i in range(0, wordBytes)))
+
+	def WriteBinary(self):
+		"""
+		Write the memory image as raw little-endian bytes through a memory-mapped file, the addresses that are not
+		written are zero unless stuffing
+		"""
+		byteCount = self.GetByteCount()
+		words = self.GetWords()
+		size = self.GetImageSize() * byteCount
+		with open(self.OutputFile, "w+b") as _file:
+			_file.truncate(size)
+			if size == 0:
+				return
+			image = mmap.mmap(_file.fileno(), size)
+			try:
+				self.FillImage(image, words, byteCount)
+				image.flush()
+			finally:
+				image.close()
+
+	@staticmethod
+	def IntelHexRecord(recordType, address, data):
+		record = bytearray([len(data), (address >> 8) & 0xFF, address & 0xFF, recordType]) + data
+		return ":{}{:02X}\n".format(binascii.hexlify(bytes(record)).upper(), -sum(record) & 0xFF)
+
+	def WriteIntelHex(self):
+		"""
+		Write the memory image as Intel HEX data records of up to 16 bytes with byte addresses, an extended linear
+		address record starts each 64K of bytes
+		"""
+		byteCount = self.GetByteCount()
+		words = self.GetWords()
+		image = bytearray(self.GetImageSize() * byteCount)
+		self.FillImage(image, words, byteCount)
+
+		if self.StuffWith is not None:
+			ranges = [(0, len(image))]
+		else:
+			ranges = []
+			for start, end in sorted(self.WrittenRanges):
+				start, end = start*byteCount, end*byteCount
+				if ranges and start <= ranges[-1][1]:
+					ranges[-1] = (ranges[-1][0], max(ranges[-1][1], end))
+				else:
+					ranges.append((start, end))
+
+		records = []
+		upper = 0
+		for start, end in ranges:
+			address = start
+			while address < end:
+				if address >> 16 != upper:
+					upper = address >> 16
+					records.append(self.IntelHexRecord(4, 0, bytearray([upper >> 8, upper & 0xFF])))
+				# A record cannot cross into the next 64K
+				recordEnd = min(end, address+16, (upper+1) << 16)
+				records.append(self.IntelHexRecord(0, address & 0xFFFF, image[address:recordEnd]))
+				address = recordEnd
+		records.append(self.IntelHexRecord(1, 0, bytearray()))
+
+		with open(self.OutputFile, "w") as _file:
+			_file.write("".join(records))
+
+	def WriteReadMemH(self):
+		"""
+		Write a $readmemh file with a whole word on each line, addressed by word. An @address line is written
+		wherever a word does not follow the one before it.
+		"""
+		pieces = self.Width / self.MemoryWidth
+		mask = (2**self.MemoryWidth)-1
+		stuffWord = 0
+		if self.StuffWith is not None:
+			for i in range(0, pieces):
+				stuffWord |= (self.StuffWith & mask) << i*self.MemoryWidth
+
+		# A word can start at any memory address, so split it into memory words and join them by word address
+		image = {}
+		wordMask = (2**self.Width)-1
+		for address, data in self.GetWords():
+			if address % pieces == 0 and address / pieces not in image:
+				# Most words line up with a word address
+				image[address / pieces] = data & wordMask
+				continue
+			for i in range(0, pieces):
+				wordAddress, offset = divmod(address+i, pieces)
+				shift = offset*self.MemoryWidth
+				word = image.get(wordAddress, stuffWord)
+				image[wordAddress] = (word & ~(mask << shift)) | (((data >> i*self.MemoryWidth) & mask) << shift)
+
+		if self.StuffWith is not None:
+			addresses = xrange(0, max(self.Depth / pieces, max(image) + 1 if image else 0))
+		else:
+			addresses = sorted(image)
+
+		hexTable = self.GetHexTable(self.Width)
+		wordFormat = "%%0%iX\n" % ((self.Width+3)/4)
+		with open(self.OutputFile, "w") as _file:
+			_file.write("// Assembled for RISC_721 by Connor Goldberg\n")
+			for line in self.Headers:
+				_file.write("// {}\n".format(line))
+			_file.write("\n")
+
+			chunk = []
+			nextAddress = None
+			for wordAddress in addresses:
+				if wordAddress != nextAddress:
+					chunk.append("@%04X\n" % wordAddress)
+				word = image.get(wordAddress, stuffWord)
+				chunk.append(hexTable[word] + "\n" if hexTable is not None else wordFormat % word)
+				nextAddress = wordAddress + 1
+				if len(chunk) >= self.WriteChunk:
+					_file.write("".join(chunk))
+					chunk = []
+			_file.write("".join(chunk))
+
+	@Profile.Stage("Mif.Write")
 	def Write(self):
 		if self.Data:
-			with open(self.OutputFile, "w+") as _file:
-				_file.seek(0)
-				_file.truncate() # Clears out the file if it exists
-				_file.write("{} Assembled for RISC_721 by Connor Goldberg\n".format(MifLine.Comment[self.Format]))
-
-				for line in self.Headers:
-					_file.write("{} {}\n".format(MifLine.Comment[self.Format], line))
-
-				if self.Format == "altera":
-					_file.write("\nWIDTH = %s;\n" % str(self.Width))
-					_file.write("DEPTH = %s;\n" % str(self.Depth)) #TODO: Check to see if number of instts is less than depth
-					_file.write("ADDRESS_RADIX = HEX;\n")
-					_file.write("DATA_RADIX = %s;\n" % str(self.DataRadix))
-					_file.write("\nCONTENT BEGIN\n")
-				
-				_file.write("\n")
-
-				addressCounter = 0
-				for mifLine in self.Data:
-					if mifLine.Data is None and mifLine.Address is None:
-						# This is just a comment
-						_file.write(mifLine.ToString(self.Format).strip()+'\n')
-					elif mifLine.Address is not None:
-						# If there is data and an address
-						_file.write(mifLine.ToString(self.Format, wordWidth=self.Width, memWidth=self.MemoryWidth)+'\n')
-						self.AddAddress(mifLine.GetAddressAsInt())
-					else:
-						mifLine.Address = addressCounter
-						_file.write(mifLine.ToString(self.Format, wordWidth=self.Width, memWidth=self.MemoryWidth)+'\n')
-						self.AddAddress(mifLine.GetAddressAsInt())
-						addressCounter += (self.Width / self.MemoryWidth)
-				
-				if self.StuffWith:
-					for a in range(0, self.Depth):
-						if a not in self.AddressesWritten:
-							_file.write(MifLine(data=Common.NumToHexString(self.StuffWith).upper(), address=a).ToString(self.Format)+'\n')
-
-				if self.Format == "altera":
-					_file.write("\nEND;\n")
+			if self.Format == "bin":
+				self.WriteBinary()
+			elif self.Format == "ihex":
+				self.WriteIntelHex()
+			elif self.Format == "readmemh":
+				self.WriteReadMemH()
+			else:
+				self.WriteMif()
+
+	def WriteMif(self):
+		with open(self.OutputFile, "w+") as _file:
+			_file.seek(0)
+			_file.truncate() # Clears out the file if it exists
+			_file.write("{} Assembled for RISC_721 by Connor Goldberg\n".format(MifLine.Comment[self.Format]))
+
+			for line in self.Headers:
+				_file.write("{} {}\n".format(MifLine.Comment[self.Format], line))
+
+			if self.Format == "altera":
+				_file.write("\nWIDTH = %s;\n" % str(self.Width))
+				_file.write("DEPTH = %s;\n" % str(self.Depth)) #TODO: Check to see if number of instts is less than depth
+				_file.write("ADDRESS_RADIX = HEX;\n")
+				_file.write("DATA_RADIX = %s;\n" % str(self.DataRadix))
+				_file.write("\nCONTENT BEGIN\n")
+			
+			_file.write("\n")
+
+			chunk = []
+			for text in self.Serialize():
+				chunk.append(text)
+				if len(chunk) >= self.WriteChunk:
+					_file.write("".join(chunk))
+					chunk = []
+			_file.write("".join(chunk))
+			
+			if self.StuffWith is not None:
+				self.WriteStuffing(_file)
+
+			if self.Format == "altera":
+				_file.write("\nEND;\n")
@@ -1,10 +1,22 @@
+from array import array
+import mmap
+import multiprocessing
 import os
-from collections import OrderedDict
 import re
+import sys
+from collections import OrderedDict
 
 import Common
+import DataMemory
+import IncludeCache
 import Instructions
+import InstructionTable
+import Lexer
 import Mif
+import Peephole
+import Profile
+import Reachability
+import SymbolTable
 
 class Line(object):
 
@@ -34,9 +46,242 @@ class BinaryData(object):
 		return "{}(0x{:X}, 0x{:X})".format(self.__class__.__name__, self.Address, self.Data)
 
 
+class MifReader(object):
+	"""
+	Reads the words of a mif file without splitting it into lines. The file is memory-mapped and its records are
+	scanned with a single regex, and each word is put together from the values of the file as it is read.
+	Only the line number and offset of each word are kept, its Line is built when it is asked for.
+	"""
+
+	def __init__(self, filePath, width, memoryWidth):
+		self.FilePath = filePath
+		self.FileName = os.path.basename(filePath)
+		self.Width = width
+		self.MemoryWidth = memoryWidth
+		self.ValueWidth = memoryWidth # the width of each value in the file
+		self.Map = None
+
+		# The address, value, line number and line offset of each word
+		self.Addresses = array('l')
+		self.Words = array('I' if width <= 32 else 'L')
+		self.LineNumbers = array('l')
+		self.LineOffsets = array('l')
+
+		# (first address, last address, value, line number, line offset) of each range of addresses that all have
+		# the same value, these are not put together into words
+		self.Ranges = []
+
+		# The word being put together from the values
+		self.Word = 0
+		self.Piece = 0
+
+	def __len__(self):
+		return len(self.Words)
+
+	def __getitem__(self, index):
+		return self.GetLine(self.LineNumbers[index], self.LineOffsets[index])
+
+	@staticmethod
+	def RemoveComment(string):
+		if ';' in string:
+			string = string[:string.index(';')]
+		if "//" in string:
+			string = string[:string.index("//")]
+		return string
+
+	def GetLine(self, number, offset):
+		"""
+		Returns the Line at an offset in the file, without its comment
+		"""
+		end = self.Map.find("\n", offset)
+		return Line(self.FileName, number, self.RemoveComment(self.Map[offset:end if end != -1 else len(self.Map)].strip()))
+
+	@Profile.Stage("MifReader.Read")
+	def Read(self):
+		if os.path.isfile(self.FilePath) and os.path.getsize(self.FilePath) != 0:
+			with open(self.FilePath, "rb") as _file:
+				self.Map = mmap.mmap(_file.fileno(), 0, access=mmap.ACCESS_READ)
+			self.ReadRecords()
+			if self.Piece:
+				Common.Error(self[len(self.Addresses)-1], "The last word only has {} of its {} values".format(self.Piece, self.Width / self.ValueWidth))
+		return self
+
+	def ReadRecords(self):
+		Common.Error("Reading this mif format is not implemented")
+
+	def GetRange(self, address):
+		"""
+		Returns the range record that holds the address, or None
+		"""
+		for first, last, value, lineNumber, offset in self.Ranges:
+			if first <= address <= last:
+				return (first, last, value, lineNumber, offset)
+		return None
+
+	def AddValue(self, address, value, lineNumber, offset):
+		"""
+		Add the next value of the file to the word being put together, the first value of a word gives its address
+		"""
+		if self.Piece == 0:
+			self.Addresses.append(address)
+			self.LineNumbers.append(lineNumber)
+			self.LineOffsets.append(offset)
+		self.Word |= (value & ((1 << self.ValueWidth)-1)) << self.Piece*self.ValueWidth
+		self.Piece += 1
+		if self.Piece * self.ValueWidth >= self.Width:
+			self.Words.append(self.Word)
+			self.Word = 0
+			self.Piece = 0
+
+
+class CadenceMifReader(MifReader):
+
+	# An optional address, optional data and an optional comment, or anything else on the line which is an error
+	RecordRegex = re.compile(r"[ \t]*(?:@([0-9A-Fa-f]+)[ \t]*)?([0-9A-Fa-f]+)?[ \t]*(?:(?://|;)[^\n]*)?\r?(?:\n|\Z)|([^\n]*)\n?")
+
+	def ReadRecords(self):
+		# The values are put together into words here instead of with AddValue, as there is a value on every line
+		piecesToJoin = self.Width / self.ValueWidth
+		mask = (1 << self.ValueWidth)-1
+		nextAddress = 0 # where a value without an address goes, the address after the previous value
+		word = 0
+		piece = 0
+		lineNumber = 0
+		for match in self.RecordRegex.finditer(self.Map):
+			lineNumber += 1
+			newAddress, data, error = match.groups()
+			if error is not None:
+				Common.Error(self.GetLine(lineNumber, match.start()), "Could not decode the address and data of: {}".format(error.strip()))
+			if newAddress is not None:
+				nextAddress = int(newAddress, 16) # An address with no value is the address of the value on a following line
+			if data is None:
+				continue
+			address = nextAddress
+			nextAddress += 1
+
+			if piece == 0:
+				self.Addresses.append(address)
+				self.LineNumbers.append(lineNumber)
+				self.LineOffsets.append(match.start())
+			word |= (int(data, 16) & mask) << piece*self.ValueWidth
+			piece += 1
+			if piece == piecesToJoin:
+				self.Words.append(word)
+				word = 0
+				piece = 0
+		self.Piece = piece
+
+
+class AlteraMifReader(MifReader):
+	"""
+	The values of an altera mif file are WIDTH bits wide, so a word is put together from Width/WIDTH values at
+	consecutive addresses. A range record ([start..end] : value;) is kept as a range instead of a value for every
+	address, so the fill of a stuffed image is never expanded. Ranges are not disassembled.
+	"""
+
+	Radixes = {"HEX" : 16, "DEC" : 10, "UNS" : 10, "OCT" : 8, "BIN" : 2}
+
+	# An address or a range and its values, or anything else on the line (a header, END or an error). Comments are
+	# either -- to the end of the line or between a pair of %
+	RecordRegex = re.compile(r"[ \t]*(?:(?:\[[ \t]*(\w+)[ \t]*\.\.[ \t]*(\w+)[ \t]*\]|(\w+))[ \t]*:[ \t]*([-\w \t]*?)[ \t]*;)?[ \t]*(?:%[^%\n]*%[ \t]*)*(?:--[^\n]*)?\r?(?:\n|\Z)|([^\n]*)\n?")
+
+	HeaderRegex = re.compile(r"(\w+)[ \t]*=[ \t]*(\w+)[ \t]*;")
+
+	def __init__(self, filePath, width, memoryWidth):
+		MifReader.__init__(self, filePath, width, memoryWidth)
+		self.ValueWidth = width
+		self.Depth = None
+		self.AddressRadix = 16
+		self.DataRadix = 16
+
+	@staticmethod
+	def RemoveComment(string):
+		string = re.sub(r"%[^%]*%", "", string)
+		if "--" in string:
+			string = string[:string.index("--")]
+		return string.strip()
+
+	def GetValue(self, string, radix, line):
+		try:
+			return int(string, radix)
+		except ValueError:
+			Common.Error(line, "Could not decode: {}".format(string))
+
+	def ReadHeader(self, text, line):
+		match = self.HeaderRegex.match(text)
+		if match is None:
+			Common.Error(line, "Could not decode the header: {}".format(text))
+		name, value = match.group(1).upper(), match.group(2).upper()
+		if name in ("ADDRESS_RADIX", "DATA_RADIX"):
+			if value not in self.Radixes:
+				Common.Error(line, "Unknown radix: {}".format(value))
+			setattr(self, "AddressRadix" if name == "ADDRESS_RADIX" else "DataRadix", self.Radixes[value])
+		elif name == "WIDTH":
+			self.ValueWidth = self.GetValue(value, 10, line)
+			if self.ValueWidth <= 0 or self.Width % self.ValueWidth:
+				Common.Error(line, "A word of {} bits cannot be made of {} bit values".format(self.Width, self.ValueWidth))
+		elif name == "DEPTH":
+			self.Depth = self.GetValue(value, 10, line)
+
+	def ReadRecords(self):
+		inContent = False
+		inComment = False
+		lineNumber = 0
+		for match in self.RecordRegex.finditer(self.Map):
+			lineNumber += 1
+			start, end, address, data, other = match.groups()
+			if other is not None:
+				text = other.strip()
+				if inComment:
+					inComment = text.count('%') % 2 == 0 # A comment that spans lines ends at the next %
+					continue
+				text = self.RemoveComment(text)
+				if text.startswith('%'):
+					inComment = True
+				elif not inContent:
+					if text.upper().startswith("CONTENT"):
+						inContent = True
+					elif text and text.upper() != "BEGIN":
+						self.ReadHeader(text, self.GetLine(lineNumber, match.start()))
+				elif text.upper().startswith("END"):
+					return
+				elif text and text.upper() != "BEGIN":
+					Common.Error(self.GetLine(lineNumber, match.start()), "Could not decode the address and data of: {}".format(text))
+				continue
+			if inComment:
+				continue
+			if data is None:
+				continue
+			if not inContent:
+				Common.Error(self.GetLine(lineNumber, match.start()), "Found data before CONTENT BEGIN")
+
+			values = data.split()
+			if not values:
+				Common.Error(self.GetLine(lineNumber, match.start()), "Missing the data of the address")
+			line = None
+			if start is not None:
+				line = self.GetLine(lineNumber, match.start())
+				first, last = self.GetValue(start, self.AddressRadix, line), self.GetValue(end, self.AddressRadix, line)
+				if len(values) != 1 or last < first:
+					Common.Error(line, "A range must have one value and end after it starts")
+				self.Ranges.append((first, last, self.GetValue(values[0], self.DataRadix, line), lineNumber, match.start()))
+				continue
+			try:
+				address = int(address, self.AddressRadix)
+				values = [int(value, self.DataRadix) for value in values]
+			except ValueError:
+				Common.Error(self.GetLine(lineNumber, match.start()), "Could not decode the address and data of: {}".format(match.group(0).strip()))
+			# Each value after the first goes to the address after the one before it
+			for value in values:
+				self.AddValue(address, value, lineNumber, match.start())
+				address += 1
+
+
 class Assembly(object):
 
 	CommentString = "//"
+	# A constant written as name = value is given an address by the allocator instead of at a fixed address
+	NameRegex = re.compile(r"[A-Za-z_]\w*$")
 	InterruptVectorTable = {}
 	AddressSpaceSize = None
 	VectorTableStartAddress = None
@@ -50,9 +295,10 @@ class Assembly(object):
 		self.DirectivesLines = []
 
 		self.Constants = OrderedDict()
+		self.Allocations = OrderedDict() # the value and line of each constant to allocate by its name
 		self.Directives = {}
 
-		self.Instructions = []
+		self.Instructions = InstructionTable.InstructionTable(self.Code)
 
 		Assembly.AddressSpaceSize = (2**addressWidth) - 1
 		Assembly.VectorTableStartAddress = Assembly.AddressSpaceSize - (2**3 - 1)
@@ -91,6 +337,10 @@ class Assembly(object):
 			split = [piece.strip() for piece in split]
 			if len(split) != 2:
 				Common.Error(constant, "Wrong syntax for constant")
+			elif self.NameRegex.match(split[0]) and split[0] not in self.Directives:
+				if split[0] in self.Allocations:
+					Common.Error(constant, "Found previous declaration of constant: %s on line %s" % (split[0], self.Allocations[split[0]][1].Number))
+				self.Allocations[split[0]] = (Common.ExprToHexString(self.ReplaceDirective(split[1]).strip(),constant), constant)
 			else:
 				tempAddress = self.ReplaceDirective(split[0]).strip()
 				tempConstant = self.ReplaceDirective(split[1]).strip()
@@ -107,24 +357,14 @@ class Assembly(object):
 				self.Directives[split[0]] = tempDirective.strip() if tempDirective.startswith('R') else "0x"+Common.ExprToHexString(tempDirective.strip(),directive)
 
 	def DecodeCode(self):
-		newCode = []
-		for line in self.Code:
-			for directive, value in self.Directives.iteritems():
-				extracted = [piece for piece in re.split("\[|\]| |,|\t|\+", line.String)] # Split the instruction by spaces, commas, and brackets
-				if directive in extracted:
-					line.String = line.String.replace(directive, value)
+		for index, line in enumerate(self.Code):
+			line.String = Lexer.SubstituteOperands(line.String, self.Directives)
 			if line.String.strip().endswith(':'):
 				Common.Error(line, "Label must be on the same line as an instruction")
-			self.Instructions.append(Instructions.DecodeLine(line))
-			newCode.append(line)
-		self.Code = newCode
+			self.Instructions.Append(Instructions.DecodeLine(line), index)
 
 	def ReplaceDirective(self, string):
-		for directive, value in self.Directives.iteritems():
-			extracted = [piece for piece in re.split("[^a-zA-Z0-9_]", string)] # Split the instruction by spaces, commas, and brackets
-			if directive in extracted:
-				string = string.replace(directive, value)
-		return string
+		return Lexer.Substitute(string, self.Directives)
 
 
 class Disassembly(object):
@@ -133,29 +373,16 @@ class Disassembly(object):
 		self.Width = width
 		self.MemoryWidth = memoryWidth
 		self.Debug = debug
-		self.Original = []
-		self.WithoutComments = []
-		self.Binary = []
-		self.Instructions = OrderedDict()
+		self.Image = None
+		self.Instructions = InstructionTable.InstructionTable()
 
+	@Profile.Stage("Encode")
 	def Encode(self):
-		for word in self.Binary:
-			instruction = Instructions.Encode(word)
-			self.Instructions[word.Address] = instruction
-
-	def MergeBinary(self):
-		piecesToJoin = self.Width / self.MemoryWidth
-		if piecesToJoin > 1:
-			newBinary = []
-			for i in range(0, len(self.Binary), piecesToJoin):
-				newData = 0
-				for j in range(0, piecesToJoin):
-					newData |= ((self.Binary[i+j].Data & (2**self.MemoryWidth-1)) << j*self.MemoryWidth)
-				bd = BinaryData(address=self.Binary[i].Address, data=newData)
-				bd.Line = self.Binary[i].Line
-				newBinary.append(bd)
-		self.Binary = newBinary
+		# The rows share the lines of the image, so each Line is only built while it is used
+		self.Instructions = InstructionTable.InstructionTable(lines=self.Image)
+		self.Instructions.AppendMachineCode(self.Image.Addresses, self.Image.Words)
 
+	@Profile.Stage("Disassembly.Write")
 	def Write(self, filePath, headers=[]):
 		with open(filePath, "w+") as _file:
 			_file.seek(0)
@@ -166,7 +393,10 @@ class Disassembly(object):
 			_file.write("\n")
 			_file.write(".code\n")
 
-			for address, instruction in self.Instructions.iteritems():
+			for row in xrange(0, len(self.Instructions)):
+				instruction = self.Instructions[row].Disassemble()
+				if instruction.NeedsLabelOperand:
+					instruction.FixupLabel(self.Instructions.LabelOperands[row])
 				line = "{:12}{:28}{} {}".format(instruction.Label+':' if instruction.Label else '',
 										 instruction.DisassembledString.lower(),
 										 Assembly.CommentString,
@@ -178,7 +408,14 @@ class Disassembly(object):
 
 class Parser(object):
 
-	def __init__(self, assemblyFilePath, width, addressWidth, memoryWidth, canInclude = False, label=None):
+	def __init__(self, assemblyFilePath, width, addressWidth, memoryWidth, canInclude = False, label=None, cache=None, jobs=None, optimize=False, eliminate=False):
+		"""
+		canInclude - if this is the top level file, which parses, places and assembles every included file
+		cache - an IncludeCache to load and save the decoded include files with, or None to always decode them
+		jobs - the number of processes to parse the included files with, None to use one for each cpu
+		optimize - if the peephole pass is run over the decoded instructions of every file
+		eliminate - if the instructions that cannot be reached are removed from every file, for the top level file
+		"""
 		self.AssemblyFilePath = assemblyFilePath
 		self.Assembly = Assembly(addressWidth)
 		self.Width = width
@@ -186,27 +423,44 @@ class Parser(object):
 		self.MemoryWidth = memoryWidth
 		self.CanInclude = canInclude
 		self.Label = label
-		self.LabelTable = {}
+		self.Cache = cache
+		self.Jobs = jobs if jobs is not None else multiprocessing.cpu_count()
+		self.Optimize = optimize
+		self.Peephole = None # the Peephole pass of this file, which counts what each rule removed
+		self.Eliminate = eliminate
+		self.Reachability = None # the Reachability pass of the last link, which counts what was removed from each file
+		self.Decoded = None # the instructions as they were decoded, before the unreachable ones are removed
+		self.DataMemory = None # the constants of every file in data memory, for the top level file
+		self.Profile = None # the stages recorded while parsing an included file, until they are added to the current Profile
+		self.Contents = ""
+		self.LabelTable = SymbolTable.SymbolTable()
+		self.ResolvedLabels = {} # the address of each label used by the instructions
+		self.AssembledLabels = None # the ResolvedLabels the instructions were last assembled with
 		self.IncludeFiles = []
 		self.IncludeParsers = []
+		self.SourcePaths = [] # the absolute path of this file and of every file found to be included, even if parsing them failed
 
+	@Profile.Stage("Assemble")
 	def Assemble(self):
-		for instruction in self.Assembly.Instructions:
-			instruction.Assemble()
-		for parser in self.IncludeParsers:
-			for instruction in parser.Assembly.Instructions:
-				instruction.Assemble()
+		# A file only needs to be assembled again if it was parsed again or one of its labels moved
+		for parser in [self] + self.IncludeParsers:
+			if parser.AssembledLabels != parser.ResolvedLabels:
+				parser.Assembly.Instructions.Assemble()
+				parser.AssembledLabels = parser.ResolvedLabels
 
+	@Profile.Stage("FileToLines")
 	def FileToLines(self, assemblyFilePath):
 		if os.path.isfile(assemblyFilePath):
 			with open(assemblyFilePath) as _file:
-				lineCount = 1
-				for line in _file:
-					self.Assembly.Original.append(Line(os.path.basename(assemblyFilePath), lineCount, line.strip()))
-					lineCount+=1
+				self.Contents = _file.read()
+			lineCount = 1
+			for line in self.Contents.splitlines():
+				self.Assembly.Original.append(Line(os.path.basename(assemblyFilePath), lineCount, line.strip()))
+				lineCount+=1
 		else: 
 			return []
 
+	@Profile.Stage("GetAssemblyData")
 	def GetAssemblyData(self):
 		lines = []
 		allParsers = []
@@ -216,32 +470,42 @@ class Parser(object):
 		for parser in allParsers:
 			if parser.Label != None and parser.Assembly.Instructions:
 				lines.append(Mif.MifLine(comment="----- %s -----" % parser.Label.String))
-			for instruction in parser.Assembly.Instructions:
-				data = int(instruction.MachineCode, 2)
-				comment = instruction.Line.String.strip().replace('\t',' ')
-				lines.append(Mif.MifLine(data=data, comment=comment, instruction=instruction))
+			instructions = parser.Assembly.Instructions
+			for row in xrange(0, len(instructions)):
+				comment = instructions.GetLine(row).String.strip().replace('\t',' ')
+				lines.append(Mif.MifLine(data=instructions.MachineCode[row], comment=comment))
 		return lines
 
+	def GetProgram(self):
+		"""
+		Returns the program as it is laid out in program memory: an InstructionTable decoded from the machine code of
+		this file and every included file, with the labels of every file, and (file name, first row, end row) of each file
+		"""
+		step = self.Width / self.MemoryWidth
+		lines = []
+		words = array('I')
+		labels = {}
+		modules = []
+		for parser in [self] + self.IncludeParsers:
+			instructions = parser.Assembly.Instructions
+			start = len(lines)
+			for row, label in instructions.Labels.iteritems():
+				labels[start+row] = label
+			lines += [instructions.GetLine(row) for row in xrange(0, len(instructions))]
+			words.extend(instructions.MachineCode)
+			modules.append((os.path.basename(parser.AssemblyFilePath), start, len(lines)))
+		program = InstructionTable.InstructionTable(lines=lines).AppendMachineCode(array('l', xrange(0, len(words)*step, step)), words)
+		program.Labels = labels
+		return program, modules
+
+	@Profile.Stage("GetConstantsData")
 	def GetConstantsData(self):
 		lines = []
-		addresses = {}
-		for address, data in self.Assembly.Constants.iteritems():
-			if address in addresses.keys():
-				if addresses[address] == data[0]:
-					continue
-				else:
-					Common.Error(data[1], "Duplicate constant found at address: 0x%s. Address already assigned to: 0x%s" % (address, addresses[address]))
-			lines.append(Mif.MifLine(data=int(data[0],16), address=int(address,16), comment="%s:%s" % (data[1].FileName, data[1].Number)))
-			addresses[address] = data[0]
-		for parser in self.IncludeParsers:
-			for address, data in parser.Assembly.Constants.iteritems():
-				if address in addresses.keys():
-					if addresses[address] == data[0]:
-						continue
-					else:
-						Common.Error(data[1], "Duplicate constant found at address: 0x%s. Address already assigned to: 0x%s" % (address, addresses[address]))
-				lines.append(Mif.MifLine(data=int(data[0],16), address=int(address,16), comment="%s:%s" % (data[1].FileName, data[1].Number)))
-				addresses[address] = data[0]
+		for address, value, line, names in self.DataMemory.Cells:
+			comment = "%s:%s" % (line.FileName, line.Number)
+			if names:
+				comment += " " + ", ".join(names)
+			lines.append(Mif.MifLine(data=int(value,16), address=address, comment=comment))
 		return lines
 
 	@staticmethod
@@ -252,19 +516,25 @@ class Parser(object):
 			lines.append(Mif.MifLine(address=Assembly.VectorTableStartAddress+num, data=dest, comment="ISR_%i" % num))
 		return lines
 
+	@Profile.Stage("MergeIncludes")
 	def MergeIncludes(self):
+		# The include parsers are already in their layout order, so the addresses do not depend on which worker finished first
+		startAddresses = {}
 		addressCounter = len(self.Assembly.Instructions) * (self.Width / self.MemoryWidth)
 		for parser in self.IncludeParsers:
-			label = parser.Label.String.split()[0]
-			if label in self.LabelTable.keys():
-				Common.Error(parser.Label, "Duplicate include label: %s" % parser.Label.String)
-			self.LabelTable[label] = addressCounter
+			startAddresses[parser.AssemblyFilePath] = addressCounter
 			addressCounter = parser.ResolveAddresses(startAddress=addressCounter)
-			parser.SetLabelAddresses()
 		self.ResolveAddresses()
-		self.SetLabelAddresses()
+
+		# The label of an include is defined in the file that included it
+		for parser in [self] + self.IncludeParsers:
+			for include, label, filePath in parser.GetIncludes():
+				parser.LabelTable.Define(label, startAddresses[filePath], include)
+		for parser in [self] + self.IncludeParsers:
+			parser.SetLabelAddresses()
 
 	@staticmethod
+	@Profile.Stage("RemoveComments")
 	def RemoveComments(contents):
 		pass1 =  [line for line in contents if not line.String.startswith(";") and not line.String.startswith("//")] # Removes all lines starting with semicolons
 		pass2 = []
@@ -277,6 +547,7 @@ class Parser(object):
 
 		return [line for line in pass2 if line.String != ""] # Remove empty lines
 
+	@Profile.Stage("Separate")
 	def Separate(self):
 		category = Common.Enum("Directives", "Constants", "Code", "Includes")
 		myCategory = None
@@ -289,8 +560,6 @@ class Parser(object):
 			elif line.String.strip() == ".code":
 				myCategory = category.Code
 			elif line.String.strip() == ".includes":
-				if not self.CanInclude:
-					Common.Error(line, "Cannot recursively include files")
 				myCategory = category.Includes
 			elif line.String.startswith('.end'):
 				myCategory = None
@@ -308,63 +577,280 @@ class Parser(object):
 					Common.Error(line, "Line \"%s\" belongs to unknown section" % line.String)
 
 	def Parse(self):
-		self.FileToLines(self.AssemblyFilePath)
-		self.Assembly.WithoutComments = Parser.RemoveComments(self.Assembly.Original)
-		self.Separate()
-		self.Assembly.Decode()
+		self.ParseFile()
 		if self.CanInclude:
 			self.ParseIncludes()
-			self.MergeIncludes()
-			self.Assemble()
+			self.Link()
 
-	def ParseIncludes(self):
+	def ParseFile(self):
+		self.AssembledLabels = None
+		self.FileToLines(self.AssemblyFilePath)
+		self.Assembly.WithoutComments = Parser.RemoveComments(self.Assembly.Original)
+		self.Separate()
+		self.Decode()
+
+	def Reparse(self, changedPaths):
+		"""
+		Parse the changed files again, keeping the decoded state of every other file, then link them all again
+		changedPaths - the absolute paths of the files that changed
+		"""
+		# The addresses of allocated constants can change with any file, so a file with any is always parsed again
+		reuse = dict((parser.AssemblyFilePath, parser) for parser in self.IncludeParsers
+					 if parser.AssemblyFilePath not in changedPaths and not parser.Assembly.Allocations)
+		if os.path.abspath(self.AssemblyFilePath) in changedPaths or self.Assembly.Allocations:
+			self.Assembly = Assembly(self.AddressWidth)
+			self.IncludeFiles = []
+			self.ParseFile()
+		self.ParseIncludes(reuse)
+		self.Link()
+
+	def Link(self):
+		"""
+		Place the included files after this file, then resolve the labels of and assemble every file
+		"""
+		Assembly.InterruptVectorTable = {}
+		self.LabelTable = SymbolTable.SymbolTable()
+		for parser in self.IncludeParsers:
+			parser.LabelTable = SymbolTable.SymbolTable(parent=self.LabelTable)
+		self.AllocateConstants()
+		if self.Eliminate:
+			self.Reachability = Reachability.Reachability().Eliminate([self] + self.IncludeParsers)
+		self.MergeIncludes()
+		self.Assemble()
+
+	def GetSourcePaths(self):
+		"""
+		Returns the absolute path of this file and of every file it includes, as far as the last parse found them
+		"""
+		return list(self.SourcePaths) or [os.path.abspath(self.AssemblyFilePath)]
+
+	@Profile.Stage("Decode")
+	def Decode(self):
+		self.Decoded = None
+		self.Assembly.DecodeDirectives()
+		self.Assembly.DecodeConstants()
+		# The code of a file with constants to allocate is decoded once they have addresses, by AllocateConstants
+		if not self.Assembly.Allocations:
+			self.DecodeCode()
+
+	@Profile.Stage("DecodeCode")
+	def DecodeCode(self):
+		# Only included files are cached, the top level file is expected to change on every run
+		if self.Cache is None or self.Label is None:
+			self.Assembly.DecodeCode()
+		else:
+			key = self.Cache.GetKey(self.AssemblyFilePath, self.Contents, self.Assembly.Directives, self.Width, self.AddressWidth, self.MemoryWidth)
+			entry = self.Cache.Get(key)
+			if entry is None:
+				self.Assembly.DecodeCode()
+				self.Cache.Put(key, self.Assembly.Instructions)
+			else:
+				# The labels are stored as rows in the table, they are relocated by ResolveAddresses
+				self.Assembly.Instructions = entry
+				self.Assembly.Code = self.Assembly.Instructions.Lines
+
+		# The cache holds the instructions as they were decoded, so they are optimized on every run
+		if self.Optimize:
+			self.Peephole = Peephole.Peephole()
+			self.Assembly.Instructions = self.Peephole.Optimize(self.Assembly.Instructions)
+		self.Decoded = self.Assembly.Instructions
+		self.AssembledLabels = None
+
+	@Profile.Stage("AllocateConstants")
+	def AllocateConstants(self):
+		"""
+		Place the constants of every file in data memory, it is an error for two of them to have the same address.
+		Each constant without an address is given a free cell below the interrupt vector table, where the constants with
+		the same value share a cell, and its name becomes a directive of its file for the code of the file to use.
+		A cell is a word of data memory, so it takes Width/MemoryWidth addresses.
+		"""
+		parsers = [self] + self.IncludeParsers
+		self.DataMemory = DataMemory.DataMemory(0, Assembly.VectorTableStartAddress, self.Width / self.MemoryWidth)
+		for parser in parsers:
+			for address, (value, line) in parser.Assembly.Constants.iteritems():
+				self.DataMemory.Add(int(address, 16), value, line)
+		for parser in parsers:
+			if parser.Decoded is not None:
+				continue
+			for name, (value, line) in parser.Assembly.Allocations.iteritems():
+				parser.Assembly.Directives[name] = "0x" + Common.NumToHexString(self.DataMemory.Allocate(name, value, line))
+			if parser.Cache is not None:
+				parser.Cache = self.Cache # so the hits and misses are counted with the rest
+			parser.DecodeCode()
+
+	def GetIncludes(self):
+		"""
+		Returns a tuple of (include line, label, absolute file path) for each file this file includes
+		"""
+		includes = []
+		directory = os.path.dirname(os.path.abspath(self.AssemblyFilePath))
 		for include in self.IncludeFiles:
 			split = include.String.split()
 			if len(split) != 3:
-				Common.Error(constant, "Wrong syntax for include")
-			filePath = os.path.abspath(split[2])
-			if not os.path.isfile(filePath):
-				Common.Error(include, "Cannot find file: %s" % filePath)
-			includeParser = Parser(filePath, self.AddressWidth, label=include)
-			includeParser.Parse()
-			self.IncludeParsers.append(includeParser)
+				Common.Error(include, "Wrong syntax for include")
+			# Included files are found relative to the file including them, then relative to the working directory
+			filePath = os.path.abspath(os.path.join(directory, split[2]))
+			if not os.path.isfile(filePath) and os.path.isfile(split[2]):
+				filePath = os.path.abspath(split[2])
+			includes.append((include, split[0], filePath))
+		return includes
+
+	@Profile.Stage("ParseIncludes")
+	def ParseIncludes(self, reuse=None):
+		"""
+		Parse every file included by this file or by another included file, one wave of the include graph at a time
+		Each file is only parsed once no matter how many files include it
+		reuse - the already parsed files that have not changed by their absolute path, these are not parsed again
+		"""
+		parsers = {}
+		waiting = [os.path.abspath(self.AssemblyFilePath)]
+		self.SourcePaths = waiting # so the files found are known even if one of them cannot be parsed
+		wave = [self]
+		while wave:
+			tasks = []
+			reused = []
+			for parser in wave:
+				for include, label, filePath in parser.GetIncludes():
+					if filePath in parsers or filePath in waiting:
+						continue
+					if reuse and filePath in reuse:
+						waiting.append(filePath)
+						reuse[filePath].Label = include
+						reused.append(reuse[filePath])
+						continue
+					if not os.path.isfile(filePath):
+						Common.Error(include, "Cannot find file: %s" % filePath)
+					waiting.append(filePath)
+					tasks.append((filePath, self.Width, self.AddressWidth, self.MemoryWidth, include, self.Cache.Directory if self.Cache else None, self.Optimize,
+								  Profile.Current is not None))
+
+			parallel = self.Jobs > 1 and len(tasks) > 1
+			if parallel:
+				pool = multiprocessing.Pool(min(self.Jobs, len(tasks)))
+				wave = pool.map(ParseInclude, tasks)
+				pool.close()
+				pool.join()
+			else:
+				wave = [ParseInclude(task) for task in tasks]
+
+			for parser in wave:
+				if not isinstance(parser, Parser):
+					raise Common.AssemblyError(parser) # The worker already printed the error
+				if self.Cache:
+					self.Cache.Hits += parser.Cache.Hits
+					self.Cache.Misses += parser.Cache.Misses
+				if parser.Profile is not None and Profile.Current is not None:
+					Profile.Current.Add(parser.Profile, inProcess=not parallel)
+					parser.Profile = None
+			wave += reused
+			for parser in wave:
+				parsers[parser.AssemblyFilePath] = parser
 
+		self.IncludeParsers = []
+		self.PlaceIncludes(self, parsers, [os.path.abspath(self.AssemblyFilePath)])
+
+	def PlaceIncludes(self, parser, parsers, visiting):
+		"""
+		Append the files included by the parser to IncludeParsers depth first in the order they are included
+		parser - the parser whose includes to place
+		parsers - the parser of every included file by its absolute path
+		visiting - the path of each file being placed from the top level file down to the parser
+		"""
+		for include, label, filePath in parser.GetIncludes():
+			if filePath in visiting:
+				cycle = visiting[visiting.index(filePath):] + [filePath]
+				Common.Error(include, "Circular include: %s" % " -> ".join(os.path.basename(path) for path in cycle))
+			if parsers[filePath] not in self.IncludeParsers:
+				self.IncludeParsers.append(parsers[filePath])
+				self.PlaceIncludes(parsers[filePath], parsers, visiting + [filePath])
+
+	@Profile.Stage("ResolveAddresses")
 	def ResolveAddresses(self, startAddress = 0):
-		addressCounter = startAddress
-		for instruction in self.Assembly.Instructions:
-			if instruction.Label != None:
-				if instruction.Label.startswith("ISR_"):
-					num = instruction.Label.replace("ISR_",'')
-					if not num.isdigit():
-						Common.Error(instruction.Line, "ISR must be followed by a number")
-					elif Assembly.VectorTableStartAddress+int(num) > Assembly.AddressSpaceSize:
-						Common.Error(instruction.Line, "ISR value is too large. Must not exceed: %s" % str(Assembly.AddressSpaceSize-Assembly.VectorTableStartAddress))
-					if int(num) in Assembly.InterruptVectorTable.keys():
-						Common.Error(instruction.Line, "Found previous declaration of ISR: %s" % instruction.Label)
-					Assembly.InterruptVectorTable[int(num)] = addressCounter
-				else:
-					if instruction.Label in self.LabelTable.keys():
-						Common.Error(instruction.Line, "Found previous declaration of label: %s" % instruction.Label)
-					self.LabelTable[instruction.Label] = addressCounter
-			addressCounter += self.Width / self.MemoryWidth
-		return addressCounter
+		instructions = self.Assembly.Instructions
+		step = self.Width / self.MemoryWidth
+		for row, label in sorted(instructions.Labels.iteritems()):
+			addressCounter = startAddress + row*step
+			if label.startswith("ISR_"):
+				num = label.replace("ISR_",'')
+				if not num.isdigit():
+					Common.Error(instructions.GetLine(row), "ISR must be followed by a number")
+				elif Assembly.VectorTableStartAddress+int(num) > Assembly.AddressSpaceSize:
+					Common.Error(instructions.GetLine(row), "ISR value is too large. Must not exceed: %s" % str(Assembly.AddressSpaceSize-Assembly.VectorTableStartAddress))
+				# There is one vector table, so every ISR is global
+				self.LabelTable.GetGlobal().Define(label, addressCounter, instructions.GetLine(row))
+				Assembly.InterruptVectorTable[int(num)] = addressCounter
+			else:
+				self.LabelTable.Define(label, addressCounter, instructions.GetLine(row))
+		return startAddress + len(instructions)*step
 
 	def SetLabelAddresses(self):
-		for instruction in self.Assembly.Instructions:
-			if instruction.NeedsLabelAddress:
-				if instruction.LabelOperand in self.LabelTable.keys():
-					instruction.Address = self.LabelTable[instruction.LabelOperand]
-				else:
-					Common.Error(instruction.Line, "Could not find destination label for: %s" % instruction.LabelOperand)
-		return self.Assembly.Instructions
+		instructions = self.Assembly.Instructions
+		self.ResolvedLabels = {}
+		for row, labelOperand in instructions.LabelOperands.iteritems():
+			address = self.LabelTable.Lookup(labelOperand)
+			if address is None:
+				Common.Error(instructions.GetLine(row), "Could not find destination label for: %s" % labelOperand)
+			instructions.Immediate[row] = self.ResolvedLabels[labelOperand] = address
+			instructions.HasImmediate[row] = 1
+		return instructions
+
+	def GetPeephole(self):
+		"""
+		Returns a Peephole with the counts of every file added together, or None if the files were not optimized
+		"""
+		if not self.Optimize:
+			return None
+		total = Peephole.Peephole()
+		for parser in [self] + self.IncludeParsers:
+			if parser.Peephole is not None:
+				total.Add(parser.Peephole)
+		return total
+
+	def WriteSymbols(self, filePath):
+		"""
+		Write the address of every label to a symbol map file
+		"""
+		SymbolTable.SymbolTable.Write(filePath, [self.LabelTable] + [parser.LabelTable for parser in self.IncludeParsers],
+									  headers=["Symbols for: %s" % self.AssemblyFilePath, "address scope name file:line"])
+
+
+def ParseInclude(task):
+	"""
+	Parse and decode a single included file, this is run by the worker processes
+	task - a tuple of (file path, width, address width, memory width, include line, cache directory, optimize, profile)
+	Returns the parser of the file, or the error message if it could not be parsed
+	"""
+	filePath, width, addressWidth, memoryWidth, include, cacheDirectory, optimize, profile = task
+	cache = IncludeCache.IncludeCache(cacheDirectory) if cacheDirectory else None
+	parser = Parser(filePath, width, addressWidth, memoryWidth, label=include, cache=cache, jobs=1, optimize=optimize)
+	# The stages of the file are recorded on their own and sent back with the parser, a worker process cannot add to the Profile of the parent
+	previous = Profile.Current
+	Profile.Current = parser.Profile = Profile.Profile() if profile else None
+	try:
+		parser.Parse()
+	except Common.AssemblyError as e:
+		sys.stdout.flush()
+		return e.Message
+	finally:
+		Profile.Current = previous
+
+	# Only the decoded file is needed, so leave the rest out of what is sent back
+	parser.Assembly.Original = []
+	parser.Assembly.WithoutComments = []
+	# The contents are part of the cache key of code that is decoded later, when the constants have addresses
+	if parser.Decoded is not None:
+		parser.Contents = ""
+	return parser
 
 
 class DisassemblyParser(object):
 
+	Readers = {"cadence" : CadenceMifReader, "altera" : AlteraMifReader}
+
 	def __init__(self, mifFilePath, mifFormat, width, memoryWidth, debug):
 		self.MifFilePath = mifFilePath
-		if mifFormat != "cadence":
-			Common.Error("Only the cadence mif format is currently supported")
+		if mifFormat not in self.Readers:
+			Common.Error("Cannot read the {} mif format".format(mifFormat))
 		self.MifFormat = mifFormat
 		self.Width = width
 		self.MemoryWidth = memoryWidth
@@ -373,63 +859,32 @@ class DisassemblyParser(object):
 		self.Disassembly = Disassembly(width=self.Width, memoryWidth=self.MemoryWidth, debug=self.Debug)
 
 	def Parse(self):
-		self.Disassembly.Original = self.FileToLines()
-		self.Disassembly.WithoutComments = Parser.RemoveComments(self.Disassembly.Original)
-		self.Disassembly.Binary = self.SplitToBinary(self.Disassembly.WithoutComments)
-		self.Disassembly.MergeBinary()
+		self.Disassembly.Image = self.Readers[self.MifFormat](self.MifFilePath, self.Width, self.MemoryWidth).Read()
 		self.Disassembly.Encode()
 		self.Disassemble()
 		return self.Disassembly
 
+	@Profile.Stage("Disassemble")
 	def Disassemble(self):
-		# Pass 1
-		for address, instruction in self.Disassembly.Instructions.iteritems():
-			instruction.Disassemble()
+		# The instructions are only rendered when written, this pass finds the labels from the columns of the table
+		instructions = self.Disassembly.Instructions
+		hasLabelOperand = dict((opCode, spec.Class.HasLabelOperand(opCode)) for opCode, spec in Instructions.OpCodeRegistry.iteritems())
+		labelCount = 0
+		for row in xrange(0, len(instructions)):
 			if (self.Debug):
-				print "@{:08} {:08X}".format(address, instruction.MachineCodeValue)
+				instruction = instructions[row].Disassemble()
+				print "@{:08} {:08X}".format(instruction.MachineCodeAddress, instruction.MachineCodeValue)
 				print instruction
 
-		# Pass 2 to handle labels
-		labelCount = 0
-		for address, instruction in self.Disassembly.Instructions.iteritems():
-			if instruction.NeedsLabelOperand:
-				if instruction.Address not in self.Disassembly.Instructions.keys():
-					print instruction
-					Common.Error(instruction.Line, "Cannot find instruction at destination address: 0x{:X}".format(instruction.Address))
-				destinationInstruction = self.Disassembly.Instructions[instruction.Address]
-				if not destinationInstruction.Label:
-					destinationInstruction.Label = "label_{}".format(labelCount)
+			if hasLabelOperand[instructions.OpCode[row]]:
+				destination = instructions.GetRow(instructions.Immediate[row])
+				if destination is None:
+					fill = self.Disassembly.Image.GetRange(instructions.Immediate[row])
+					if fill is not None:
+						first, last, value, lineNumber, offset = fill
+						Common.Error(instructions.GetLine(row), "The destination address 0x{:X} is in the range [{:X}..{:X}] on line {}, ranges are not disassembled".format(instructions.Immediate[row], first, last, lineNumber))
+					Common.Error(instructions.GetLine(row), "Cannot find instruction at destination address: 0x{:X}".format(instructions.Immediate[row]))
+				if destination not in instructions.Labels:
+					instructions.Labels[destination] = "label_{}".format(labelCount)
 					labelCount += 1
-				instruction.FixupLabel(destinationInstruction.Label)
-
-	def FileToLines(self):
-		lines = []
-		if os.path.isfile(self.MifFilePath):
-			with open(self.MifFilePath) as _file:
-				lineCount = 1
-				for line in _file:
-					lines.append(Line(os.path.basename(self.MifFilePath), lineCount, line.strip()))
-					lineCount+=1
-			return lines
-		else: 
-			return []
-
-	@staticmethod
-	def SplitToBinary(contents):
-		dataList = []
-		for line in contents:
-			split = line.String.split()
-			try:
-				address = int(split[0].strip('@'), 16)
-			except Exception as e:
-				Common.Error(line, "Could not decode address: {}".format(split[0]))
-
-			try:
-				data = int(split[1], 16)
-			except Exception as e:
-				Common.Error(line, "Could not decode data: {}".format(split[1]))
-
-			bd = BinaryData(address=address, data=data)
-			bd.Line = line
-			dataList.append(bd)
-		return dataList
+				instructions.LabelOperands[row] = instructions.Labels[destination]
@@ -0,0 +1,239 @@
+from collections import namedtuple, OrderedDict
+
+import InstructionBase
+import Instructions
+import Latency
+import Profile
+
+"""
+A peephole pass over the decoded instructions of a file, run before the labels are given addresses.
+Each rule looks at a window of consecutive instructions and returns what to replace them with, or None if the
+window does not match. A rule may only delete an instruction that sets the status bits if nothing can read those
+bits before they are set again, following the status register model of the simulator.
+
+A label on the first instruction of a window moves to the instruction that takes its place, the other instructions
+of a window can only be removed if they have no label, so every label still points at the same code.
+"""
+
+# Mnemonics are the mnemonics of the opcode of the first instruction of a window the rule can match
+Rule = namedtuple("Rule", ["Name", "Size", "Mnemonics", "Match"])
+
+OpCodes = dict((mnemonic, opCode) for opCode, mnemonic in InstructionBase.MnemonicList.iteritems())
+
+def GetMnemonic(instruction):
+	return InstructionBase.MnemonicList.get(instruction.OpCode)
+
+def IsConstantForm(instruction):
+	return bool(instruction.Control) and getattr(instruction, "Rk", None) is None
+
+def GetSources(instruction):
+	"""
+	Returns the registers an instruction reads
+	"""
+	mnemonic = GetMnemonic(instruction)
+	if isinstance(instruction, Instructions.LoadStore):
+		base = [instruction.Rj] if instruction.Rj else []
+		return base if mnemonic == "LD" else [instruction.Ri] + base
+	elif isinstance(instruction, Instructions.DataTransfer):
+		return [] if mnemonic == "POP" or instruction.Control else [instruction.Rj]
+	elif isinstance(instruction, (Instructions.LogicUnit, Instructions.Emulated, Instructions.RotateShift)):
+		if IsConstantForm(instruction):
+			return [] if mnemonic in ("NOT", "FTI", "ITF") else [instruction.Rj]
+		return [instruction.Rj] + ([instruction.Rk] if instruction.Rk is not None and mnemonic not in ("NOT", "FTI", "ITF") else [])
+	return []
+
+def GetDestination(instruction):
+	"""
+	Returns the register an instruction writes, or None
+	"""
+	mnemonic = GetMnemonic(instruction)
+	if mnemonic in ("LD", "CPY", "POP") or (isinstance(instruction, (Instructions.LogicUnit, Instructions.Emulated, Instructions.RotateShift)) and mnemonic != "CMP"):
+		return instruction.Ri
+	return None
+
+def IsStatusDead(instructions, start):
+	"""
+	Returns if the status bits can be changed before the instruction at start without changing what the program does,
+	that is if every path from there sets them again before reading them. Only the instructions up to the first jump are followed.
+	"""
+	for index in xrange(start, len(instructions)):
+		instruction = instructions[index]
+		if isinstance(instruction, (Instructions.FlowControl, Instructions.RotateShift)):
+			return False # A jump can go anywhere, and a rotate or shift can keep the carry
+		if 0 in GetSources(instruction):
+			return False
+		if isinstance(instruction, (Instructions.LogicUnit, Instructions.Emulated)) or GetDestination(instruction) == 0:
+			return True # Every ALU operation sets the C, N, V and Z bits, and GE and L are only set by CMP
+	return False
+
+def GetStep(instruction):
+	"""
+	Returns (register, amount) of an instruction that adds a constant to a register in place (such as INC and DEC), or None
+	"""
+	mnemonic = GetMnemonic(instruction)
+	if mnemonic in ("ADD", "SUB") and IsConstantForm(instruction) and instruction.Ri == instruction.Rj and instruction.Ri:
+		return instruction.Ri, instruction.Constant if mnemonic == "ADD" else -instruction.Constant
+	return None
+
+def IsClear(instruction):
+	# CLR is SUB Rx, Rx, Rx
+	return GetMnemonic(instruction) in ("SUB", "XOR") and not IsConstantForm(instruction) and instruction.Ri == instruction.Rj == instruction.Rk
+
+# The rules, each is given the window and the instructions after it and returns the instructions to replace the window with
+def CopyToItself(window, instructions, end):
+	instruction = window[0]
+	if instruction.Mnemonic == "CPY" and not instruction.Control and instruction.Ri == instruction.Rj:
+		return []
+	return None
+
+def StepBack(window, instructions, end):
+	first, second = GetStep(window[0]), GetStep(window[1])
+	if first and second and first[0] == second[0] and first[1] == -second[1] and IsStatusDead(instructions, end):
+		return []
+	return None
+
+def AddZero(window, instructions, end):
+	instruction = window[0]
+	if GetMnemonic(instruction) in ("ADD", "SUB", "OR", "XOR", "BIC") and IsConstantForm(instruction) and not instruction.Constant \
+			and instruction.Ri == instruction.Rj and instruction.Ri and IsStatusDead(instructions, end):
+		return []
+	return None
+
+def JumpToNext(window, instructions, end):
+	jump, following = window
+	if isinstance(jump, Instructions.FlowControl) and GetMnemonic(jump) == "JMP" and jump.NeedsLabelAddress and jump.LabelOperand == following.Label:
+		return [following]
+	return None
+
+def ClearThenOverwrite(window, instructions, end):
+	clear, write = window
+	# The register is written without being read, so clearing it first does nothing
+	if IsClear(clear) and clear.Ri and GetDestination(write) == clear.Ri and clear.Ri not in GetSources(write) \
+			and GetMnemonic(write) in ("CPY", "LD", "POP") and IsStatusDead(instructions, end):
+		return [write]
+	return None
+
+Rules = [	Rule("copy to itself", 1, ("CPY",), CopyToItself),
+			Rule("add then subtract", 2, ("ADD", "SUB"), StepBack),
+			Rule("add zero", 1, ("ADD", "SUB", "OR", "XOR", "BIC"), AddZero),
+			Rule("jump to next", 2, ("JMP",), JumpToNext),
+			Rule("clear then overwrite", 2, ("SUB", "XOR"), ClearThenOverwrite) ]
+
+class TableRows(object):
+	"""
+	The rows of a table as a list of instructions, the instruction of a row is only made when it is first used
+	"""
+
+	def __init__(self, table):
+		self.Table = table
+		self.Rows = range(len(table))
+		self.Views = {}
+
+	def __len__(self):
+		return len(self.Rows)
+
+	def __getitem__(self, index):
+		row = self.Rows[index]
+		if row not in self.Views:
+			self.Views[row] = self.Table[row]
+		return self.Views[row]
+
+	def GetOpCode(self, index):
+		return self.Table.OpCode[self.Rows[index]]
+
+class Peephole(object):
+
+	def __init__(self, rules=Rules, latencies=None):
+		"""
+		latencies - the latency table the saved cycles are counted with, None for Latency.DefaultLatencies
+		"""
+		self.Rules = rules
+		self.Latencies = latencies if latencies is not None else Latency.DefaultLatencies
+		# (times fired, words saved, cycles saved) of each rule
+		self.Counts = OrderedDict((rule.Name, [0, 0, 0]) for rule in rules)
+
+	def __str__(self):
+		lines = ["{:24} {:>6} {:>6} {:>7}".format("Peephole rule", "Fired", "Words", "Cycles")]
+		for name, (fired, words, cycles) in self.Counts.iteritems():
+			lines.append("{:24} {:>6} {:>6} {:>7}".format(name, fired, words, cycles))
+		return "\n".join(lines)
+
+	def Add(self, other):
+		for name, counts in other.Counts.iteritems():
+			self.Counts.setdefault(name, [0, 0, 0])
+			self.Counts[name] = [mine + theirs for mine, theirs in zip(self.Counts[name], counts)]
+		return self
+
+	def GetCycles(self, instruction):
+		return Latency.GetCycles(self.Latencies, instruction.OpCode, getattr(instruction, "Rj", 0), instruction.Control,
+									  getattr(instruction, "CNVZ", 0))[0]
+
+	@Profile.Stage("Peephole")
+	def Optimize(self, table):
+		"""
+		Returns a new table of the instructions of the table with every rule applied until none of them match,
+		or the table itself if no rule matched
+		"""
+		instructions = TableRows(table)
+		opCodes = [set(OpCodes[mnemonic] for mnemonic in rule.Mnemonics) for rule in self.Rules]
+		maxSize = max(rule.Size for rule in self.Rules)
+		changed = False
+		index = 0
+		while index < len(instructions):
+			opCode = instructions.GetOpCode(index)
+			for rule, ruleOpCodes in zip(self.Rules, opCodes):
+				end = index + rule.Size
+				if opCode not in ruleOpCodes or end > len(instructions):
+					continue
+				window = [instructions[i] for i in xrange(index, end)]
+				replacement = rule.Match(window, instructions, end)
+				if replacement is None or not self.MoveLabel(window, replacement, instructions, end):
+					continue
+
+				# The position in the window of each instruction that is kept
+				kept = [[instruction is replaced for instruction in window].index(True) for replaced in replacement]
+				removed = [instruction for i, instruction in enumerate(window) if i not in kept]
+				counts = self.Counts[rule.Name]
+				counts[0] += 1
+				counts[1] += len(window) - len(replacement)
+				counts[2] += sum(self.GetCycles(instruction) for instruction in removed)
+
+				instructions.Rows[index:end] = [instructions.Rows[index+i] for i in kept]
+				changed = True
+				# A change can complete a window that starts before it
+				index = max(index - (maxSize - 1), 0)
+				break
+			else:
+				index += 1
+
+		if not changed:
+			return table
+		optimized = table.Select(instructions.Rows)
+		# Only the labels can have been changed on the instructions that are kept
+		for i, row in enumerate(instructions.Rows):
+			if row in instructions.Views:
+				label = instructions.Views[row].Label
+				if label is None:
+					optimized.Labels.pop(i, None)
+				else:
+					optimized.Labels[i] = label
+		return optimized
+
+	@staticmethod
+	def MoveLabel(window, replacement, instructions, end):
+		"""
+		Move the label of a window to the instruction that takes its place
+		Returns False if the labels cannot be kept, then the window is left as it is
+		"""
+		first = window[0]
+		for instruction in window[1:]:
+			if instruction.Label is not None and not any(instruction is kept for kept in replacement):
+				return False
+		if first.Label is None or any(first is kept for kept in replacement):
+			return True
+		target = replacement[0] if replacement else (instructions[end] if end < len(instructions) else None)
+		if target is None or target.Label is not None:
+			return False
+		target.Label = first.Label
+		first.Label = None
+		return True
@@ -0,0 +1,158 @@
+import functools
+import gc
+import json
+import sys
+import time
+from collections import OrderedDict
+
+try:
+	import resource
+except ImportError:
+	resource = None # Windows, where the peak memory is not measured
+
+"""
+Times the stages of the assembler and the disassembler. A function is made a stage with the Stage decorator, and
+while a Profile is started each call of a stage records its wall time, how many more objects the garbage collector
+tracks after it than before it, and the peak memory of the process after it. With no Profile started a stage only
+costs a check of Current. A stage has a row for each stage it runs inside of, so the rows form the call tree and
+the time of a row is part of the time of the row above it. Counting the objects takes a while for a large heap, so the time it takes is left out of
+the time of the stage being counted, of every stage around it and of the total.
+
+Python 2 has no tracemalloc, so the peak memory is the peak resident set size of the process, which never goes down.
+The stage that raised it is the first one with a higher peak than the stages before it.
+"""
+
+Current = None # the Profile being recorded, None when profiling is off
+
+def Stage(name):
+	"""
+	Returns a decorator that records each call of a function as a run of the named stage
+	"""
+	def Decorator(function):
+		@functools.wraps(function)
+		def Wrapper(*args, **kwargs):
+			profile = Current
+			if profile is None:
+				return function(*args, **kwargs)
+			profile.Begin(name)
+			try:
+				return function(*args, **kwargs)
+			finally:
+				profile.End()
+		return Wrapper
+	return Decorator
+
+def Start():
+	global Current
+	Current = Profile()
+	return Current
+
+def Stop():
+	"""
+	Stop recording, returns the Profile that was recorded
+	"""
+	global Current
+	profile, Current = Current, None
+	profile.Elapsed = time.time() - profile.StartTime - profile.Overhead
+	return profile
+
+def GetPeakMemory():
+	"""
+	Returns the peak memory of the process in MB, or None if it cannot be measured
+	"""
+	if resource is None:
+		return None
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# Linux gives kilobytes, Mac OS gives bytes
+	return peak / (1024.0*1024.0 if sys.platform == "darwin" else 1024.0)
+
+class Profile(object):
+
+	def __init__(self):
+		# [calls, seconds, objects, peak MB, depth] of each stage by its path, the names of the stages it runs inside of
+		# followed by its own, in the order they were first run
+		self.Stages = OrderedDict()
+		self.Running = [] # (path, object count, start time, overhead at the start) of each stage being run, innermost last
+		self.Overhead = 0.0 # the seconds spent counting objects so far
+		self.StartTime = time.time()
+		self.Elapsed = None
+
+	def GetPath(self):
+		"""
+		Returns the path of the innermost stage being run, or an empty path if there is none
+		"""
+		return self.Running[-1][0] if self.Running else ()
+
+	def Begin(self, name):
+		path = self.GetPath() + (name,)
+		if path not in self.Stages:
+			self.Stages[path] = [0, 0.0, 0, None, len(self.Running)]
+		# Count the objects outside of the timed part
+		before = time.time()
+		objects = len(gc.get_objects())
+		start = time.time()
+		self.Overhead += start - before
+		self.Running.append((path, objects, start, self.Overhead))
+
+	def End(self):
+		end = time.time()
+		path, objects, start, overhead = self.Running.pop()
+		stage = self.Stages[path]
+		stage[0] += 1
+		# Leave out the time the stages run by this one spent counting objects
+		stage[1] += end - start - (self.Overhead - overhead)
+		stage[2] += len(gc.get_objects()) - objects
+		stage[3] = max(stage[3], GetPeakMemory())
+		self.Overhead += time.time() - end
+
+	def Add(self, other, inProcess=False):
+		"""
+		Add the stages recorded by another profile, such as by a worker process, below the innermost stage being run
+		The rows of worker processes that ran at the same time can add up to more than the time of the row above them
+		inProcess - if the other profile was recorded in this process while the stages being run were running, so the
+		time it spent counting objects is left out of them
+		"""
+		if inProcess:
+			self.Overhead += other.Overhead
+		parent = self.GetPath()
+		for path, (calls, seconds, objects, peak, depth) in other.Stages.iteritems():
+			path = parent + path
+			if path not in self.Stages:
+				self.Stages[path] = [0, 0.0, 0, None, len(parent) + depth]
+			stage = self.Stages[path]
+			stage[0] += calls
+			stage[1] += seconds
+			stage[2] += objects
+			stage[3] = max(stage[3], peak)
+		return self
+
+	def ToDict(self):
+		return {	"elapsed_ms" : round(self.Elapsed*1000, 3) if self.Elapsed is not None else None,
+					"peak_memory_mb" : GetPeakMemory(),
+					"stages" : [{"name" : path[-1], "path" : "/".join(path), "depth" : depth, "calls" : calls, "ms" : round(seconds*1000, 3), "objects" : objects, "peak_memory_mb" : peak}
+								for path, (calls, seconds, objects, peak, depth) in self.Stages.iteritems()] }
+
+	def WriteJson(self, filePath):
+		with open(filePath, "w") as _file:
+			json.dump(self.ToDict(), _file, indent=1, separators=(",", ": "), sort_keys=True)
+			_file.write("\n")
+
+	def __str__(self):
+		elapsed = self.Elapsed or sum(stage[1] for stage in self.Stages.itervalues() if stage[4] == 0) or 1
+		lines = ["{:28} {:>6} {:>10} {:>6} {:>10} {:>9}".format("Stage", "Calls", "Time (ms)", "%", "Objects", "Peak (MB)")]
+		for path, (calls, seconds, objects, peak, depth) in self.Stages.iteritems():
+			lines.append("{:28} {:>6} {:>10.3f} {:>6.1f} {:>10} {:>9}".format("  "*depth + path[-1], calls, seconds*1000, 100*seconds/elapsed, objects,
+																			  "-" if peak is None else "{:.1f}".format(peak)))
+		if self.Elapsed is not None:
+			lines.append("{:28} {:>6} {:>10.3f}".format("total", "", self.Elapsed*1000))
+		return "\n".join(lines)
+
+	def Report(self, filePath=None):
+		"""
+		Print the profile, or write it as JSON if a file is given
+		"""
+		if filePath:
+			self.WriteJson(filePath)
+			print "Wrote the profile to {}".format(filePath)
+		else:
+			print self
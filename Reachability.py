@@ -0,0 +1,106 @@
+import os
+
+import Common
+import ControlFlow
+import Profile
+
+"""
+Removes the code that can never run, before the labels are given addresses.
+The instructions are followed from the first instruction of the program and from every ISR, through the label of
+every jump and call and on to the next instruction after every instruction that does not end in an unconditional
+jump or a return. The next instruction after the last one of a file is the first one of the file placed after it.
+Every instruction that is not reached is removed, so an included file with none of its routines called is left empty.
+"""
+
+class Reachability(object):
+
+	def __init__(self):
+		# (file name, words kept, words removed) of each file in the order they are placed
+		self.Counts = []
+
+	def __str__(self):
+		lines = ["{:24} {:>6} {:>8}".format("Unreachable code", "Kept", "Removed")]
+		for name, kept, removed in self.Counts:
+			lines.append("{:24} {:>6} {:>8}{}".format(name, kept, removed, "  (not used)" if removed and not kept else ""))
+		lines.append("{:24} {:>6} {:>8}".format("total", sum(count[1] for count in self.Counts), sum(count[2] for count in self.Counts)))
+		return "\n".join(lines)
+
+	@staticmethod
+	def GetScopes(parsers, tables):
+		"""
+		Returns the labels each file can jump to as a dict of label to (file index, row) for each file,
+		the labels of the file and of the files it includes, then the labels of the top level file and every ISR
+		"""
+		indexes = dict((parser.AssemblyFilePath, index) for index, parser in enumerate(parsers))
+		scopes = []
+		for index, (parser, table) in enumerate(zip(parsers, tables)):
+			scope = dict((label, (index, row)) for row, label in table.Labels.iteritems() if not label.startswith("ISR_"))
+			for include, label, filePath in parser.GetIncludes():
+				scope[label] = (indexes[filePath], 0)
+			scopes.append(scope)
+		for index, table in enumerate(tables):
+			for row, label in table.Labels.iteritems():
+				if label.startswith("ISR_"):
+					scopes[0][label] = (index, row)
+		globalScope = scopes[0]
+		for scope in scopes[1:]:
+			for label, position in globalScope.iteritems():
+				scope.setdefault(label, position)
+		return scopes
+
+	@staticmethod
+	def GetPosition(tables, index, row):
+		"""
+		Returns (file index, row) of the instruction at a row or the first instruction after it, or None if there is none
+		"""
+		while index < len(tables) and row >= len(tables[index]):
+			index += 1
+			row = 0
+		return (index, row) if index < len(tables) else None
+
+	@Profile.Stage("Reachability")
+	def Eliminate(self, parsers):
+		"""
+		Remove every instruction that cannot be reached from the files
+		parsers - the parser of the top level file followed by the included files in the order they are placed
+		"""
+		tables = [parser.Decoded for parser in parsers]
+		scopes = self.GetScopes(parsers, tables)
+		# Every label must be found, even in code that is removed
+		for scope, table in zip(scopes, tables):
+			for row, labelOperand in table.LabelOperands.iteritems():
+				if labelOperand not in scope:
+					Common.Error(table.GetLine(row), "Could not find destination label for: %s" % labelOperand)
+
+		reached = [bytearray(len(table)) for table in tables]
+		stack = [(0, 0)] + [position for label, position in scopes[0].iteritems() if label.startswith("ISR_")]
+		while stack:
+			position = self.GetPosition(tables, *stack.pop())
+			if position is None:
+				continue
+			index, row = position
+			table, marks = tables[index], reached[index]
+			# Follow the instructions in order until one that cannot be followed by the next
+			while not marks[row]:
+				marks[row] = 1
+				opCode = table.OpCode[row]
+				if opCode == ControlFlow.ReturnOpCode:
+					break
+				elif opCode == ControlFlow.JumpOpCode or opCode == ControlFlow.CallOpCode:
+					stack.append(scopes[index][table.LabelOperands[row]])
+					if opCode == ControlFlow.JumpOpCode and not table.Condition[row]:
+						break
+				row += 1
+				if row == len(table):
+					stack.append((index+1, 0))
+					break
+
+		self.Counts = []
+		for parser, table, marks in zip(parsers, tables, reached):
+			rows = [row for row in xrange(0, len(table)) if marks[row]]
+			kept = table if len(rows) == len(table) else table.Select(rows)
+			if kept is not parser.Assembly.Instructions:
+				parser.Assembly.Instructions = kept
+				parser.AssembledLabels = None
+			self.Counts.append((os.path.basename(parser.AssemblyFilePath), len(rows), len(table) - len(rows)))
+		return self
@@ -0,0 +1,583 @@
+#!/usr/bin/env python
+
+import argparse
+import math
+import os
+import struct
+import time
+
+import Common
+import InstructionBase
+import Instructions
+import InstructionTable
+import Parser
+
+"""
+Title: Instruction set simulator for RISC_721
+Author: Connor Goldberg
+
+The program is decoded once into a dispatch table indexed by address, each entry is a handler function and its
+three operands, so running an instruction is a single lookup and call. The registers, data memory and stack are
+closed over by the handlers.
+
+The status register is R0:
+	bit 0 C - the carry out of an addition, set when a subtraction does not borrow, the last bit out of a shift
+	bit 1 N - bit 31 of the result
+	bit 2 V - signed overflow of an addition or subtraction
+	bit 3 Z - the result is 0
+	bit 4 GE - set by CMP when the first operand is greater than or equal to the second (signed)
+	bit 5 L - set by CMP when the first operand is less than the second (signed)
+	bits [13:6] - the enable bit of ISR0-7
+The logic, multiply, divide and floating point operations clear C and V. An instruction that writes its result to
+R0 does not also set the status bits, so BISC R0, R0, 1 (SETC) sets the carry. CALL and interrupts push the return
+address onto the same 16 deep stack as PUSH. Data memory holds a word at every address, as in the data memory file.
+"""
+
+Carry = 1 << 0
+Negative = 1 << 1
+Overflow = 1 << 2
+Zero = 1 << 3
+GreaterEqual = 1 << 4
+Less = 1 << 5
+StatusBits = Carry | Negative | Overflow | Zero
+CompareBits = StatusBits | GreaterEqual | Less
+StatusNames = ["C", "N", "V", "Z", "GE", "L"]
+ISREnableShift = 6
+ISRCount = 8
+
+# The number of registers copied to the shadow register file while in an ISR
+ShadowedRegisters = 24
+StackDepth = 16
+
+Mask = 0xFFFFFFFF
+
+# The status bit (or bits) each conditional jump tests and the value they must have to jump
+JumpTests = {	"JC"	: (Carry, Carry),
+				"JNC"	: (Carry, 0),
+				"JN"	: (Negative, Negative),
+				"JNN"	: (Negative, 0),
+				"JV"	: (Overflow, Overflow),
+				"JNV"	: (Overflow, 0),
+				"JEQ"	: (Zero, Zero),
+				"JNE"	: (Zero, 0),
+				"JGE"	: (GreaterEqual, GreaterEqual),
+				"JL"	: (Less, Less) }
+
+class SimulationError(Exception):
+	pass
+
+class Halt(Exception):
+	pass
+
+def Signed(value):
+	return value - (1 << 32) if value & 0x80000000 else value
+
+_FloatStruct = struct.Struct("<f")
+_WordStruct = struct.Struct("<I")
+
+def ToFloat(value):
+	return _FloatStruct.unpack(_WordStruct.pack(value))[0]
+
+def FromFloat(value):
+	try:
+		return _WordStruct.unpack(_FloatStruct.pack(value))[0]
+	except OverflowError:
+		# Too large for single precision
+		return _WordStruct.unpack(_FloatStruct.pack(math.copysign(float("inf"), value)))[0]
+
+# Each ALU operation returns (result, carry, overflow) of its two sources, the unary operations only use the second
+def Add(a, b):
+	total = a + b
+	result = total & Mask
+	return result, total >> 32, ((a ^ result) & (b ^ result)) >> 31
+
+def Subtract(a, b):
+	total = a + (~b & Mask) + 1
+	result = total & Mask
+	return result, total >> 32, ((a ^ b) & (a ^ result)) >> 31
+
+def Multiply(a, b):
+	return (a * b) & Mask, 0, 0
+
+def Divide(a, b):
+	if b == 0:
+		raise SimulationError("Division by zero")
+	quotient = abs(Signed(a)) // abs(Signed(b))
+	if (Signed(a) < 0) != (Signed(b) < 0):
+		quotient = -quotient
+	return quotient & Mask, 0, 0
+
+def FloatOperation(function):
+	def Operation(a, b):
+		a, b = ToFloat(a), ToFloat(b)
+		try:
+			result = function(a, b)
+		except ZeroDivisionError:
+			result = float("nan") if a == 0 or a != a else math.copysign(float("inf"), a) * math.copysign(1, b)
+		return FromFloat(result), 0, 0
+	return Operation
+
+def FloatToInt(a, b):
+	value = ToFloat(b)
+	if value != value:
+		return 0, 0, 0
+	return int(max(min(value, 2**31-1), -2**31)) & Mask, 0, 0
+
+def IntToFloat(a, b):
+	return FromFloat(float(Signed(b))), 0, 0
+
+Operations = {	"ADD"	: Add,
+				"SUB"	: Subtract,
+				"NOT"	: lambda a, b: (~b & Mask, 0, 0),
+				"AND"	: lambda a, b: (a & b, 0, 0),
+				"BIC"	: lambda a, b: (a & ~b & Mask, 0, 0),
+				"OR"	: lambda a, b: (a | b, 0, 0),
+				"XOR"	: lambda a, b: (a ^ b, 0, 0),
+				"FA"	: FloatOperation(lambda a, b: a + b),
+				"FS"	: FloatOperation(lambda a, b: a - b),
+				"FM"	: FloatOperation(lambda a, b: a * b),
+				"FD"	: FloatOperation(lambda a, b: a / b),
+				"FTI"	: FloatToInt,
+				"ITF"	: IntToFloat,
+				"MUL"	: Multiply,
+				"DIV"	: Divide }
+
+UnaryOperations = ("NOT", "FTI", "ITF")
+
+# Each shift returns (result, carry) of shifting the value by the count, the carry is unchanged by a count of 0
+def ShiftRightLogical(value, count, carry):
+	if count == 0:
+		return value, carry
+	return value >> count, (value >> (count-1)) & 1
+
+def ShiftLeftLogical(value, count, carry):
+	if count == 0:
+		return value, carry
+	return (value << count) & Mask, (value >> (32-count)) & 1 if count <= 32 else 0
+
+def ShiftRightArithmetic(value, count, carry):
+	if count == 0:
+		return value, carry
+	value = Signed(value)
+	return (value >> count) & Mask, (value >> (count-1)) & 1
+
+def RotateRight(value, count, carry):
+	count %= 32
+	if count == 0:
+		return value, carry
+	result = ((value >> count) | (value << (32-count))) & Mask
+	return result, result >> 31
+
+def RotateLeft(value, count, carry):
+	count %= 32
+	if count == 0:
+		return value, carry
+	result = ((value << count) | (value >> (32-count))) & Mask
+	return result, result & 1
+
+def RotateRightCarry(value, count, carry):
+	# The carry is the 33rd bit of the value being rotated
+	count %= 33
+	value |= carry << 32
+	value = ((value >> count) | (value << (33-count))) & (2**33-1)
+	return value & Mask, value >> 32
+
+def RotateLeftCarry(value, count, carry):
+	count %= 33
+	value |= carry << 32
+	value = ((value << count) | (value >> (33-count))) & (2**33-1)
+	return value & Mask, value >> 32
+
+Shifts = {	"SRL"	: ShiftRightLogical,
+			"SLL"	: ShiftLeftLogical,
+			"SRA"	: ShiftRightArithmetic,
+			"RTR"	: RotateRight,
+			"RTL"	: RotateLeft,
+			"RRC"	: RotateRightCarry,
+			"RLC"	: RotateLeftCarry }
+
+# The shift of each value of the condition field
+ShiftConditions = dict((condition, Shifts[mnemonic]) for mnemonic, condition in Instructions.RotateShift.Conditions.iteritems() if mnemonic in Shifts)
+
+def ParseInterrupt(string):
+	"""
+	Returns (step, ISR number) of an interrupt given as number@step, for the interrupt option
+	"""
+	try:
+		number, step = [int(part, 0) for part in string.split("@")]
+	except ValueError:
+		raise argparse.ArgumentTypeError("invalid interrupt: {} (expected number@step, e.g. 0@1000)".format(string))
+	if not 0 <= number < ISRCount:
+		raise argparse.ArgumentTypeError("invalid interrupt: {} (the ISR number must be 0-{})".format(string, ISRCount-1))
+	return (step, number)
+
+class Simulator(object):
+
+	def __init__(self, instructions, data, width=32, addressWidth=16, memoryWidth=8):
+		"""
+		instructions - an InstructionTable with the machine code address of every row
+		data - the initial data memory, a dict of the word at each address
+		"""
+		self.Instructions = instructions
+		self.Step = width / memoryWidth
+		self.AddressMask = (2**addressWidth) - 1
+		# Where Assembly puts the interrupt vector table
+		self.VectorTableStartAddress = self.AddressMask - (2**3 - 1)
+
+		self.Registers = [0] * 32
+		self.Memory = dict(data)
+		self.Stack = []
+		self.Shadow = None # the registers saved on entering an ISR, None when not in an ISR
+		self.PC = instructions.MachineCodeAddress[0] if len(instructions) else 0
+		self.Executed = 0
+
+		self.Code = []
+		self.Predecode()
+
+	def Predecode(self):
+		"""
+		Build the dispatch table of (handler, operand, operand, operand) for every address, the addresses without an
+		instruction hold a handler that stops the simulation
+		"""
+		regs = self.Registers
+		memory = self.Memory
+		stack = self.Stack
+		step = self.Step
+		addressMask = self.AddressMask
+
+		def Push(value):
+			if len(stack) == StackDepth:
+				raise SimulationError("Stack overflow, the stack is {} deep".format(StackDepth))
+			stack.append(value)
+
+		def Pop():
+			if not stack:
+				raise SimulationError("Stack underflow")
+			return stack.pop()
+
+		# Load/store, by whether Rj is used and the control bit
+		def LoadRegister(pc, i, j, address):
+			regs[i] = memory.get(regs[j] & addressMask, 0)
+			return pc + step
+		def LoadIndexed(pc, i, j, address):
+			regs[i] = memory.get((regs[j] + address) & addressMask, 0)
+			return pc + step
+		def LoadRelative(pc, i, j, address):
+			regs[i] = memory.get((pc + address) & addressMask, 0)
+			return pc + step
+		def LoadAbsolute(pc, i, j, address):
+			regs[i] = memory.get(address, 0)
+			return pc + step
+		def StoreRegister(pc, i, j, address):
+			memory[regs[j] & addressMask] = regs[i]
+			return pc + step
+		def StoreIndexed(pc, i, j, address):
+			memory[(regs[j] + address) & addressMask] = regs[i]
+			return pc + step
+		def StoreRelative(pc, i, j, address):
+			memory[(pc + address) & addressMask] = regs[i]
+			return pc + step
+		def StoreAbsolute(pc, i, j, address):
+			memory[address] = regs[i]
+			return pc + step
+		LoadStore = {	("LD", "register") : LoadRegister,
+						("LD", "indexed") : LoadIndexed,
+						("LD", "relative") : LoadRelative,
+						("LD", "absolute") : LoadAbsolute,
+						("ST", "register") : StoreRegister,
+						("ST", "indexed") : StoreIndexed,
+						("ST", "relative") : StoreRelative,
+						("ST", "absolute") : StoreAbsolute }
+
+		# Data transfer
+		def Copy(pc, i, j, constant):
+			regs[i] = regs[j]
+			return pc + step
+		def CopyConstant(pc, i, j, constant):
+			regs[i] = constant
+			return pc + step
+		def PushRegister(pc, i, j, constant):
+			Push(regs[j])
+			return pc + step
+		def PushConstant(pc, i, j, constant):
+			Push(constant)
+			return pc + step
+		def PopRegister(pc, i, j, constant):
+			regs[i] = Pop()
+			return pc + step
+
+		# Flow control
+		def Jump(pc, target, mask, value):
+			return target
+		def JumpIf(pc, target, mask, value):
+			return target if regs[0] & mask == value else pc + step
+		def Stop(pc, target, mask, value):
+			raise Halt("Halted on a jump to itself at 0x{:X}".format(pc))
+		def Call(pc, target, mask, value):
+			Push(pc + step)
+			return target
+		def Return(pc, a, b, c):
+			return Pop()
+		def ReturnFromInterrupt(pc, a, b, c):
+			if self.Shadow is None:
+				raise SimulationError("RETI outside of an interrupt service routine")
+			regs[0:ShadowedRegisters] = self.Shadow
+			self.Shadow = None
+			return Pop()
+
+		# ALU operations, with the second source from a register or a constant
+		def MakeOperation(operation):
+			def Register(pc, i, j, k):
+				result, carry, overflow = operation(regs[j], regs[k])
+				if i:
+					regs[i] = result
+					regs[0] = (regs[0] & ~StatusBits) | carry | (result >> 31) << 1 | overflow << 2 | (result == 0) << 3
+				else:
+					regs[0] = result
+				return pc + step
+			def Constant(pc, i, j, constant):
+				result, carry, overflow = operation(regs[j], constant)
+				if i:
+					regs[i] = result
+					regs[0] = (regs[0] & ~StatusBits) | carry | (result >> 31) << 1 | overflow << 2 | (result == 0) << 3
+				else:
+					regs[0] = result
+				return pc + step
+			return Register, Constant
+		def SetCompare(a, b):
+			result, carry, overflow = Subtract(a, b)
+			lessThan = Signed(a) < Signed(b)
+			regs[0] = (regs[0] & ~CompareBits) | carry | (result >> 31) << 1 | overflow << 2 | (result == 0) << 3 | (Less if lessThan else GreaterEqual)
+		def Compare(pc, i, j, k):
+			SetCompare(regs[j], regs[k])
+			return pc + step
+		def CompareConstant(pc, i, j, constant):
+			SetCompare(regs[j], constant)
+			return pc + step
+		OperationHandlers = dict((mnemonic, MakeOperation(operation)) for mnemonic, operation in Operations.iteritems())
+		OperationHandlers["CMP"] = (Compare, CompareConstant)
+
+		# Rotate/shift, by a register or a constant
+		def MakeShift(shift):
+			def Register(pc, i, j, k):
+				result, carry = shift(regs[j], regs[k] & 0x3F, regs[0] & Carry)
+				if i:
+					regs[i] = result
+					regs[0] = (regs[0] & ~StatusBits) | carry | (result >> 31) << 1 | (result == 0) << 3
+				else:
+					regs[0] = result
+				return pc + step
+			def Constant(pc, i, j, count):
+				result, carry = shift(regs[j], count, regs[0] & Carry)
+				if i:
+					regs[i] = result
+					regs[0] = (regs[0] & ~StatusBits) | carry | (result >> 31) << 1 | (result == 0) << 3
+				else:
+					regs[0] = result
+				return pc + step
+			return Register, Constant
+		ShiftHandlers = dict((condition, MakeShift(shift)) for condition, shift in ShiftConditions.iteritems())
+
+		def Invalid(pc, message, b, c):
+			raise SimulationError(message)
+		def Missing(pc, a, b, c):
+			raise Halt("No instruction at 0x{:X}".format(pc))
+
+		instructions = self.Instructions
+		addresses = instructions.MachineCodeAddress
+		missing = (Missing, 0, 0, 0)
+		self.Code = code = [missing] * ((max(addresses) + 1) if len(addresses) else 0)
+		for row in xrange(0, len(instructions)):
+			opCode = instructions.OpCode[row]
+			mnemonic = InstructionBase.MnemonicList.get(opCode)
+			ri, rj, rk = instructions.Ri[row], instructions.Rj[row], instructions.Rk[row]
+			control, condition, immediate = instructions.Control[row], instructions.Condition[row], instructions.Immediate[row]
+			address = addresses[row]
+
+			if mnemonic in ("LD", "ST"):
+				entry = (LoadStore[(mnemonic, Instructions.LoadStore.GetAddressingMode(rj, control))], ri, rj, immediate)
+			elif mnemonic == "CPY":
+				entry = (CopyConstant if control else Copy, ri, rj, immediate)
+			elif mnemonic == "PUSH":
+				entry = (PushConstant if control else PushRegister, ri, rj, immediate)
+			elif mnemonic == "POP":
+				entry = (PopRegister, ri, rj, immediate)
+			elif mnemonic == "JMP":
+				jump = Instructions.FlowControl.JumpConditionsMnemonic.get(condition)
+				if jump is None:
+					entry = (Invalid, "Unknown jump condition: 0x{:X}".format(condition), 0, 0)
+				elif jump == "JMP":
+					entry = (Stop if immediate == address else Jump, immediate, 0, 0)
+				else:
+					entry = (JumpIf, immediate) + JumpTests[jump]
+			elif mnemonic == "CALL":
+				entry = (Call, immediate, 0, 0)
+			elif mnemonic == "RET":
+				entry = (ReturnFromInterrupt if control else Return, 0, 0, 0)
+			elif mnemonic in OperationHandlers:
+				register, constant = OperationHandlers[mnemonic]
+				if control:
+					entry = (constant, ri, rj, immediate)
+				elif mnemonic in UnaryOperations:
+					entry = (register, ri, 0, rj) # The source is in Rj
+				else:
+					entry = (register, ri, rj, rk)
+			elif mnemonic == "RS" and condition in ShiftHandlers:
+				register, constant = ShiftHandlers[condition]
+				entry = (constant, ri, rj, immediate) if control else (register, ri, rj, rk)
+			else:
+				entry = (Invalid, "Cannot simulate opcode 0x{:X} with condition {}".format(opCode, condition), 0, 0)
+			code[address] = entry
+
+	def GetLine(self, address):
+		row = self.Instructions.GetRow(address)
+		return self.Instructions.GetLine(row) if row is not None else None
+
+	def Interrupt(self, number):
+		"""
+		Enter an ISR if it is enabled and no other ISR is running
+		Returns True if the ISR was entered
+		"""
+		regs = self.Registers
+		if self.Shadow is not None or not regs[0] & (1 << (ISREnableShift + number)):
+			return False
+		vector = self.Memory.get(self.VectorTableStartAddress + number)
+		if vector is None:
+			Common.Error("ISR_{} is enabled but has no interrupt vector".format(number))
+		if len(self.Stack) == StackDepth:
+			Common.Error(self.GetLine(self.PC), "Stack overflow entering ISR_{}, the stack is {} deep".format(number, StackDepth))
+		self.Shadow = regs[0:ShadowedRegisters]
+		self.Stack.append(self.PC)
+		self.PC = vector
+		return True
+
+	def Run(self, steps, interrupts=[]):
+		"""
+		Run until the step limit, a jump to itself or an address without an instruction
+		interrupts - (step, ISR number) of each interrupt to raise, before the instruction of that step runs
+		Returns the reason the simulation stopped, or None if it reached the step limit
+		"""
+		interrupts = sorted(interrupts)
+		stopped = None
+		for interruptStep, number in interrupts + [(steps, None)]:
+			interruptStep = min(interruptStep, steps)
+			if interruptStep > self.Executed:
+				stopped = self.Execute(interruptStep - self.Executed)
+				if stopped is not None:
+					break
+			if number is not None and not self.Interrupt(number):
+				print "ISR_{} was not entered at step {}, it is not enabled or another ISR is running".format(number, interruptStep)
+		return stopped
+
+	def Execute(self, steps):
+		"""
+		The dispatch loop, run at most steps instructions
+		"""
+		code = self.Code
+		pc = self.PC
+		executed = 0
+		stopped = None
+		try:
+			for executed in xrange(0, steps):
+				handler, a, b, c = code[pc]
+				pc = handler(pc, a, b, c)
+			executed = steps
+		except IndexError:
+			stopped = "No instruction at 0x{:X}".format(pc)
+		except Halt as e:
+			stopped = str(e)
+		except SimulationError as e:
+			self.PC = pc
+			self.Executed += executed
+			Common.Error(self.GetLine(pc), "{} at 0x{:X}".format(e, pc))
+		self.PC = pc
+		self.Executed += executed
+		return stopped
+
+	def DumpRegisters(self):
+		regs = self.Registers
+		status = [name for bit, name in enumerate(StatusNames) if regs[0] & (1 << bit)]
+		enabled = ["ISR{}".format(number) for number in range(0, ISRCount) if regs[0] & (1 << (ISREnableShift + number))]
+		lines = ["PC = 0x{:04X}  SR = 0x{:08X} [{}] enabled: {}".format(self.PC, regs[0], " ".join(status), " ".join(enabled) or "none")]
+		for first in range(0, 32, 4):
+			lines.append("  ".join("R{:<2} = 0x{:08X}".format(number, regs[number]) for number in range(first, first+4)))
+		lines.append("Stack ({} of {}): {}".format(len(self.Stack), StackDepth, " ".join("0x{:X}".format(value) for value in reversed(self.Stack)) or "empty"))
+		if self.Shadow is not None:
+			lines.append("In an ISR")
+		return "\n".join(lines)
+
+def LoadAssembly(assemblyFile, args):
+	"""
+	Assemble a file in memory
+	Returns the InstructionTable of the program and the data memory
+	"""
+	myParser = Parser.Parser(assemblyFile, width=args["width"], addressWidth=args["address_width"], memoryWidth=args["memory_width"], canInclude=True, jobs=args["jobs"], optimize=args["optimize"])
+	myParser.Parse()
+
+	data = {}
+	for line in Parser.Parser.GetInterruptVectorTable() + myParser.GetConstantsData():
+		data[line.Address] = int(line.Data, 16) if isinstance(line.Data, basestring) else line.Data
+	return myParser.GetProgram()[0], data
+
+def LoadMif(mifFile, dataFile, args):
+	"""
+	Read an assembled program memory file and its data memory file, if there is one
+	Returns the InstructionTable of the program and the data memory
+	"""
+	reader = Parser.DisassemblyParser.Readers[args["format"]]
+	image = reader(mifFile, args["width"], args["memory_width"]).Read()
+	instructions = InstructionTable.InstructionTable(lines=image).AppendMachineCode(image.Addresses, image.Words)
+
+	data = {}
+	if dataFile is not None:
+		dataImage = reader(dataFile, args["width"], args["memory_width"]).Read()
+		data = dict(zip(dataImage.Addresses, dataImage.Words))
+	return instructions, data
+
+def main(args):
+
+	program = args["program"]
+	if program.endswith(".asm"):
+		instructions, data = LoadAssembly(program, args)
+	else:
+		dataFile = args["data"]
+		if dataFile is None:
+			# The assembler writes the data memory file next to the program memory file
+			dataFile = "{}_dm{}".format(*os.path.splitext(program))
+			if not os.path.isfile(dataFile):
+				dataFile = None
+		instructions, data = LoadMif(program, dataFile, args)
+	if not len(instructions):
+		Common.Error("There are no instructions to simulate in: {}".format(program))
+
+	start = time.time()
+	simulator = Simulator(instructions, data, width=args["width"], addressWidth=args["address_width"], memoryWidth=args["memory_width"])
+	predecoded = time.time() - start
+
+	start = time.time()
+	stopped = simulator.Run(args["steps"], args["interrupt"] or [])
+	elapsed = time.time() - start
+
+	print stopped or "Reached the step limit of {}".format(args["steps"])
+	print "Ran {} instructions in {} ms ({} instructions/s), predecoded {} instructions in {} ms".format(simulator.Executed, round(elapsed*1000, 3), int(simulator.Executed/elapsed) if elapsed else 0,
+																								 len(instructions), round(predecoded*1000, 3))
+	if args["registers"]:
+		print simulator.DumpRegisters()
+
+if __name__ == "__main__":
+
+	parser = argparse.ArgumentParser(description="Instruction set simulator for RISC_721 by Connor Goldberg")
+	parser.add_argument("program", help="The assembly file (.asm) or program memory file to run")
+	parser.add_argument("-d", "--data", metavar="data-file", type=str, help="The data memory file of a program memory file (default = the _dm file next to it, if there is one)")
+	parser.add_argument("-n", "--steps", metavar="steps", type=int, help="The most instructions to run (default = 1000000)", default=1000000)
+	parser.add_argument("-i", "--interrupt", metavar="isr@step", type=ParseInterrupt, action="append", help="Raise an interrupt before the instruction of a step runs, e.g. 0@1000, can be given more than once")
+	parser.add_argument("-r", "--registers", action="store_true", help="Print the registers and the stack when the simulation stops")
+	parser.add_argument("-O", "--optimize", action="store_true", help="Run the peephole pass over an assembly file")
+	parser.add_argument("-a", "--address_width", metavar="address-width", type=int, help="The width of the address bus", default=16)
+	parser.add_argument("-m", "--memory_width", metavar="memory-width", type=int, help="The width of a word in memory in bits (default = 8)", default=8)
+	parser.add_argument("-w", "--width", metavar="width", type=int, help="The width of instruction words in bits (default = 32)", default=32)
+	parser.add_argument("-f", "--format", metavar="format", type=str, help="The format of a program memory file", choices=["altera","cadence"], default="cadence")
+	parser.add_argument("-j", "--jobs", metavar="jobs", type=int, help="The number of processes to parse included files with (default = one for each cpu)")
+
+	args = vars(parser.parse_args())
+	main(args)
@@ -0,0 +1,71 @@
+from collections import namedtuple
+
+import Common
+
+"""
+Holds the labels of a file. Each included file has its own table whose parent is the table of the top level
+file, so the labels of the top level file are global: they can be used by every file unless the file has a
+label of the same name. The labels of an included file are local to it.
+"""
+
+Symbol = namedtuple("Symbol", ["Name", "Address", "Line"])
+
+class SymbolTable(object):
+
+	def __init__(self, parent=None):
+		"""
+		parent - the table to look in for the labels that are not defined in this table, None for the global table
+		"""
+		self.Parent = parent
+		self.Symbols = {}
+
+	def __contains__(self, name):
+		return name in self.Symbols
+
+	def __len__(self):
+		return len(self.Symbols)
+
+	def __iter__(self):
+		return self.Symbols.itervalues()
+
+	def Define(self, name, address, line):
+		"""
+		Add a label, it is an error if the label is already in this table
+		line - the line that the label is defined on
+		"""
+		previous = self.Symbols.get(name)
+		if previous is not None:
+			Common.Error(line, "Found previous declaration of label: %s in %s on line %s" % (name, previous.Line.FileName, previous.Line.Number))
+		self.Symbols[name] = Symbol(name, address, line)
+
+	def Lookup(self, name):
+		"""
+		Returns the address of a label in this table or a parent table, or None if it is not found
+		"""
+		symbol = self.Symbols.get(name)
+		if symbol is not None:
+			return symbol.Address
+		elif self.Parent is not None:
+			return self.Parent.Lookup(name)
+		return None
+
+	def GetGlobal(self):
+		return self if self.Parent is None else self.Parent.GetGlobal()
+
+	@staticmethod
+	def Write(filePath, tables, headers=[]):
+		"""
+		Write a symbol map with a line for each label sorted by address: address, scope, name and file:line
+		tables - the global table followed by the table of each included file
+		"""
+		symbols = []
+		for table in tables:
+			scope = "global" if table.Parent is None else "local"
+			symbols += [(symbol.Address, symbol.Name, scope, symbol.Line) for symbol in table]
+		symbols.sort(key=lambda symbol: symbol[:3])
+
+		with open(filePath, "w") as _file:
+			for line in headers:
+				_file.write("// {}\n".format(line))
+			for address, name, scope, line in symbols:
+				_file.write("{:08X} {:6} {} {}:{}\n".format(address, scope, name, line.FileName, line.Number))